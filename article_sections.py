@@ -0,0 +1,159 @@
+"""
+Section index for article extracts.
+
+A full extract is HTML with <h2>-<h6> headings (entries cached before
+extracts were requested as HTML are plain text with "== Heading =="
+lines; both are understood, and plain text is rendered as paragraphs
+of escaped text). It is parsed once, when
+the article is fetched, into a flat index stored with the article: one
+entry per heading (the lead first, without one) with its level, anchor,
+character offsets into the extract and word count. The article page
+renders the lead and the first sections inline and only a placeholder
+(the heading) for each later part; the browser fetches a part's body from
+/api/article/<title>/sections/<n> when it scrolls into view.
+
+A part is a section together with its subsections, i.e. everything up to
+the next heading of the same or a higher level.
+"""
+import re
+import html
+
+from prompt_context import TAG_RE, HEADING_RE as WIKI_HEADING_RE
+
+HEADING_RE = re.compile(r"<h([2-6])\b[^>]*>(.*?)</h\1\s*>", re.S | re.I)
+ID_RE = re.compile(r'\bid="([^"]+)"')
+INNER_ID_RE = re.compile(r'\s+id="[^"]*"')
+SLUG_RE = re.compile(r"[^\w.-]+")
+
+
+def _words(fragment):
+    return len(html.unescape(TAG_RE.sub(" ", fragment)).split())
+
+
+def _is_plain(content):
+    return not TAG_RE.search(content)
+
+
+def _heading_re(content):
+    return WIKI_HEADING_RE if _is_plain(content) else HEADING_RE
+
+
+def _level(match):
+    # <hN>: group 1 is N; "== x ==": group 1 is the run of "="
+    return len(match.group(1)) if match.group(1).startswith("=") else int(match.group(1))
+
+
+def index_sections(content):
+    """[{index, heading, level, anchor, start, end, words}] for an HTML or plain-text extract"""
+    content = content or ""
+    sections = [{"index": 0, "heading": "", "level": 1, "anchor": "lead", "start": 0}]
+    seen = {"lead"}
+    plain = _is_plain(content)
+    for match in _heading_re(content).finditer(content):
+        heading = match.group(2).strip() if plain else html.unescape(TAG_RE.sub("", match.group(2))).strip()
+        if not heading:
+            continue
+        found = None if plain else ID_RE.search(match.group(0))
+        anchor = found.group(1) if found else SLUG_RE.sub("_", heading).strip("_") or "section"
+        base, n = anchor, 2
+        while anchor in seen:            # repeated headings ("Career" under two people)
+            anchor, n = f"{base}_{n}", n + 1
+        seen.add(anchor)
+        sections.append({
+            "index": len(sections), "heading": heading, "level": _level(match),
+            "anchor": anchor, "start": match.start(),
+        })
+    for section, following in zip(sections, sections[1:] + [None]):
+        section["end"] = following["start"] if following else len(content)
+        fragment = content[section["start"]:section["end"]]
+        if plain:
+            fragment = WIKI_HEADING_RE.sub(lambda m: m.group(2), fragment)
+        section["words"] = _words(fragment)
+    return sections
+
+
+def sections_of(article):
+    """The article's stored index (built here for entries cached before it was stored)"""
+    return article.get("sections") or index_sections(article.get("content"))
+
+
+def part_end(sections, index):
+    """Index one past the last subsection of the part starting at `index`"""
+    if index == 0:
+        return 1                         # the lead is a part of its own
+    level = sections[index]["level"]
+    for following in sections[index + 1:]:
+        if following["level"] <= level:
+            return following["index"]
+    return len(sections)
+
+
+def _heading_with_anchor(content, section):
+    """The section's heading tag, with its anchor as the (only) id"""
+    match = _heading_re(content).match(content, section["start"])
+    level = _level(match)
+    inner = html.escape(section["heading"]) if _is_plain(content) else INNER_ID_RE.sub("", match.group(2))
+    return match.end(), f'<h{level} id="{html.escape(section["anchor"])}">{inner}</h{level}>'
+
+
+def _plain_to_html(text):
+    """A plain-text extract as <p> elements, one per line (extracts put a paragraph on each)"""
+    paragraphs = [" ".join(line.split()) for line in text.splitlines()]
+    return "\n".join(f"<p>{html.escape(paragraph, quote=False)}</p>" for paragraph in paragraphs if paragraph)
+
+
+def part_html(content, sections, index, with_heading=False):
+    """HTML of the part starting at sections[index]; subsection headings get their anchors as ids"""
+    plain = _is_plain(content)
+    out = []
+    for section in sections[index:part_end(sections, index)]:
+        body = section["start"]
+        if section["index"]:
+            body, heading = _heading_with_anchor(content, section)
+            if section["index"] != index or with_heading:
+                out.append(heading)
+        text = content[body:section["end"]]
+        out.append(_plain_to_html(text) if plain else text)
+    return "".join(out).strip()
+
+
+def toc(sections):
+    """Table of contents: every heading with the part that holds it"""
+    entries = []
+    part = None
+    for section in sections[1:]:
+        if part is None or section["index"] >= part_end(sections, part):
+            part = section["index"]
+        entries.append({
+            "index": section["index"], "part": part, "heading": section["heading"],
+            "level": section["level"], "anchor": section["anchor"], "words": section["words"],
+        })
+    return entries
+
+
+def page_layout(article, inline_words):
+    """
+    What the article page renders: the lead and whole parts until
+    `inline_words` words are on the page as HTML, then one placeholder per
+    remaining part ({index, heading, level, anchor, words}).
+    """
+    content = article.get("content") or ""
+    sections = sections_of(article)
+    inline = [part_html(content, sections, 0)]
+    words = sections[0]["words"]
+    placeholders = []
+    index = 1
+    while index < len(sections):
+        end = part_end(sections, index)
+        part_words = sum(s["words"] for s in sections[index:end])
+        if placeholders or words + part_words > inline_words:
+            section = sections[index]
+            placeholders.append({
+                "index": index, "heading": section["heading"], "level": section["level"],
+                "anchor": section["anchor"], "words": part_words,
+            })
+        else:
+            inline.append(part_html(content, sections, index, with_heading=True))
+            words += part_words
+        index = end
+    return {"html": "\n".join(inline), "placeholders": placeholders, "toc": toc(sections)}
@@ -0,0 +1,355 @@
+"""
+ASGI entry point: uvicorn asgi:app --workers 2
+
+The upstream-bound API routes (OpenAI generation and the Wikipedia article
+feed) are served natively async, so a worker can keep hundreds of slow
+upstream calls in flight. Every other route is handed to the regular Flask
+app, which keeps running unchanged under gunicorn via app:app; here each of
+those requests runs on a thread of a WSGI_THREADS pool.
+"""
+import re
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import deadlines
+import metrics
+import tracing
+from app import app as flask_app
+from feed_index import feed_index
+from http_cache import POLICIES, make_etag, not_modified
+from compression import CompressionMiddleware
+from wikipedia_api import get_category_articles_async, get_full_article_async, close_async_http
+from openai_service import (
+    agenerate_summary, agenerate_lesson, agenerate_exercise, agenerate_lesson_bundle,
+    astream_summary, astream_lesson, astream_exercise, RenderedHTML
+)
+from config import FEED_INDEX_ENABLED, LESSON_BUNDLE_MODE, WSGI_THREADS
+
+log = logging.getLogger(__name__)
+
+_wsgi_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    """
+    asgiref runs WSGI apps thread-sensitively, i.e. one request at a time
+    per process; run each on its own thread of _wsgi_pool instead
+    """
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__["run_wsgi_app"].func, thread_sensitive=False, executor=_wsgi_pool
+    )
+
+
+class _PooledWsgiToAsgi(WsgiToAsgi):
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi = _PooledWsgiToAsgi(flask_app)
+
+
+# ------------------------------------------------------------------
+# helpers
+# ------------------------------------------------------------------
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def _parse_json(body):
+    try:
+        return json.loads(body or b"{}") or {}
+    except ValueError:
+        return {}
+
+
+async def _read_json(receive):
+    return _parse_json(await _read_body(receive))
+
+
+def _replay(body):
+    """receive() that hands an already read body to the next application"""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+def _wants_job(headers, body):
+    """Same as routes._wants_job"""
+    if b"respond-async" in headers.get(b"prefer", b""):
+        return True
+    data = _parse_json(body)
+    return isinstance(data, dict) and bool(data.get("async"))
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_cacheable_json(scope, send, payload, policy):
+    """_send_json with the ETag, Cache-Control and 304 handling of the Flask routes"""
+    body = json.dumps(payload).encode("utf-8")
+    etag = make_etag(body)
+    headers = [
+        (b"etag", f'"{etag}"'.encode()),
+        (b"cache-control", POLICIES[policy].encode()),
+    ]
+    if_none_match = dict(scope.get("headers") or []).get(b"if-none-match", b"").decode("latin-1")
+    if not_modified(if_none_match, etag):
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ] + headers,
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_sse(send, chunks):
+    """Same event format as routes._sse_response"""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+    async def event(text):
+        await send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": True})
+
+    await event(": stream open\n\n")
+    done = {}
+    try:
+        async for chunk in chunks:
+            if isinstance(chunk, RenderedHTML):
+                done["html"] = chunk
+            else:
+                await event(f"data: {json.dumps({'delta': chunk})}\n\n")
+        await event(f"event: done\ndata: {json.dumps(done)}\n\n")
+    except Exception as e:               # noqa: BLE001
+        log.error(f"Streaming generation failed: {e}")
+        await event(f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n")
+    await send({"type": "http.response.body", "body": b""})
+
+
+# ------------------------------------------------------------------
+# async routes
+# ------------------------------------------------------------------
+
+async def _article_text(title):
+    """Async routes._article_text"""
+    if not title:
+        return None
+    try:
+        return (await get_full_article_async(title)).get("content")
+    except Exception as e:               # noqa: BLE001
+        log.warning(f"No article text for {title!r}, generating from title only: {e}")
+        return None
+
+
+async def api_generate_summary(scope, receive, send):
+    data = await _read_json(receive)
+    title = data.get("article_title")
+    summary = await agenerate_summary(
+        title, data.get("english_level", "intermediate"), await _article_text(title)
+    )
+    await _send_json(send, {"success": True, "summary": summary})
+
+
+async def api_generate_lesson(scope, receive, send):
+    data = await _read_json(receive)
+    title = data.get("article_title")
+    if not title:
+        raise ValueError("article_title is required")
+    lesson = await agenerate_lesson(
+        title, data.get("english_level", "intermediate"), await _article_text(title)
+    )
+    await _send_json(send, {"success": True, "lesson": lesson})
+
+
+async def api_generate_exercise(scope, receive, send):
+    data = await _read_json(receive)
+    title = data.get("article_title")
+    exercise = await agenerate_exercise(
+        title,
+        data.get("english_level", "intermediate"),
+        data.get("exercise_type", "extra"),
+        await _article_text(title),
+    )
+    await _send_json(send, {"success": True, "exercise": exercise})
+
+
+async def api_generate_lesson_bundle(scope, receive, send):
+    data = await _read_json(receive)
+    title = data.get("article_title")
+    if not title:
+        raise ValueError("article_title is required")
+    bundle = await agenerate_lesson_bundle(
+        title,
+        data.get("english_level", "intermediate"),
+        await _article_text(title),
+        mode=data.get("mode", LESSON_BUNDLE_MODE),
+    )
+    await _send_json(send, {"success": True, "bundle": bundle})
+
+
+async def api_stream_summary(scope, receive, send):
+    data = await _read_json(receive)
+    title = data.get("article_title")
+    await _send_sse(send, astream_summary(
+        title, data.get("english_level", "intermediate"), await _article_text(title)
+    ))
+
+
+async def api_stream_lesson(scope, receive, send):
+    data = await _read_json(receive)
+    title = data.get("article_title")
+    if not title:
+        raise ValueError("article_title is required")
+    await _send_sse(send, astream_lesson(
+        title, data.get("english_level", "intermediate"), await _article_text(title)
+    ))
+
+
+async def api_stream_exercise(scope, receive, send):
+    data = await _read_json(receive)
+    title = data.get("article_title")
+    await _send_sse(send, astream_exercise(
+        title,
+        data.get("english_level", "intermediate"),
+        data.get("exercise_type", "extra"),
+        await _article_text(title),
+    ))
+
+
+async def api_articles(scope, receive, send, category, subcategory):
+    args = parse_qs(scope.get("query_string", b"").decode())
+    images_only = args.get("images_only", [""])[0] == "true"
+    continue_from = args.get("continue", [None])[0]
+    try:
+        # the prebuilt feed first, as the Flask route does (a local SQLite read)
+        page = await asyncio.to_thread(
+            feed_index.read, category, subcategory, images_only, continue_from
+        ) if FEED_INDEX_ENABLED else None
+        if page is None:
+            page = await get_category_articles_async(
+                category, subcategory, images_only, continue_from
+            )
+        data, token = page
+    except ValueError as e:              # malformed continue token
+        await _send_json(send, {"error": str(e), "articles": []}, 400)
+        return
+    except Exception as e:               # noqa: BLE001
+        log.exception(e)
+        await _send_json(send, {"error": str(e), "articles": []}, 500)
+        return
+    await _send_cacheable_json(scope, send, {"articles": data, "continue": token}, "feed")
+
+
+ROUTES = [
+    ("POST", re.compile(r"^/api/generate-summary$"), api_generate_summary),
+    ("POST", re.compile(r"^/api/generate-lesson$"), api_generate_lesson),
+    ("POST", re.compile(r"^/api/generate-exercise$"), api_generate_exercise),
+    ("POST", re.compile(r"^/api/generate-lesson-bundle$"), api_generate_lesson_bundle),
+    ("POST", re.compile(r"^/api/generate-summary/stream$"), api_stream_summary),
+    ("POST", re.compile(r"^/api/generate-lesson/stream$"), api_stream_lesson),
+    ("POST", re.compile(r"^/api/generate-exercise/stream$"), api_stream_exercise),
+    ("GET", re.compile(r"^/api/articles/(?P<category>[^/]+)/(?P<subcategory>[^/]+)$"), api_articles),
+]
+
+# Routes that can answer with a background job instead, which the Flask routes create
+JOB_ROUTES = (api_generate_summary, api_generate_lesson, api_generate_exercise, api_generate_lesson_bundle)
+
+
+def _observed(send, endpoint, method):
+    """send() that records the time to response headers, as the Flask routes do"""
+    started = time.perf_counter()
+
+    async def observed_send(message):
+        if message["type"] == "http.response.start":
+            observed_send.status = message["status"]
+            metrics.http_seconds.observe(time.perf_counter() - started, endpoint=endpoint,
+                                         method=method, status=message["status"])
+        await send(message)
+
+    observed_send.status = None
+    return observed_send
+
+
+async def router(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_http()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] == "http":
+        path = scope["path"]
+        headers = dict(scope.get("headers") or [])
+        for method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if match and scope["method"] == method:
+                if handler in JOB_ROUTES:
+                    body = await _read_body(receive)
+                    receive = _replay(body)
+                    if _wants_job(headers, body):
+                        break
+                requested = headers.get(b"x-request-timeout", b"").decode("latin-1")
+                send = _observed(send, handler.__name__, method)
+                trace = tracing.start(handler.__name__)
+                try:
+                    # scope["path"] is already percent-decoded
+                    with deadlines.within(deadlines.budget(requested)):
+                        await handler(scope, receive, send, **match.groupdict())
+                except ValueError as e:
+                    await _send_json(send, {"success": False, "error": str(e)}, 400)
+                except Exception as e:   # noqa: BLE001
+                    log.error(f"{path} failed: {e}")
+                    await _send_json(send, {"success": False, "error": str(e)}, 500)
+                finally:
+                    tracing.finish(trace, send.status)
+                return
+
+    await wsgi(scope, receive, send)
+
+
+app = CompressionMiddleware(router)
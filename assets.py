@@ -0,0 +1,136 @@
+"""
+Content-hashed, precompressed static assets.
+
+    python assets.py        # run on deploy, before the web processes start
+
+copies every file under static/ to static/dist/ with a hash of its bytes
+in the name (css/style.css -> css/style.1a2b3c4d5e.css), writes .gz and,
+when the optional `brotli` package is installed, .br variants next to the
+compressible ones at maximum compression, and records the mapping in
+static/dist/manifest.json.
+
+A rebuild leaves files of earlier builds in place for KEEP_SECONDS after
+they dropped out of the manifest: pages that browsers and caches may still
+use (for max-age plus stale-while-revalidate) keep loading their assets.
+
+With a manifest present url_for('static', filename='css/style.css') emits
+the hashed URL. Those are served with the best precompressed variant the
+client accepts and cached for a year as immutable: a changed file gets a
+new name. Without a build the plain /static/ files are served as before.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import mimetypes
+
+from compression import brotli, accepts, compressible, encode
+from config import PAGE_MAX_AGE, PAGE_STALE, ARTICLE_MAX_AGE, ARTICLE_STALE
+
+log = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST = "dist"
+DIST_DIR = os.path.join(STATIC_DIR, DIST)
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+IMMUTABLE = "public, max-age=31536000, immutable"
+VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+# longest a cached page may still be shown and reference an old build
+KEEP_SECONDS = max(PAGE_MAX_AGE + PAGE_STALE, ARTICLE_MAX_AGE + ARTICLE_STALE)
+
+
+def hashed_name(path, data):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _outputs(target):
+    return [target] + [target + suffix for _, suffix in VARIANTS]
+
+
+def _prune(dist_dir, previous, manifest, keep=KEEP_SECONDS):
+    """
+    Files of the last build that this one dropped start their KEEP_SECONDS
+    now (their mtime is set to the time they were retired); files retired
+    longer ago are deleted.
+    """
+    current = {name for target in manifest.values() for name in _outputs(target)}
+    retired = {name for target in previous.values() for name in _outputs(target)} - current
+    now = time.time()
+    removed = 0
+    for root, _, files in os.walk(dist_dir):
+        for name in files:
+            out = os.path.join(root, name)
+            path = os.path.relpath(out, dist_dir).replace(os.sep, "/")
+            if path == "manifest.json" or path in current:
+                continue
+            if path in retired:
+                os.utime(out, (now, now))
+            elif os.path.getmtime(out) < now - keep:
+                os.remove(out)
+                removed += 1
+    return removed
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR, keep=KEEP_SECONDS):
+    """Build dist_dir, keeping recently retired files (see _prune); returns the manifest"""
+    previous = load_manifest(os.path.join(dist_dir, "manifest.json"))
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            target = hashed_name(path, data)
+            out = os.path.join(dist_dir, target)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out, "wb") as f:
+                f.write(data)
+            if compressible(mimetypes.guess_type(name)[0], len(data)):
+                for encoding, suffix in VARIANTS:
+                    if encoding == "br" and brotli is None:
+                        continue
+                    with open(out + suffix, "wb") as f:
+                        f.write(encode(data, encoding, gzip_level=9, brotli_quality=11))
+            manifest[path] = target
+    os.makedirs(dist_dir, exist_ok=True)
+    path = os.path.join(dist_dir, "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    removed = _prune(dist_dir, previous, manifest, keep)
+    if removed:
+        log.info("Removed %d assets retired more than %ds ago", removed, keep)
+    return manifest
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        log.error("Unreadable asset manifest %s, serving plain static files: %s", path, e)
+        return {}
+
+
+manifest = load_manifest()
+
+
+def variant(filename, accept_encoding):
+    """(file to send, Content-Encoding) for a hashed asset: the smallest one the client accepts"""
+    for encoding, suffix in VARIANTS:
+        if accepts(accept_encoding, encoding) and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            return filename + suffix, encoding
+    return filename, None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    built = build()
+    log.info("%d assets written to %s%s", len(built), DIST_DIR,
+             "" if brotli is not None else " (gzip only: install brotli for .br)")
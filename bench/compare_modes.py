@@ -0,0 +1,132 @@
+"""
+Load-test the WSGI (gunicorn app:app) and ASGI (uvicorn asgi:app) serving
+modes against the local stub upstreams.
+
+    python bench/compare_modes.py --requests 200 --concurrency 100
+
+Each request asks for a lesson on a distinct title so the generation cache
+and request coalescing never short-circuit the upstream call.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import start_stub_server  # noqa: E402
+
+MODES = {
+    # mirrors the Procfile
+    "wsgi": lambda port: ["gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+                          "--workers", "2", "--threads", "4", "--timeout", "180"],
+    "asgi": lambda port: ["uvicorn", "asgi:app", "--port", str(port),
+                          "--workers", "2", "--no-access-log"],
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on :{port} did not come up")
+
+
+def _one_request(port, i):
+    body = json.dumps({"article_title": f"Bench topic {i}", "english_level": "intermediate"})
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api/generate-lesson",
+        data=body.encode(), headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except Exception:                    # noqa: BLE001
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_mode(mode, stub_port, requests, concurrency):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        WIKIPEDIA_API_ENDPOINT=f"http://127.0.0.1:{stub_port}/w/api.php",
+        GENERATION_CACHE_BACKEND="none",
+        # measure the serving modes, not the admission limit
+        OPENAI_MAX_CONCURRENCY="1000",
+        OPENAI_HEDGE_AFTER="0",
+    )
+    proc = subprocess.Popen(MODES[mode](port), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for(port)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda i: _one_request(port, i), range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    latencies = [t for t, ok in results if ok]
+    return {
+        "mode": mode,
+        "ok": len(latencies),
+        "failed": len(results) - len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": _percentile(latencies, 95) if latencies else float("nan"),
+        "p99": _percentile(latencies, 99) if latencies else float("nan"),
+        "wall": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--modes", default="wsgi,asgi")
+    args = parser.parse_args()
+
+    stub = start_stub_server(openai_latency=args.openai_latency)
+    stub_port = stub.server_address[1]
+
+    print(f"{args.requests} lesson requests, {args.concurrency} concurrent, "
+          f"stub OpenAI latency {args.openai_latency:.1f}s")
+    print(f"{'mode':<6}{'ok':>6}{'fail':>6}{'req/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'wall':>8}")
+    for mode in args.modes.split(","):
+        r = run_mode(mode, stub_port, args.requests, args.concurrency)
+        print(f"{r['mode']:<6}{r['ok']:>6}{r['failed']:>6}{r['throughput']:>9.1f}"
+              f"{r['p50']:>8.2f}{r['p95']:>8.2f}{r['p99']:>8.2f}{r['wall']:>8.1f}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Load-test the app as deployed (the Procfile's gunicorn command) against
+the local stub upstreams with a realistic traffic mix.
+
+    python bench/load_test.py --users 20 --duration 60 --token-rate 40 --error-rate 0.02
+
+Every virtual user repeats a learning session: home page, a category, its
+article list and feed, an article, then its summary, lesson and the three
+exercises (streamed, as the browser asks for them; --no-stream for the JSON
+endpoints). Reported per step and overall: throughput and p50/p95/p99
+latency, plus thread saturation: the average number of requests in flight
+against the server's worker x thread slots (over 100% means requests
+queued for a thread) and the server's own handling time from /metrics.
+"""
+import os
+import sys
+import time
+import shlex
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from urllib.parse import quote
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stubs import start_stub_server  # noqa: E402
+from compare_modes import _free_port, _wait_for, _percentile  # noqa: E402
+from config import CATEGORIES, SUBCATEGORIES, ENGLISH_LEVELS  # noqa: E402
+
+EXERCISE_TYPES = ("grammar", "vocabulary", "extra")
+STEPS = ("home", "category", "article_list", "feed", "article", "summary", "lesson") + EXERCISE_TYPES
+
+
+def procfile_web():
+    """The Procfile's web process as (build commands run before it, server command)"""
+    with open(os.path.join(ROOT, "Procfile"), encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("web:"):
+                *build, command = [part.strip() for part in line[len("web:"):].split("&&")]
+                return build, command
+    raise RuntimeError("no web process in the Procfile")
+
+
+def server_command(command, port):
+    """argv for `command` listening on 127.0.0.1:port"""
+    argv = shlex.split(command.replace("$PORT", str(port)))
+    for i, arg in enumerate(argv):
+        if arg in ("--bind", "-b"):
+            argv[i + 1] = f"127.0.0.1:{port}"
+        elif arg == "--port":
+            argv[i + 1] = str(port)
+    return argv
+
+
+def thread_slots(argv):
+    """workers x threads of a gunicorn command line (uvicorn: workers only)"""
+    def option(names, default):
+        for i, arg in enumerate(argv):
+            for name in names:
+                if arg == name and i + 1 < len(argv):
+                    return int(argv[i + 1])
+                if arg.startswith(name + "="):
+                    return int(arg.split("=", 1)[1])
+        return default
+    return option(("--workers", "-w"), 1) * option(("--threads",), 1)
+
+
+def scrape(base):
+    """{series: value} from the app's /metrics, histogram buckets left out"""
+    try:
+        text = requests.get(f"{base}/metrics", timeout=10).text
+    except requests.RequestException:
+        return {}
+    series = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#") and "_bucket{" not in line:
+            name, value = line.rsplit(" ", 1)
+            series[name] = float(value)
+    return series
+
+
+def server_seconds(series):
+    """Thread-seconds spent handling requests (to response headers), /metrics itself excluded"""
+    return sum(value for name, value in series.items()
+               if name.startswith("wikilearn_http_request_duration_seconds_sum{")
+               and 'endpoint="metrics_endpoint"' not in name)
+
+
+def generation_sources(series):
+    """Generations by source: cache, library, openai, fallback"""
+    sources = defaultdict(float)
+    for name, value in series.items():
+        if name.startswith("wikilearn_generations_total{"):
+            sources[name.split('source="', 1)[1].split('"', 1)[0]] += value
+    return sources
+
+
+class User(threading.Thread):
+    """One browser going through learning sessions until `stop_at`"""
+
+    def __init__(self, base, stop_at, results, stream, think, seed):
+        super().__init__(daemon=True)
+        self.base = base
+        self.stop_at = stop_at
+        self.results = results
+        self.stream = stream
+        self.think = think
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        self.sessions = 0
+
+    def step(self, name, method, path, **kwargs):
+        """Time one request (a stream until its last event); None if stopped or failed"""
+        if time.monotonic() >= self.stop_at:
+            return None
+        if self.think:
+            time.sleep(self.rng.uniform(0, 2 * self.think))
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base + path, timeout=300, **kwargs)
+            ok = response.status_code < 400
+            if ok and response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                ok = "event: error" not in response.text
+        except requests.RequestException:
+            response, ok = None, False
+        self.results.append((name, time.perf_counter() - start, ok))
+        return response if ok else None
+
+    def generate(self, name, endpoint, payload):
+        if self.stream:
+            return self.step(name, "POST", f"/api/{endpoint}/stream", json=payload,
+                             headers={"Accept": "text/event-stream"})
+        return self.step(name, "POST", f"/api/{endpoint}", json=payload)
+
+    def session(self):
+        category = self.rng.choice(CATEGORIES)["name"]
+        subcategory = self.rng.choice(SUBCATEGORIES.get(category, ["General"]))
+        self.step("home", "GET", "/")
+        self.step("category", "GET", f"/subcategories/{quote(category)}")
+        self.step("article_list", "GET", f"/articles/{quote(category)}/{quote(subcategory)}")
+        feed = self.step("feed", "GET", f"/api/articles/{quote(category)}/{quote(subcategory)}")
+        articles = feed.json().get("articles") if feed is not None else None
+        if not articles:
+            return
+        title = self.rng.choice(articles)["title"]
+        self.step("article", "GET", f"/article/{quote(title)}")
+        payload = {"article_title": title, "english_level": self.rng.choice(list(ENGLISH_LEVELS))}
+        self.generate("summary", "generate-summary", payload)
+        self.generate("lesson", "generate-lesson", payload)
+        for exercise_type in EXERCISE_TYPES:
+            self.generate(exercise_type, "generate-exercise", dict(payload, exercise_type=exercise_type))
+        self.sessions += 1
+
+    def run(self):
+        while time.monotonic() < self.stop_at:
+            self.session()
+
+
+def summarize(results, wall):
+    by_step = defaultdict(list)
+    for name, seconds, ok in results:
+        by_step[name].append((seconds, ok))
+    rows = []
+    for name in [s for s in STEPS if s in by_step] + ["all"]:
+        samples = [(t, ok) for n, t, ok in results] if name == "all" else by_step[name]
+        latencies = [t for t, ok in samples if ok]
+        rows.append({
+            "step": name,
+            "ok": len(latencies),
+            "failed": len(samples) - len(latencies),
+            "throughput": len(latencies) / wall,
+            "p50": _percentile(latencies, 50) if latencies else float("nan"),
+            "p95": _percentile(latencies, 95) if latencies else float("nan"),
+            "p99": _percentile(latencies, 99) if latencies else float("nan"),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause before each request")
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--command", help="server command (default: the Procfile's web process)")
+    parser.add_argument("--wiki-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=1.0, help="seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="tokens/s after the first (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failing completions")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--recordings", help="directory of recorded MediaWiki responses")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stub = start_stub_server(
+        wiki_latency=args.wiki_latency, openai_latency=args.openai_latency,
+        token_rate=args.token_rate, error_rate=args.error_rate, error_status=args.error_status,
+        recordings=args.recordings, seed=args.seed,
+    )
+    stub_port = stub.server_address[1]
+    port = _free_port()
+    build, command = procfile_web()
+    for step in build:
+        subprocess.run(shlex.split(step), cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    argv = server_command(args.command or command, port)
+    slots = thread_slots(argv)
+    base = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory(prefix="wikilearn-bench-") as data:
+        env = dict(
+            os.environ,
+            PORT=str(port),
+            OPENAI_API_KEY="stub",
+            OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+            WIKIPEDIA_API_ENDPOINT=f"http://127.0.0.1:{stub_port}/w/api.php",
+            # a cold, private copy of every store
+            GENERATION_CACHE_PATH=os.path.join(data, "generation_cache.sqlite3"),
+            GOVERNOR_PATH=os.path.join(data, "governor.sqlite3"),
+            JOB_STORE_PATH=os.path.join(data, "jobs.sqlite3"),
+            FEED_INDEX_PATH=os.path.join(data, "feed_index.sqlite3"),
+            DATABASE_URL=f"sqlite:///{os.path.join(data, 'library.sqlite3')}",
+            SINGLEFLIGHT_LOCK_DIR=os.path.join(data, "locks"),
+            GOVERNOR_LOCK_DIR=os.path.join(data, "governor-locks"),
+            METRICS_DIR=os.path.join(data, "metrics"),
+            METRICS_FLUSH_INTERVAL="1",
+        )
+        proc = subprocess.Popen(argv, cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for(port)
+            before = scrape(base)
+            results = []
+            stop_at = time.monotonic() + args.duration
+            users = [User(base, stop_at, results, args.stream, args.think, args.seed + i)
+                     for i in range(args.users)]
+            start = time.perf_counter()
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            wall = time.perf_counter() - start
+            time.sleep(1.5)              # let every worker save its metrics
+            after = scrape(base)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=60)
+    stub.shutdown()
+
+    print(f"{' '.join(argv)}")
+    print(f"{args.users} users for {wall:.0f}s, {sum(u.sessions for u in users)} sessions, "
+          f"{'streamed' if args.stream else 'JSON'} generations; stub OpenAI {args.openai_latency:.2f}s "
+          f"to first token, {args.token_rate or 'instant'} tokens/s, {args.error_rate:.0%} errors")
+    print(f"{'step':<14}{'ok':>7}{'fail':>6}{'req/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for r in summarize(results, wall):
+        print(f"{r['step']:<14}{r['ok']:>7}{r['failed']:>6}{r['throughput']:>9.1f}"
+              f"{r['p50']:>8.2f}{r['p95']:>8.2f}{r['p99']:>8.2f}")
+
+    in_flight = sum(t for _, t, _ in results) / wall
+    print(f"in flight: {in_flight:.1f} requests on {slots} worker threads "
+          f"(saturation {in_flight / slots:.0%})")
+    if after:
+        busy = server_seconds(after) - server_seconds(before)
+        print(f"server handling time: {busy / wall:.1f} thread-seconds/s "
+              f"(to response headers; streams hold their thread longer)")
+        sources = generation_sources(after)
+        for source, count in generation_sources(before).items():
+            sources[source] -= count
+        print("generations: " + ", ".join(f"{int(n)} {source}" for source, n in sorted(sources.items())))
+
+
+if __name__ == "__main__":
+    main()
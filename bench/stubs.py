@@ -0,0 +1,322 @@
+"""
+Local stand-ins for en.wikipedia.org and the OpenAI API.
+
+Point the app at them with
+    WIKIPEDIA_API_ENDPOINT=http://127.0.0.1:<port>/w/api.php
+    OPENAI_BASE_URL=http://127.0.0.1:<port>/v1  OPENAI_API_KEY=stub
+
+MediaWiki queries are answered from recorded responses when there is one
+for the exact parameters, otherwise with synthetic pages. Record real ones
+by running the stub in front of Wikipedia and browsing the app through it:
+
+    python bench/stubs.py --port 8900 --record bench/recordings
+
+Chat completions (plain, JSON-schema and streamed) take `openai_latency`
+to the first token, then produce `token_rate` tokens per second, and fail
+with `error_status` for a fraction `error_rate` of requests.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import hashlib
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+WIKIPEDIA_API = "https://en.wikipedia.org/w/api.php"
+USER_AGENT = "WikiLearn-bench/1.0 (recording stub responses)"
+# completion length when the request allows it, as the old fixed stub answer
+COMPLETION_TOKENS = 250
+PROMPT_TOKENS = 500
+# tokens per streamed chunk
+CHUNK_TOKENS = 5
+
+
+def _pages(search, offset, count=10):
+    pages = {}
+    for i in range(count):
+        page_id = str(100000 + offset + i)
+        page = {
+            "pageid": int(page_id),
+            "index": i + 1,
+            "title": f"{search} {offset + i}",
+            "extract": f"{search} {offset + i} is a stub article. It exists for benchmarks.",
+            "fullurl": f"https://en.wikipedia.org/wiki/Stub_{page_id}",
+        }
+        if i % 2 == 0:
+            page["original"] = {"source": f"https://upload.wikimedia.org/stub/{page_id}.jpg"}
+        pages[page_id] = page
+    return pages
+
+
+def _titles_response(args):
+    """
+    Mimic action=query&titles=A|B|...: normalizes the first letter, gives
+    page info for all titles but, like TextExtracts without exintro, only
+    one full extract per response with `excontinue` pointing at the next.
+    """
+    titles = args["titles"].split("|")
+    offset = int(args.get("excontinue", 0))
+    query = {"pages": {}}
+    normalized = []
+    for i, title in enumerate(titles):
+        canonical = title.replace("_", " ")
+        canonical = canonical[:1].upper() + canonical[1:]
+        if canonical != title:
+            normalized.append({"from": title, "to": canonical})
+        page_id = str(abs(hash(canonical)) % 10 ** 8)
+        page = {"pageid": int(page_id), "title": canonical, "lastrevid": 1000,
+                "touched": "2024-01-01T00:00:00Z"}
+        if args.get("prop") != "info":
+            page["fullurl"] = f"https://en.wikipedia.org/wiki/{canonical.replace(' ', '_')}"
+            if i == offset:
+                page["extract"] = f"<p>{canonical} is a stub article.</p>" * 50
+        query["pages"][page_id] = page
+    if normalized:
+        query["normalized"] = normalized
+
+    response = {"batchcomplete": "", "query": query}
+    if args.get("prop") != "info" and offset + 1 < len(titles):
+        response = {"continue": {"excontinue": offset + 1, "continue": "||pageimages|info"},
+                    "query": query}
+    return response
+
+
+def _opensearch_response(args):
+    """Mimic action=opensearch: [query, titles, descriptions, urls]"""
+    search = args.get("search", "")
+    prefix = search[:1].upper() + search[1:]
+    titles = [f"{prefix} {i}" for i in range(min(int(args.get("limit", 10)), 10))]
+    return [search, titles, [""] * len(titles),
+            [f"https://en.wikipedia.org/wiki/{t.replace(' ', '_')}" for t in titles]]
+
+
+def recording_key(args):
+    """Recordings are matched on every query parameter except the output format"""
+    return json.dumps({k: v for k, v in sorted(args.items()) if k not in ("format", "formatversion")})
+
+
+def load_recordings(directory):
+    """{recording_key: response} for the *.json files written by --record"""
+    recordings = {}
+    if not directory or not os.path.isdir(directory):
+        return recordings
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                entry = json.load(f)
+            recordings[recording_key(entry["params"])] = entry["response"]
+    return recordings
+
+
+def _completion_content(request, tokens):
+    """HTML of about `tokens` words, or the JSON object a json_schema request asks for"""
+    text = "<h2>Stub</h2><p>" + "word " * max(tokens - 4, 1) + "</p>"
+    response_format = request.get("response_format") or {}
+    if response_format.get("type") != "json_schema":
+        return text
+    schema = response_format["json_schema"]["schema"]
+    parts = schema.get("required") or list(schema.get("properties", {}))
+    part_tokens = max(tokens // max(len(parts), 1), 1)
+    return json.dumps({part: "<h2>Stub</h2><p>" + "word " * part_tokens + "</p>" for part in parts})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # overwritten per server by start_stub_server
+    wiki_latency = 0.05
+    openai_latency = 1.0
+    token_rate = 0.0                     # tokens/s after the first; 0 = instant
+    error_rate = 0.0
+    error_status = 500
+    recordings = {}
+    record_dir = None                    # record misses from WIKIPEDIA_API here
+    rng = random.Random()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/w/api.php":
+            return self._send_json({"error": "not found"}, 404)
+        args = {k: v[0] for k, v in parse_qs(url.query).items()}
+        recorded = self.recordings.get(recording_key(args))
+        if recorded is None and self.record_dir:
+            return self._send_json(self._record(args))
+        time.sleep(self.wiki_latency)
+
+        if recorded is not None:
+            return self._send_json(recorded)
+        if "titles" in args:
+            return self._send_json(_titles_response(args))
+        if args.get("action") == "opensearch":
+            return self._send_json(_opensearch_response(args))
+
+        offset = int(args.get("gsroffset", 0))
+        search = args.get("gsrsearch", "Stub")
+        self._send_json({
+            "continue": {"gsroffset": offset + 10, "continue": "gsroffset||"},
+            "query": {"pages": _pages(search, offset)},
+        })
+
+    def _record(self, args):
+        """Fetch a query from the real API and save it for replay"""
+        request = urllib.request.Request(f"{WIKIPEDIA_API}?{urlencode(args)}",
+                                         headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            payload = json.loads(response.read())
+        key = recording_key(args)
+        name = hashlib.sha256(key.encode()).hexdigest()[:16] + ".json"
+        with open(os.path.join(self.record_dir, name), "w", encoding="utf-8") as f:
+            json.dump({"params": args, "response": payload}, f, ensure_ascii=False)
+        self.recordings[key] = payload
+        return payload
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self._send_json({"error": "not found"}, 404)
+        time.sleep(self.openai_latency)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return self._send_json({"error": {
+                "message": f"injected stub error {self.error_status}",
+                "type": "rate_limit_exceeded" if self.error_status == 429 else "server_error",
+            }}, self.error_status, headers={"retry-after": "1"} if self.error_status == 429 else None)
+
+        tokens = min(request.get("max_tokens") or COMPLETION_TOKENS, COMPLETION_TOKENS)
+        content = _completion_content(request, tokens)
+        if request.get("stream"):
+            return self._stream_completion(request, content, tokens)
+        if self.token_rate:
+            time.sleep(tokens / self.token_rate)
+        self._send_json({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {"prompt_tokens": PROMPT_TOKENS, "completion_tokens": tokens,
+                      "total_tokens": PROMPT_TOKENS + tokens},
+        }, headers=self._rate_limit_headers())
+
+    def _stream_completion(self, request, content, tokens):
+        """Server-sent chat.completion.chunk events at token_rate, chunked encoding"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in self._rate_limit_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        words = content.split(" ")
+        pieces = [" ".join(words[i:i + CHUNK_TOKENS]) + " " for i in range(0, len(words), CHUNK_TOKENS)]
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "gpt-4o")}
+        for i, piece in enumerate(pieces):
+            if i and self.token_rate:
+                time.sleep(CHUNK_TOKENS / self.token_rate)
+            self._write_event(dict(base, choices=[{"index": 0, "delta": {"content": piece},
+                                                   "finish_reason": None}]))
+        self._write_event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._write_event(dict(base, choices=[], usage={
+                "prompt_tokens": PROMPT_TOKENS, "completion_tokens": tokens,
+                "total_tokens": PROMPT_TOKENS + tokens}))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, payload):
+        self._write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    @staticmethod
+    def _rate_limit_headers():
+        # generous limits so the governor never throttles the benchmark
+        return {
+            "x-ratelimit-limit-requests": "100000",
+            "x-ratelimit-remaining-requests": "99999",
+            "x-ratelimit-reset-requests": "1ms",
+            "x-ratelimit-limit-tokens": "100000000",
+            "x-ratelimit-remaining-tokens": "99999000",
+            "x-ratelimit-reset-tokens": "1ms",
+        }
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stub_server(port=0, wiki_latency=0.05, openai_latency=1.0, token_rate=0.0,
+                      error_rate=0.0, error_status=500, recordings=None, record_dir=None, seed=None):
+    """
+    Serve both stubs on one port in a daemon thread; returns the server.
+    `recordings` is a directory of recorded MediaWiki responses to replay;
+    with `record_dir`, queries without one are fetched from Wikipedia and
+    saved there.
+    """
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+    handler = type("Handler", (StubHandler,), {
+        "wiki_latency": wiki_latency,
+        "openai_latency": openai_latency,
+        "token_rate": token_rate,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "recordings": load_recordings(recordings or record_dir),
+        "record_dir": record_dir,
+        "rng": random.Random(seed),
+    })
+    server = _StubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Wikipedia and OpenAI stubs")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--wiki-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--recordings", help="directory of recorded MediaWiki responses to replay")
+    parser.add_argument("--record", help="fetch unrecorded queries from Wikipedia and save them here")
+    args = parser.parse_args()
+
+    server = start_stub_server(
+        args.port, args.wiki_latency, args.openai_latency, args.token_rate,
+        args.error_rate, args.error_status, args.recordings, args.record,
+    )
+    print(f"stubs on http://127.0.0.1:{server.server_address[1]} "
+          f"({len(server.RequestHandlerClass.recordings)} recorded queries)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
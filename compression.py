@@ -0,0 +1,138 @@
+"""
+Response compression.
+
+Bodies of at least COMPRESS_MIN_SIZE bytes with a text-like content type
+are sent as brotli when the client accepts it and the optional `brotli`
+package is installed, otherwise gzip. Streams (SSE) and responses that
+already carry a Content-Encoding (precompressed static assets, see
+assets.py) pass through untouched. A compressed response's ETag becomes
+weak, since its bytes differ from the identity body the ETag was made for;
+If-None-Match still matches it (http_cache.not_modified compares weakly).
+
+Flask responses are compressed in an after_request hook, the native ASGI
+routes by CompressionMiddleware.
+"""
+import gzip
+
+from werkzeug.http import parse_accept_header
+
+from config import COMPRESS_ENABLED, COMPRESS_MIN_SIZE, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:                      # gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/javascript", "application/javascript",
+    "application/json", "application/xml", "image/svg+xml",
+}
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding):
+    """The best encoding the client accepts, or None for identity"""
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(ENCODINGS)
+
+
+def accepts(accept_encoding, encoding):
+    return bool(accept_encoding) and parse_accept_header(accept_encoding).quality(encoding) > 0
+
+
+def compressible(content_type, size):
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    return size >= COMPRESS_MIN_SIZE and mimetype in COMPRESSIBLE_TYPES
+
+
+def encode(body, encoding, gzip_level=COMPRESS_GZIP_LEVEL, brotli_quality=COMPRESS_BROTLI_QUALITY):
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    # mtime=0: identical input gives identical bytes in every worker
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+def _weak(etag):
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+def _add_vary(existing):
+    values = [v.strip() for v in existing.split(",") if v.strip()] if existing else []
+    if "accept-encoding" not in (v.lower() for v in values):
+        values.append("Accept-Encoding")
+    return ", ".join(values)
+
+
+def compress_response(response, accept_encoding):
+    """Compress a Flask response in place when it qualifies; returns it"""
+    if (not COMPRESS_ENABLED or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or "Content-Encoding" in response.headers):
+        return response
+    body = response.get_data()
+    if not compressible(response.content_type, len(body)):
+        return response
+    response.headers["Vary"] = _add_vary(response.headers.get("Vary"))
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+    response.set_data(encode(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    if "ETag" in response.headers:
+        response.headers["ETag"] = _weak(response.headers["ETag"])
+    return response
+
+
+class CompressionMiddleware:
+    """
+    ASGI counterpart of compress_response. Only single-message bodies are
+    compressed; anything sent in several parts (SSE, the WSGI bridge's
+    chunked bodies) is forwarded as it comes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESS_ENABLED:
+            return await self.app(scope, receive, send)
+        request_headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        start = None
+
+        async def wrapped_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                return await send(message)
+            pending, start = start, None
+            headers = dict(pending.get("headers") or [])
+            body = message.get("body", b"")
+            if (pending["status"] == 200 and not message.get("more_body")
+                    and b"content-encoding" not in headers
+                    and compressible(headers.get(b"content-type", b"").decode("latin-1"), len(body))):
+                pending, message = self._compress(pending, message, encoding)
+            await send(pending)
+            await send(message)
+
+        await self.app(scope, receive, wrapped_send)
+
+    @staticmethod
+    def _compress(start, message, encoding):
+        headers = [(k, v) for k, v in start.get("headers") or [] if k != b"vary"]
+        vary = dict(start.get("headers") or []).get(b"vary", b"").decode("latin-1")
+        headers.append((b"vary", _add_vary(vary).encode("latin-1")))
+        if encoding is None:
+            return dict(start, headers=headers), message
+        body = encode(message.get("body", b""), encoding)
+        out = []
+        for name, value in headers:
+            if name == b"content-length":
+                value = str(len(body)).encode()
+            elif name == b"etag":
+                value = _weak(value.decode("latin-1")).encode("latin-1")
+            out.append((name, value))
+        out.append((b"content-encoding", encoding.encode()))
+        return dict(start, headers=out), dict(message, body=body)
@@ -1,10 +1,123 @@
 import os
 
 # Wikipedia API Configuration
-WIKIPEDIA_API_ENDPOINT = "https://en.wikipedia.org/w/api.php"
+WIKIPEDIA_API_ENDPOINT = os.getenv("WIKIPEDIA_API_ENDPOINT", "https://en.wikipedia.org/w/api.php")
+WIKIPEDIA_USER_AGENT = os.getenv(
+    "WIKIPEDIA_USER_AGENT", "WikiLearn/0.1 (https://github.com/worldtruthfoundation/WikiLearn)"
+)
+WIKIPEDIA_CONNECT_TIMEOUT = float(os.getenv("WIKIPEDIA_CONNECT_TIMEOUT", 5))
+WIKIPEDIA_READ_TIMEOUT = float(os.getenv("WIKIPEDIA_READ_TIMEOUT", 20))
+# Keep-alive connections per worker process (>= gunicorn --threads)
+WIKIPEDIA_POOL_SIZE = int(os.getenv("WIKIPEDIA_POOL_SIZE", 10))
+WIKIPEDIA_MAX_RETRIES = int(os.getenv("WIKIPEDIA_MAX_RETRIES", 3))
+WIKIPEDIA_BACKOFF = float(os.getenv("WIKIPEDIA_BACKOFF", 0.5))
+
+# Full-article cache: entries younger than ARTICLE_CACHE_FRESH seconds are
+# served without asking Wikipedia; older ones are revalidated by revision id.
+# Set ARTICLE_CACHE_PATH to add an on-disk SQLite tier shared by workers.
+ARTICLE_CACHE_SIZE = int(os.getenv("ARTICLE_CACHE_SIZE", 500))
+ARTICLE_CACHE_FRESH = int(os.getenv("ARTICLE_CACHE_FRESH", 600))
+ARTICLE_CACHE_TTL = int(os.getenv("ARTICLE_CACHE_TTL", 7 * 24 * 3600))
+ARTICLE_CACHE_PATH = os.getenv("ARTICLE_CACHE_PATH", "")
+# Article pages render the lead and whole sections up to this many words;
+# later sections are fetched by the browser as they scroll into view
+ARTICLE_INLINE_WORDS = int(os.getenv("ARTICLE_INLINE_WORDS", 1500))
+# Threads per ASGI worker running the Flask routes that are not served
+# natively async (pages, search, job events); each request holds one
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 32))
+# Connections kept by the async client used in ASGI mode
+WIKIPEDIA_ASYNC_POOL_SIZE = int(os.getenv("WIKIPEDIA_ASYNC_POOL_SIZE", 100))
 
 # OpenAI API Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Connections kept by the AsyncOpenAI client used in ASGI mode
+OPENAI_ASYNC_POOL_SIZE = int(os.getenv("OPENAI_ASYNC_POOL_SIZE", 200))
+
+# Bump whenever a prompt template or the stored form of generations (see
+# rendering.py) changes so stale generations are not reused
+PROMPT_VERSION = "3"
+
+# Article text passed to the model: token budget and how long pages are
+# fitted into it ("truncate" section by section, or "map_reduce" to
+# condense very long pages with extra completions first)
+ARTICLE_CONTEXT_TOKENS = int(os.getenv("ARTICLE_CONTEXT_TOKENS", 3000))
+ARTICLE_CONTEXT_STRATEGY = os.getenv("ARTICLE_CONTEXT_STRATEGY", "truncate")
+
+# Name vocabulary candidates picked locally from the article (lexicon.py)
+# in lesson and vocabulary prompts, so the model does not have to search
+# the whole text for words at the learner's level
+PROMPT_VOCABULARY_HINTS = os.getenv("PROMPT_VOCABULARY_HINTS", "true").lower() == "true"
+
+# /api/generate-lesson-bundle: "parallel" (four concurrent generations) or
+# "combined" (one structured completion for all parts)
+LESSON_BUNDLE_MODE = os.getenv("LESSON_BUNDLE_MODE", "parallel")
+
+# Generation cache: "memory", "sqlite", "redis" or "none"
+GENERATION_CACHE_BACKEND = os.getenv("GENERATION_CACHE_BACKEND", "memory")
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", 7 * 24 * 3600))
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", 1000))
+GENERATION_CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", "generation_cache.sqlite3")
+GENERATION_CACHE_REDIS_URL = os.getenv("GENERATION_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Single-flight: identical concurrent generations share one upstream call.
+# Lock files coordinate gunicorn workers; pair with a shared cache backend.
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_DIR", "/tmp/wikilearn-locks")
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", 150))
+
+# OpenAI admission control shared by all workers on the host. RPM/TPM of 0
+# adopt the limits the API reports in its x-ratelimit-* headers.
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", 0))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", 0))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 64))
+GOVERNOR_PATH = os.getenv("GOVERNOR_PATH", "openai_governor.sqlite3")
+GOVERNOR_LOCK_DIR = os.getenv("GOVERNOR_LOCK_DIR", "/tmp/wikilearn-governor")
+# Longest a call waits for capacity (incl. 429 pauses) before falling back
+GOVERNOR_MAX_WAIT = float(os.getenv("GOVERNOR_MAX_WAIT", 60))
+# Share of the request/token buckets and concurrency slots that batch work
+# (pregenerate.py) leaves to interactive requests, in every process
+GOVERNOR_BATCH_RESERVE = float(os.getenv("GOVERNOR_BATCH_RESERVE", 0.25))
+
+# Deadlines: every web request gets REQUEST_DEADLINE seconds (clients may ask
+# for less with an X-Request-Timeout header). Each OpenAI attempt gets at most
+# OPENAI_ATTEMPT_TIMEOUT of what is left; timeouts, connection errors and 5xx
+# are retried up to OPENAI_MAX_ATTEMPTS times.
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 120))
+OPENAI_ATTEMPT_TIMEOUT = float(os.getenv("OPENAI_ATTEMPT_TIMEOUT", 90))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", 3))
+
+# Model routing: the chain is tried in order when a model keeps failing, and
+# slow calls are hedged with the next model. OPENAI_HEDGE_AFTER is "auto"
+# (the OPENAI_HEDGE_QUANTILE of recent latencies), a number of seconds, or
+# 0 for no hedging. Generations served by a fallback model are cached for
+# GENERATION_FALLBACK_TTL only, so the primary model gets another chance.
+# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+# do not change this unless explicitly requested by the user
+OPENAI_MODELS = [m.strip() for m in os.getenv("OPENAI_MODELS", "gpt-4o,gpt-4o-mini").split(",") if m.strip()]
+OPENAI_HEDGE_AFTER = os.getenv("OPENAI_HEDGE_AFTER", "auto")
+OPENAI_HEDGE_QUANTILE = float(os.getenv("OPENAI_HEDGE_QUANTILE", 0.95))
+GENERATION_FALLBACK_TTL = int(os.getenv("GENERATION_FALLBACK_TTL", 3600))
+
+# Background generation jobs (jobs.py). JOB_WORKERS threads per web process
+# run them; set it to 0 when a separate `python jobs.py` worker is used.
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_TTL = int(os.getenv("JOB_TTL", 24 * 3600))
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE", 360))
+# a running job whose worker has not finished it after this long is rerun
+JOB_LEASE = float(os.getenv("JOB_LEASE", 420))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+
+# Library of generated content (library.py): a SQLite file locally, a
+# postgresql:// DATABASE_URL in production. Rows are inserted in batches of
+# up to LIBRARY_BATCH, at least every LIBRARY_FLUSH_INTERVAL seconds.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///wikilearn.sqlite3")
+if DATABASE_URL.startswith("postgres://"):    # Heroku-style URL, rejected by SQLAlchemy
+    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
+LIBRARY_ENABLED = os.getenv("LIBRARY_ENABLED", "true").lower() == "true"
+LIBRARY_BATCH = int(os.getenv("LIBRARY_BATCH", 50))
+LIBRARY_FLUSH_INTERVAL = float(os.getenv("LIBRARY_FLUSH_INTERVAL", 2.0))
 
 # Categories and subcategories for navigation
 CATEGORIES = [
@@ -93,6 +206,54 @@ SUBCATEGORIES = {
     ]
 }
 
+# Precomputed category feeds (feed_index.py) served by /api/articles
+FEED_INDEX_ENABLED = os.getenv("FEED_INDEX_ENABLED", "true").lower() == "true"
+FEED_INDEX_PATH = os.getenv("FEED_INDEX_PATH", "feed_index.sqlite3")
+FEED_INDEX_TARGET = int(os.getenv("FEED_INDEX_TARGET", 200))     # cards per feed
+FEED_INDEX_BATCH = int(os.getenv("FEED_INDEX_BATCH", 20))        # search hits per request (<= 20)
+FEED_REFRESH_INTERVAL = float(os.getenv("FEED_REFRESH_INTERVAL", 2.0))  # seconds between requests
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", 10))
+# Live images_only pages: search windows fetched in parallel per round and
+# the time budget for filling one page
+FILL_PARALLELISM = int(os.getenv("FILL_PARALLELISM", 3))
+FILL_DEADLINE = float(os.getenv("FILL_DEADLINE", 4.0))
+
+# /api/search suggestions: a local prefix index of known titles, topped up
+# from Wikipedia's opensearch, whose answers are cached per query
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 10))                  # most results per query
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 5000))      # cached upstream queries
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 24 * 3600))
+SEARCH_INDEX_RELOAD = float(os.getenv("SEARCH_INDEX_RELOAD", 300))  # seconds between feed reloads
+SEARCH_UPSTREAM_TIMEOUT = float(os.getenv("SEARCH_UPSTREAM_TIMEOUT", 2.0))
+
+# HTTP caching (http_cache.py): Cache-Control max-age and
+# stale-while-revalidate seconds per kind of response, and how many
+# rendered pages each worker keeps in memory (0 = always render)
+PAGE_MAX_AGE = int(os.getenv("PAGE_MAX_AGE", 3600))               # category pages
+PAGE_STALE = int(os.getenv("PAGE_STALE", 24 * 3600))
+ARTICLE_MAX_AGE = int(os.getenv("ARTICLE_MAX_AGE", 600))          # article/summary/lesson pages
+ARTICLE_STALE = int(os.getenv("ARTICLE_STALE", 24 * 3600))
+FEED_MAX_AGE = int(os.getenv("FEED_MAX_AGE", 60))                 # /api/articles
+FEED_STALE = int(os.getenv("FEED_STALE", 600))
+SEARCH_MAX_AGE = int(os.getenv("SEARCH_MAX_AGE", 3600))           # /api/search
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", 512))
+
+# Response compression (compression.py): text-like bodies of at least
+# COMPRESS_MIN_SIZE bytes; brotli needs the optional `brotli` package
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "true").lower() == "true"
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 5))
+
+# Metrics for GET /metrics (metrics.py). Each process saves its counters to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds so a scrape of any worker
+# covers all of them; "" reports per process. TRACE_REQUESTS logs the spans
+# (upstream calls, generations) of each request taking TRACE_SLOW_MS or more.
+METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/wikilearn-metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "false").lower() == "true"
+TRACE_SLOW_MS = int(os.getenv("TRACE_SLOW_MS", 0))
+
 # English proficiency levels
 ENGLISH_LEVELS = {
     "elementary": "Elementary (A1-A2)",
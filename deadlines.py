@@ -0,0 +1,68 @@
+"""
+Per-request deadlines, carried in a context variable.
+
+The web entry points start a deadline for every request; everything below
+(single-flight waits, the governor queue, each OpenAI attempt's timeout)
+asks remaining() how long it may still take. Inner deadlines can only
+shorten an outer one. Work handed to a thread pool must be submitted with
+contextvars.copy_context().run to keep the deadline.
+"""
+import time
+import contextlib
+import contextvars
+
+from config import REQUEST_DEADLINE
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time"""
+
+
+def budget(requested=None):
+    """
+    Seconds for a web request: REQUEST_DEADLINE, or less if the client asked
+    for less (an X-Request-Timeout header value).
+    """
+    try:
+        seconds = float(requested)
+    except (TypeError, ValueError):
+        return REQUEST_DEADLINE
+    return min(max(seconds, 1.0), REQUEST_DEADLINE)
+
+
+def start(seconds):
+    """Set a deadline `seconds` from now (or keep a sooner one); returns a reset token"""
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires = min(expires, current)
+    return _deadline.set(expires)
+
+
+def reset(token):
+    _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def within(seconds):
+    token = start(seconds)
+    try:
+        yield
+    finally:
+        reset(token)
+
+
+def remaining(default=None):
+    """
+    Seconds left, capped at `default` (which is also the answer outside any
+    deadline). Raises DeadlineExceeded once the deadline has passed.
+    """
+    expires = _deadline.get()
+    if expires is None:
+        return default
+    left = expires - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return left if default is None else min(left, default)
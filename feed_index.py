@@ -0,0 +1,283 @@
+"""
+Precomputed article feeds for every (category, subcategory) in config.
+
+A background refresher fills each feed with article cards a window at a
+time and then keeps cycling through the windows to refresh them, issuing
+at most one Wikipedia request per FEED_REFRESH_INTERVAL. Feeds live in
+SQLite so every gunicorn worker serves the same index; only the worker
+holding the refresh lease talks to Wikipedia.
+
+/api/articles reads a page straight from the index through an opaque
+cursor and only falls back to a live search for feeds not built yet.
+
+    python feed_index.py            # build/refresh every feed once
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:                      # Windows: every worker refreshes
+    fcntl = None
+
+from config import (
+    SUBCATEGORIES, FEED_INDEX_PATH, FEED_INDEX_TARGET, FEED_INDEX_BATCH,
+    FEED_REFRESH_INTERVAL, FEED_PAGE_SIZE
+)
+from wikipedia_api import wiki, BASE_QUERY, _category_params, _parse_category_response
+
+log = logging.getLogger(__name__)
+
+CURSOR_PREFIX = "idx:"
+
+
+class FeedIndex:
+
+    def __init__(self, path=FEED_INDEX_PATH, target=FEED_INDEX_TARGET,
+                 batch=FEED_INDEX_BATCH, page_size=FEED_PAGE_SIZE):
+        self.path = path
+        self.target = target
+        self.batch = batch
+        self.page_size = page_size
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feeds ("
+                " category TEXT NOT NULL, subcategory TEXT NOT NULL,"
+                " cards TEXT NOT NULL,"
+                " next_offset INTEGER NOT NULL DEFAULT 0,"
+                " refresh_offset INTEGER NOT NULL DEFAULT 0,"
+                " exhausted INTEGER NOT NULL DEFAULT 0,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (category, subcategory))"
+            )
+        # (category, subcategory) -> (updated, cards); skips json.loads on repeat reads
+        self._memo = {}
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # -- reading ------------------------------------------------------
+
+    def _load(self, category, subcategory):
+        row = self._conn().execute(
+            "SELECT cards, next_offset, refresh_offset, exhausted, updated"
+            " FROM feeds WHERE category = ? AND subcategory = ?",
+            (category, subcategory),
+        ).fetchone()
+        if row is None:
+            return None
+        cards_json, next_offset, refresh_offset, exhausted, updated = row
+        memo = self._memo.get((category, subcategory))
+        if memo is not None and memo[0] == updated:
+            cards = memo[1]
+        else:
+            cards = json.loads(cards_json)
+            self._memo[(category, subcategory)] = (updated, cards)
+        return {
+            "cards": cards,
+            "next_offset": next_offset,
+            "refresh_offset": refresh_offset,
+            "exhausted": bool(exhausted),
+            "updated": updated,
+        }
+
+    def read(self, category, subcategory, images_only=False, continue_from=None):
+        """
+        One full page of cards from the index as (articles, continue token),
+        or None when the live search should be used instead (feed not built
+        yet, or a cursor that did not come from the index). A malformed
+        index cursor raises ValueError.
+        """
+        if continue_from and not continue_from.startswith(CURSOR_PREFIX):
+            return None
+        position = 0
+        if continue_from:
+            cursor = continue_from[len(CURSOR_PREFIX):]
+            if not cursor.isdigit():
+                raise ValueError(f"invalid continue token {continue_from!r}")
+            position = int(cursor)
+        feed = self._load(category, subcategory)
+        if feed is None or not feed["cards"]:
+            return None
+        cards = feed["cards"]
+        page = []
+        while position < len(cards) and len(page) < self.page_size:
+            card = cards[position]
+            position += 1
+            if images_only and not card["has_image"]:
+                continue
+            page.append({k: card[k] for k in ("id", "title", "extract", "image", "url")})
+
+        if position < len(cards):
+            token = f"{CURSOR_PREFIX}{position}"
+        elif not feed["exhausted"]:
+            # past the indexed part: hand over to the live search, on the query
+            # the index was built with
+            token = f"{BASE_QUERY}{feed['next_offset']}"
+        else:
+            token = None
+        return page, token
+
+    def cards(self):
+        """Every indexed card across all feeds"""
+        feeds = self._conn().execute("SELECT category, subcategory FROM feeds").fetchall()
+        for category, subcategory in feeds:
+            feed = self._load(category, subcategory)
+            if feed is not None:
+                yield from feed["cards"]
+
+    # -- building -----------------------------------------------------
+
+    def _fetch_window(self, category, subcategory, offset):
+        # the live search continues a handed-over feed with the same query
+        params = _category_params(category, subcategory, f"{BASE_QUERY}{offset}")
+        params.update({"gsrlimit": self.batch, "exlimit": self.batch})
+        data = wiki.query(params, endpoint="feed_index")
+        cards, token = _parse_category_response(data)
+        for card in cards:
+            card["has_image"] = bool(card["image"])
+            card["window"] = offset
+        return cards, int(token) if token is not None else None
+
+    def step(self, category, subcategory):
+        """
+        One upstream request for one feed: extend it until it reaches the
+        target size, then re-fetch its windows in rotation.
+        """
+        feed = self._load(category, subcategory) or {
+            "cards": [], "next_offset": 0, "refresh_offset": 0, "exhausted": False,
+        }
+        cards = list(feed["cards"])
+        growing = len(cards) < self.target and not feed["exhausted"]
+        offset = feed["next_offset"] if growing else feed["refresh_offset"]
+
+        fresh, next_token = self._fetch_window(category, subcategory, offset)
+
+        if growing:
+            seen = {c["id"] for c in cards}
+            cards.extend(c for c in fresh if c["id"] not in seen)
+            next_offset = next_token if next_token is not None else offset
+            exhausted = next_token is None
+            refresh_offset = feed["refresh_offset"]
+        else:
+            # replace the window in place, keeping the rest of the order
+            others = {c["id"] for c in cards if c["window"] != offset}
+            replacement = [c for c in fresh if c["id"] not in others]
+            first = next((i for i, c in enumerate(cards) if c["window"] == offset), len(cards))
+            cards = [c for c in cards[:first] if c["window"] != offset] + replacement + \
+                    [c for c in cards[first:] if c["window"] != offset]
+            next_offset, exhausted = feed["next_offset"], feed["exhausted"]
+            refresh_offset = offset + self.batch if offset + self.batch < next_offset else 0
+
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO feeds"
+                " (category, subcategory, cards, next_offset, refresh_offset, exhausted, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (category, subcategory, json.dumps(cards), next_offset,
+                 refresh_offset, int(exhausted), time.time()),
+            )
+
+    def next_feed(self):
+        """Feed most in need of work: missing, then short, then least recently updated"""
+        rows = {
+            (c, s): (n, e, u)
+            for c, s, n, e, u in self._conn().execute(
+                "SELECT category, subcategory, json_array_length(cards), exhausted, updated FROM feeds"
+            )
+        }
+        best, best_rank = None, None
+        for category, subs in SUBCATEGORIES.items():
+            for subcategory in subs:
+                row = rows.get((category, subcategory))
+                if row is None:
+                    rank = (0, 0, 0)
+                elif row[0] < self.target and not row[1]:
+                    rank = (1, row[0], row[2])
+                else:
+                    rank = (2, 0, row[2])
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = (category, subcategory), rank
+        return best
+
+    def stats(self):
+        feeds = cards = with_images = 0
+        for (raw,) in self._conn().execute("SELECT cards FROM feeds"):
+            items = json.loads(raw)
+            feeds += 1
+            cards += len(items)
+            with_images += sum(1 for c in items if c["has_image"])
+        return {"feeds": feeds, "cards": cards, "cards_with_images": with_images}
+
+
+class FeedRefresher(threading.Thread):
+    """
+    Daemon thread doing one FeedIndex.step per interval. Across workers
+    only the holder of an flock on <index>.lock refreshes.
+    """
+
+    def __init__(self, index, interval=FEED_REFRESH_INTERVAL):
+        super().__init__(name="feed-refresher", daemon=True)
+        self.index = index
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._lease = None
+
+    def _acquire_lease(self):
+        if fcntl is None:
+            return True
+        if self._lease is None:
+            self._lease = open(self.index.path + ".lock", "a")
+        try:
+            fcntl.flock(self._lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            if not self._acquire_lease():
+                continue
+            feed = self.index.next_feed()
+            if feed is None:
+                continue
+            try:
+                self.index.step(*feed)
+            except Exception as e:       # noqa: BLE001
+                log.warning("Feed refresh for %s/%s failed: %s", feed[0], feed[1], e)
+
+    def stop(self):
+        self._stopped.set()
+
+
+feed_index = FeedIndex()
+_refresher = None
+
+
+def start_refresher():
+    """Start the background refresher once per process"""
+    global _refresher
+    if _refresher is None:
+        _refresher = FeedRefresher(feed_index)
+        _refresher.start()
+    return _refresher
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for category, subs in SUBCATEGORIES.items():
+        for subcategory in subs:
+            for _ in range(-(-feed_index.target // feed_index.batch)):
+                feed_index.step(category, subcategory)
+                time.sleep(FEED_REFRESH_INTERVAL)
+            log.info("%s/%s indexed", category, subcategory)
+    log.info("%s", feed_index.stats())
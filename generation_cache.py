@@ -0,0 +1,243 @@
+import abc
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from config import (
+    GENERATION_CACHE_BACKEND, GENERATION_CACHE_TTL, GENERATION_CACHE_SIZE,
+    GENERATION_CACHE_PATH, GENERATION_CACHE_REDIS_URL, PROMPT_VERSION,
+)
+
+log = logging.getLogger(__name__)
+
+
+def make_key(model, prompt, **params):
+    """
+    Content-addressed key for a completion: hash of the rendered prompt
+    plus every model parameter that can change the output.
+    """
+    payload = json.dumps(
+        {"v": PROMPT_VERSION, "model": model, "prompt": prompt, "params": params},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BaseCache(abc.ABC):
+    """Common hit/miss bookkeeping; backends implement _get/_set/_delete."""
+
+    name = "base"
+    shared = False                       # visible to every worker on the host
+
+    def __init__(self, ttl=GENERATION_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            value = self._get(key)
+        except Exception as e:           # noqa: BLE001
+            log.warning("%s cache get failed: %s", self.name, e)
+            value = None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        try:
+            self._set(key, value, self.ttl if ttl is None else ttl)
+        except Exception as e:           # noqa: BLE001
+            log.warning("%s cache set failed: %s", self.name, e)
+
+    def delete(self, key):
+        try:
+            self._delete(key)
+        except Exception as e:           # noqa: BLE001
+            log.warning("%s cache delete failed: %s", self.name, e)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    @abc.abstractmethod
+    def _get(self, key):
+        """Stored value or None"""
+
+    @abc.abstractmethod
+    def _set(self, key, value, ttl):
+        """Store `value`; a ttl of 0 keeps it until evicted"""
+
+    @abc.abstractmethod
+    def _delete(self, key):
+        """Drop the entry if present"""
+
+
+class NullCache(BaseCache):
+    """Caching disabled: every lookup is a miss."""
+
+    name = "none"
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value, ttl):
+        pass
+
+    def _delete(self, key):
+        pass
+
+
+class MemoryCache(BaseCache):
+    """In-process LRU with per-entry expiry."""
+
+    name = "memory"
+
+    def __init__(self, maxsize=GENERATION_CACHE_SIZE, ttl=GENERATION_CACHE_TTL):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        expires = time.time() + ttl if ttl else 0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteCache(BaseCache):
+    """On-disk store shared by every gunicorn worker on the host."""
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path=GENERATION_CACHE_PATH, ttl=GENERATION_CACHE_TTL,
+                 table="generation_cache"):
+        super().__init__(ttl)
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _conn(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        row = self._conn().execute(
+            f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires and expires < time.time():
+            self._delete(key)
+            return None
+        return json.loads(value)
+
+    def _set(self, key, value, ttl):
+        expires = time.time() + ttl if ttl else 0
+        with self._conn() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+
+    def _delete(self, key):
+        with self._conn() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+
+class RedisCache(BaseCache):
+    """
+    Any server speaking the Redis protocol (Redis, KeyDB, a local stand-in).
+    Needs the optional `redis` package.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url=GENERATION_CACHE_REDIS_URL, ttl=GENERATION_CACHE_TTL,
+                 prefix="wikilearn:gen:"):
+        super().__init__(ttl)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("GENERATION_CACHE_BACKEND=redis requires the redis package") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=2)
+
+    def _get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def _set(self, key, value, ttl):
+        self._client.set(self.prefix + key, json.dumps(value), ex=int(ttl) or None)
+
+    def _delete(self, key):
+        self._client.delete(self.prefix + key)
+
+
+BACKENDS = {
+    "none": NullCache,
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+    "redis": RedisCache,
+}
+
+
+def build_cache(backend=GENERATION_CACHE_BACKEND):
+    """Instantiate the configured backend, falling back to memory on error."""
+    cls = BACKENDS.get(backend)
+    if cls is None:
+        log.warning("Unknown cache backend %r, using memory", backend)
+        cls = MemoryCache
+    try:
+        return cls()
+    except Exception as e:               # noqa: BLE001
+        log.error("Could not start %s cache (%s), using memory", backend, e)
+        return MemoryCache()
+
+
+generation_cache = build_cache()
@@ -0,0 +1,421 @@
+"""
+Admission control for OpenAI calls, shared by every gunicorn worker.
+
+Each completion needs a permit before it is sent:
+
+* a request and a token bucket (OPENAI_RPM / OPENAI_TPM, refilled
+  continuously, token cost estimated from the prompt plus max_tokens and
+  corrected from the reported usage afterwards). The buckets live in a
+  small SQLite file so all workers on the host draw from the same quota;
+  a limit of 0 means "learn it from the x-ratelimit-* response headers".
+* one of OPENAI_MAX_CONCURRENCY slots, each an flock on a lock file.
+
+Waiters of one worker are served in priority order, interactive requests
+before batch work (pregenerate.py). Batch work, wherever it runs, also
+leaves GOVERNOR_BATCH_RESERVE of each bucket and of the slots to
+interactive calls: it waits while a bucket is below that level and only
+takes the lower-numbered slots. Response headers tighten the buckets
+to what the API says is left; a 429 pauses every worker until the reset
+time and the call is retried instead of degrading to fallback content.
+"""
+import os
+import re
+import time
+import heapq
+import sqlite3
+import asyncio
+import logging
+import itertools
+import threading
+import contextlib
+import contextvars
+
+try:
+    import fcntl
+except ImportError:                      # Windows: concurrency is limited per process
+    fcntl = None
+
+from deadlines import remaining
+from config import (
+    OPENAI_RPM, OPENAI_TPM, OPENAI_MAX_CONCURRENCY, GOVERNOR_PATH, GOVERNOR_LOCK_DIR,
+    GOVERNOR_MAX_WAIT, GOVERNOR_BATCH_RESERVE,
+)
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE, BATCH = 0, 1
+_priority = contextvars.ContextVar("openai_priority", default=INTERACTIVE)
+
+# longest single sleep while queued, so new arrivals and releases are noticed
+POLL = 0.05
+# pause after a 429 that carries no reset hint, doubled per attempt
+BACKOFF = 1.0
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+@contextlib.contextmanager
+def batch_priority():
+    """Let interactive requests go first for OpenAI calls made in this block"""
+    token = _priority.set(BATCH)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class GovernorTimeout(RuntimeError):
+    """No permit within GOVERNOR_MAX_WAIT"""
+
+
+def parse_duration(value):
+    """Seconds from a reset header: '1s', '6m0s', '20ms' or a plain number"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_RE.findall(value)
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in parts) if parts else None
+
+
+class Permit:
+    """One admitted call: a concurrency slot plus the tokens it was charged"""
+
+    def __init__(self, governor, slot, estimate):
+        self.governor = governor
+        self.slot = slot
+        self.estimate = estimate
+        self.held = False
+        self._released = False
+
+    def hold(self):
+        """Keep the slot past run() (streams release it when they finish)"""
+        self.held = True
+        return self
+
+    def settle(self, headers=None, used_tokens=None):
+        """Correct the charge from the real usage and learn from rate-limit headers"""
+        if used_tokens is not None and used_tokens < self.estimate:
+            self.governor._refund(self.estimate - used_tokens)
+        if headers is not None:
+            self.governor.observe(headers)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.governor._release_slot(self.slot)
+
+
+class Governor:
+
+    def __init__(self, path=GOVERNOR_PATH, lock_dir=GOVERNOR_LOCK_DIR, rpm=OPENAI_RPM,
+                 tpm=OPENAI_TPM, concurrency=OPENAI_MAX_CONCURRENCY, max_wait=GOVERNOR_MAX_WAIT,
+                 batch_reserve=GOVERNOR_BATCH_RESERVE):
+        self.path = path
+        self.lock_dir = lock_dir
+        self.limits = {"requests": rpm, "tokens": tpm}
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self.batch_reserve = batch_reserve
+        # slots only interactive calls take; batch work always keeps one
+        self.batch_slots = max(1, concurrency - int(concurrency * batch_reserve))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queue = []                 # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._held = set()               # slots this process holds
+        self._slot_files = {}
+        self.admitted = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        if fcntl is not None and lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY, capacity REAL NOT NULL,"
+                " level REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            now = time.time()
+            for name, limit in self.limits.items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, ?)", (name, limit, limit, now)
+                )
+                if limit:
+                    # configured limits win over anything learned earlier
+                    conn.execute("UPDATE buckets SET capacity = ? WHERE name = ?", (limit, name))
+            conn.execute("INSERT OR IGNORE INTO buckets VALUES ('pause', 0, 0, ?)", (now,))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # -- shared buckets -----------------------------------------------
+
+    @staticmethod
+    def _refill(capacity, level, updated, now):
+        return min(capacity, level + (now - updated) * capacity / 60.0)
+
+    def _take(self, estimate, reserve=0.0):
+        """
+        Charge one request and `estimate` tokens; 0 if taken, else seconds to
+        wait. `reserve` is the share of each bucket that has to stay left.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = {name: (capacity, level, updated) for name, capacity, level, updated
+                    in conn.execute("SELECT name, capacity, level, updated FROM buckets")}
+            pause_until = rows["pause"][1]
+            if pause_until > now:
+                return pause_until - now
+            need = {"requests": 1, "tokens": estimate}
+            levels, wait = {}, 0.0
+            for name, amount in need.items():
+                capacity, level, updated = rows[name]
+                if not capacity:
+                    continue             # unlimited / not learned yet
+                level = levels[name] = self._refill(capacity, level, updated, now)
+                amount = min(amount, capacity)
+                short = amount + reserve * capacity - level
+                if short > 0:
+                    wait = max(wait, short * 60.0 / capacity)
+            if wait:
+                return wait
+            for name, level in levels.items():
+                conn.execute("UPDATE buckets SET level = ?, updated = ? WHERE name = ?",
+                             (level - min(need[name], rows[name][0]), now, name))
+        return 0.0
+
+    def _refund(self, tokens):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE buckets SET level = MIN(capacity, level + ?) WHERE name = 'tokens' AND capacity > 0",
+                (tokens,),
+            )
+
+    def observe(self, headers):
+        """Adopt the limits and remaining quota reported by the API"""
+        now = time.time()
+        pause = 0.0
+        with self._transaction() as conn:
+            for name in ("requests", "tokens"):
+                limit = headers.get(f"x-ratelimit-limit-{name}")
+                left = headers.get(f"x-ratelimit-remaining-{name}")
+                if limit is None or left is None:
+                    continue
+                capacity, level, updated = conn.execute(
+                    "SELECT capacity, level, updated FROM buckets WHERE name = ?", (name,)
+                ).fetchone()
+                if not self.limits[name]:
+                    if not capacity:
+                        level, updated = float(limit), now
+                    capacity = float(limit)
+                level = min(self._refill(capacity, level, updated, now), float(left))
+                conn.execute("UPDATE buckets SET capacity = ?, level = ?, updated = ? WHERE name = ?",
+                             (capacity, level, now, name))
+                if float(left) <= 0:
+                    pause = max(pause, parse_duration(headers.get(f"x-ratelimit-reset-{name}")) or 0)
+        if pause:
+            self._pause(pause)
+
+    def _pause(self, seconds):
+        with self._transaction() as conn:
+            conn.execute("UPDATE buckets SET level = MAX(level, ?) WHERE name = 'pause'",
+                         (time.time() + seconds,))
+
+    def backoff(self, error, attempt, wait_until):
+        """
+        After a 429: pause every worker until the reset time and return True
+        if the call should be retried before `wait_until` (monotonic).
+        """
+        with self._lock:
+            self.throttled += 1
+        if getattr(error, "code", None) == "insufficient_quota":
+            return False                 # billing, not rate: waiting will not help
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        seconds = (parse_duration(headers.get("retry-after"))
+                   or max(parse_duration(headers.get("x-ratelimit-reset-requests")) or 0,
+                          parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0)
+                   or BACKOFF * 2 ** attempt)
+        if time.monotonic() + seconds > wait_until:
+            return False
+        log.warning("OpenAI rate limited, pausing all workers for %.1fs", seconds)
+        self._pause(seconds)
+        return True
+
+    # -- concurrency slots --------------------------------------------
+
+    def _claim_slot(self, priority=INTERACTIVE):
+        slots = self.concurrency if priority == INTERACTIVE else self.batch_slots
+        with self._lock:
+            free = [s for s in range(slots) if s not in self._held]
+            if fcntl is None or not self.lock_dir:
+                slot = free[0] if free else None
+                if slot is not None:
+                    self._held.add(slot)
+                return slot
+            for slot in free:
+                f = self._slot_files.get(slot)
+                if f is None:
+                    f = self._slot_files[slot] = open(
+                        os.path.join(self.lock_dir, f"slot-{slot}.lock"), "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue             # held by another worker
+                self._held.add(slot)
+                return slot
+        return None
+
+    def _release_slot(self, slot):
+        with self._cond:
+            self._held.discard(slot)
+            f = self._slot_files.get(slot)
+            if f is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            self._cond.notify_all()
+
+    # -- admission ----------------------------------------------------
+
+    def _attempt(self, ticket, estimate):
+        """(permit, 0) when admitted, else (None, seconds to wait)"""
+        with self._lock:
+            if self._queue[0] != ticket:
+                return None, POLL        # someone more urgent is first
+        priority = ticket[0]
+        slot = self._claim_slot(priority)
+        if slot is None:
+            return None, POLL
+        try:
+            wait = self._take(estimate, self.batch_reserve if priority != INTERACTIVE else 0.0)
+        except Exception:
+            self._release_slot(slot)
+            raise
+        if wait:
+            self._release_slot(slot)
+            return None, min(wait, 1.0)
+        return Permit(self, slot, estimate), 0.0
+
+    def _enqueue(self, priority):
+        ticket = (_priority.get() if priority is None else priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _dequeue(self, ticket, started, admitted):
+        with self._cond:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self.wait_seconds += time.monotonic() - started
+            if admitted:
+                self.admitted += 1
+            else:
+                self.timeouts += 1
+            self._cond.notify_all()
+
+    def acquire(self, estimate, priority=None):
+        """Block until a call costing about `estimate` tokens may be sent"""
+        started = time.monotonic()
+        wait_until = started + remaining(self.max_wait)
+        ticket = self._enqueue(priority)
+        permit = None
+        try:
+            while permit is None:
+                permit, wait = self._attempt(ticket, estimate)
+                if permit is None:
+                    if time.monotonic() + wait > wait_until:
+                        raise GovernorTimeout(f"no OpenAI capacity within {wait_until - started:.0f}s")
+                    with self._cond:
+                        self._cond.wait(wait)
+            return permit
+        finally:
+            self._dequeue(ticket, started, permit is not None)
+
+    async def aacquire(self, estimate, priority=None):
+        """acquire() for the event loop; the SQLite and flock work runs in a thread"""
+        started = time.monotonic()
+        wait_until = started + remaining(self.max_wait)
+        ticket = self._enqueue(priority)
+        permit = None
+        try:
+            while permit is None:
+                permit, wait = await asyncio.to_thread(self._attempt, ticket, estimate)
+                if permit is None:
+                    if time.monotonic() + wait > wait_until:
+                        raise GovernorTimeout(f"no OpenAI capacity within {wait_until - started:.0f}s")
+                    await asyncio.sleep(wait)
+            return permit
+        finally:
+            self._dequeue(ticket, started, permit is not None)
+
+    def run(self, fn, estimate, priority=None):
+        """fn(permit) under a permit, retried after 429s while max_wait and the deadline allow"""
+        wait_until = time.monotonic() + remaining(self.max_wait)
+        for attempt in itertools.count():
+            permit = self.acquire(estimate, priority)
+            try:
+                return fn(permit)
+            except Exception as e:
+                if getattr(e, "status_code", None) != 429 or not self.backoff(e, attempt, wait_until):
+                    raise
+            finally:
+                if not permit.held:
+                    permit.release()
+
+    async def arun(self, fn, estimate, priority=None):
+        """Async run(); fn(permit) returns an awaitable"""
+        wait_until = time.monotonic() + remaining(self.max_wait)
+        for attempt in itertools.count():
+            permit = await self.aacquire(estimate, priority)
+            try:
+                return await fn(permit)
+            except Exception as e:
+                if (getattr(e, "status_code", None) != 429
+                        or not await asyncio.to_thread(self.backoff, e, attempt, wait_until)):
+                    raise
+            finally:
+                if not permit.held:
+                    permit.release()
+
+    def stats(self):
+        buckets = {
+            name: {"capacity": capacity, "level": round(level, 1)}
+            for name, capacity, level in self._conn().execute(
+                "SELECT name, capacity, level FROM buckets WHERE name != 'pause'")
+        }
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "throttled": self.throttled,
+                "timeouts": self.timeouts,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "queued": len(self._queue),
+                "slots_held": len(self._held),
+                "concurrency": self.concurrency,
+                "batch_slots": self.batch_slots,
+                "buckets": buckets,
+            }
+
+
+governor = Governor()
@@ -0,0 +1,137 @@
+"""
+HTTP caching for pages and GET APIs.
+
+Every cacheable response carries a strong ETag and a Cache-Control policy
+with stale-while-revalidate, so browsers and any CDN in front of us reuse
+it and revalidate with If-None-Match; a match is answered 304 without a
+body. Page ETags are computed from what goes into the page (the article
+revision when there is one) before rendering, so a 304 skips the template
+as well, and rendered HTML is kept per ETag for the next client that does
+not have it yet. JSON APIs get an ETag from their body.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from flask import Response, render_template, request
+from werkzeug.http import parse_etags
+
+from config import (
+    PAGE_MAX_AGE, PAGE_STALE, ARTICLE_MAX_AGE, ARTICLE_STALE, FEED_MAX_AGE, FEED_STALE,
+    SEARCH_MAX_AGE, FRAGMENT_CACHE_SIZE
+)
+import assets
+from generation_cache import MemoryCache
+
+log = logging.getLogger(__name__)
+
+POLICIES = {
+    "page": f"public, max-age={PAGE_MAX_AGE}, stale-while-revalidate={PAGE_STALE}",
+    "article": f"public, max-age={ARTICLE_MAX_AGE}, stale-while-revalidate={ARTICLE_STALE}",
+    "feed": f"public, max-age={FEED_MAX_AGE}, stale-while-revalidate={FEED_STALE}",
+    "search": f"public, max-age={SEARCH_MAX_AGE}",
+    "no-store": "no-store",
+}
+
+# Flask endpoint -> policy for responses the route did not label itself
+ENDPOINT_POLICIES = {
+    "index": "page",
+    "subcategories": "page",
+    "articles": "page",
+    "article": "article",
+    "summary": "article",
+    "lesson": "article",
+    "api_article_sections": "article",
+    "api_article_section": "article",
+    "api_articles": "feed",
+    "api_search": "search",
+    "api_library": "feed",
+    "api_library_item": "feed",          # a fallback's row is replaced by the primary's
+    "api_library_latest": "feed",
+    "api_job": "no-store",
+    "api_cache_stats": "no-store",
+    "api_wikipedia_stats": "no-store",
+    "metrics_endpoint": "no-store",
+}
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+
+def _template_version():
+    """Hash of every template, so a deploy that changes one changes every page ETag"""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+            digest.update(name.encode() + b"\0" + f.read())
+    return digest.hexdigest()[:16]
+
+
+TEMPLATE_VERSION = _template_version()
+# pages link the hashed asset names, so a new asset build changes every page
+ASSET_VERSION = hashlib.sha256(json.dumps(assets.manifest, sort_keys=True).encode()).hexdigest()[:16]
+fragments = MemoryCache(maxsize=FRAGMENT_CACHE_SIZE, ttl=0)
+
+
+def make_etag(*parts):
+    """Strong validator (unquoted) for the JSON-serializable `parts` or raw bytes"""
+    if len(parts) == 1 and isinstance(parts[0], bytes):
+        payload = parts[0]
+    else:
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def not_modified(if_none_match, etag):
+    """Whether an If-None-Match header value matches `etag` (weak comparison, RFC 9110)"""
+    return bool(if_none_match) and parse_etags(if_none_match).contains_weak(etag)
+
+
+def cached_page(policy, template, version=None, **context):
+    """
+    render_template with a strong ETag: 304 when the client already has it,
+    otherwise the HTML rendered for that ETag before, or a fresh render.
+    `version` identifies the content (e.g. an article revision); without it
+    the whole context is hashed.
+    """
+    etag = make_etag(
+        template, TEMPLATE_VERSION, ASSET_VERSION, request.path,
+        version if version is not None else context,
+    )
+    if not_modified(request.headers.get("If-None-Match"), etag):
+        response = Response(status=304)
+    else:
+        html = fragments.get(etag)
+        if html is None:
+            html = render_template(template, **context)
+            fragments.set(etag, html)
+        response = Response(html, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = POLICIES[policy]
+    return response
+
+
+def apply_policy(response):
+    """
+    after_request hook: label GET responses with their endpoint's policy
+    and answer conditional requests for cacheable ones without an ETag yet.
+    """
+    if request.method not in ("GET", "HEAD") or "Cache-Control" in response.headers:
+        return response
+    policy = ENDPOINT_POLICIES.get(request.endpoint)
+    if policy is None:
+        return response
+    if response.status_code not in (200, 304):
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    response.headers["Cache-Control"] = POLICIES[policy]
+    if (policy != "no-store" and response.status_code == 200 and not response.is_streamed
+            and not response.get_etag()[0]):
+        response.set_etag(make_etag(response.get_data()))
+        response.make_conditional(request)
+    return response
+
+
+def stats():
+    return {"template_version": TEMPLATE_VERSION, "asset_version": ASSET_VERSION,
+            "fragments": fragments.stats()}
@@ -0,0 +1,333 @@
+"""
+Background generation jobs.
+
+POST /api/jobs, or any POST /api/generate-* sent with
+"Prefer: respond-async", stores a job and answers 202 with its id at once.
+Worker threads run it: JOB_WORKERS in every web process, or a dedicated
+process started with
+
+    python jobs.py
+
+The client polls GET /api/jobs/<id>, or follows /api/jobs/<id>/events.
+
+Jobs live in SQLite, so every process sees the same queue. A job is keyed
+by what it generates, so identical requests share one job while it is
+queued, running or done. Results expire after JOB_TTL. Queued jobs survive
+a restart, and a job whose worker died is picked up again once its lease
+runs out.
+"""
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import sqlite3
+import threading
+import contextlib
+
+import deadlines
+from config import (
+    JOB_STORE_PATH, JOB_WORKERS, JOB_TTL, JOB_DEADLINE, JOB_LEASE, JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL, LESSON_BUNDLE_MODE, PROMPT_VERSION
+)
+from openai_service import generate_part, generate_lesson_bundle, EXERCISE_TYPES
+from wikipedia_api import get_full_article
+
+log = logging.getLogger(__name__)
+
+# seconds before a failed job is retried, doubled per attempt
+RETRY_DELAY = 5.0
+# how often an idle worker deletes expired jobs
+PURGE_EVERY = 300
+
+
+def _article_text(title):
+    """Same as routes._article_text"""
+    try:
+        return get_full_article(title).get("content")
+    except Exception as e:               # noqa: BLE001
+        log.warning(f"No article text for {title!r}, generating from title only: {e}")
+        return None
+
+
+def _run_summary(p):
+    title = p["article_title"]
+    return {"summary": generate_part("summary", title, p["english_level"], _article_text(title))}
+
+
+def _run_lesson(p):
+    title = p["article_title"]
+    return {"lesson": generate_part("lesson", title, p["english_level"], _article_text(title))}
+
+
+def _run_exercise(p):
+    title = p["article_title"]
+    return {"exercise": generate_part(p["exercise_type"], title, p["english_level"], _article_text(title))}
+
+
+def _run_lesson_bundle(p):
+    title = p["article_title"]
+    return {"bundle": generate_lesson_bundle(title, p["english_level"], _article_text(title), mode=p["mode"],
+                                             strict=True)}
+
+
+HANDLERS = {
+    "summary": _run_summary,
+    "lesson": _run_lesson,
+    "exercise": _run_exercise,
+    "lesson_bundle": _run_lesson_bundle,
+}
+
+
+def job_params(kind, data):
+    """The parameters that identify a job of `kind`, from a request body"""
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job kind {kind!r}")
+    title = data.get("article_title")
+    if not title:
+        raise ValueError("article_title is required")
+    params = {"article_title": title, "english_level": data.get("english_level", "intermediate")}
+    if kind == "exercise":
+        params["exercise_type"] = data.get("exercise_type", "extra")
+        if params["exercise_type"] not in EXERCISE_TYPES:
+            raise ValueError(f"unknown exercise_type {params['exercise_type']!r}")
+    if kind == "lesson_bundle":
+        params["mode"] = data.get("mode", LESSON_BUNDLE_MODE)
+    return params
+
+
+def job_key(kind, params):
+    # new prompts must not be answered with a job done under the old ones
+    payload = json.dumps({"v": PROMPT_VERSION, "kind": kind, "params": params},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+
+    COLUMNS = ("id", "key", "kind", "params", "status", "result", "error", "attempts",
+               "created", "updated", "expires", "not_before", "lease_until", "owner")
+
+    def __init__(self, path=JOB_STORE_PATH, ttl=JOB_TTL, lease=JOB_LEASE,
+                 max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, key TEXT NOT NULL UNIQUE, kind TEXT NOT NULL,"
+            " params TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL, updated REAL NOT NULL, expires REAL NOT NULL,"
+            " not_before REAL NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0,"
+            " owner TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _row(self, conn, where, args):
+        row = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE {where}", args).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    @staticmethod
+    def public(job):
+        """The JSON a client sees"""
+        out = {
+            "id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "params": json.loads(job["params"]),
+            "created": job["created"],
+            "updated": job["updated"],
+        }
+        if job["status"] == "done":
+            out["result"] = json.loads(job["result"])
+        if job["error"]:
+            out["error"] = job["error"]
+        return out
+
+    # -- producer side ------------------------------------------------
+
+    def enqueue(self, kind, params):
+        """The live job for these parameters, creating it if there is none"""
+        key = job_key(kind, params)
+        now = time.time()
+        with self._transaction() as conn:
+            job = self._row(conn, "key = ?", (key,))
+            if job and job["status"] != "failed" and job["expires"] > now:
+                return job
+            job = {
+                "id": uuid.uuid4().hex, "key": key, "kind": kind, "params": json.dumps(params),
+                "status": "queued", "result": None, "error": None, "attempts": 0,
+                "created": now, "updated": now, "expires": now + self.ttl,
+                "not_before": 0, "lease_until": 0, "owner": None,
+            }
+            conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                [job[c] for c in self.COLUMNS],
+            )
+        return job
+
+    def get(self, job_id):
+        job = self._row(self._conn(), "id = ?", (job_id,))
+        if job is None or job["expires"] < time.time():
+            return None
+        return job
+
+    # -- worker side --------------------------------------------------
+
+    def claim(self, owner):
+        """Lease the oldest runnable job (queued, or running with a lapsed lease)"""
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                job = self._row(
+                    conn,
+                    "(status = 'queued' AND not_before <= ?) OR (status = 'running' AND lease_until < ?)"
+                    " ORDER BY created LIMIT 1",
+                    (now, now),
+                )
+                if job is None:
+                    return None
+                if job["attempts"] >= self.max_attempts:
+                    # its last worker died mid-run
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                        (job["error"] or "worker lost", now, job["id"]),
+                    )
+                    continue
+                job.update(status="running", attempts=job["attempts"] + 1,
+                           lease_until=now + self.lease, owner=owner, updated=now)
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = ?, lease_until = ?, owner = ?, updated = ?"
+                    " WHERE id = ?",
+                    (job["status"], job["attempts"], job["lease_until"], owner, now, job["id"]),
+                )
+                return job
+
+    def finish(self, job, result):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated = ?, expires = ?"
+                " WHERE id = ? AND owner = ?",
+                (json.dumps(result), now, now + self.ttl, job["id"], job["owner"]),
+            )
+
+    def fail(self, job, error):
+        """Requeue with a delay, or give up after max_attempts"""
+        now = time.time()
+        if job["attempts"] < self.max_attempts:
+            status, not_before = "queued", now + RETRY_DELAY * 2 ** (job["attempts"] - 1)
+        else:
+            status, not_before = "failed", 0
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, not_before = ?, updated = ?"
+                " WHERE id = ? AND owner = ?",
+                (status, str(error), not_before, now, job["id"], job["owner"]),
+            )
+
+    def purge(self):
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM jobs WHERE expires < ?", (time.time(),)).rowcount
+
+    def stats(self):
+        counts = dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")}
+
+
+class JobWorker(threading.Thread):
+    """Runs jobs from the store until stopped"""
+
+    def __init__(self, store, n=0, poll=JOB_POLL_INTERVAL):
+        super().__init__(name=f"job-worker-{n}", daemon=True)
+        self.store = store
+        self.poll = poll
+        self.owner = f"{socket.gethostname()}:{id(self):x}:{n}"
+        self._stopped = threading.Event()
+        self._last_purge = 0.0
+
+    def run_one(self):
+        """Run one job if there is one; returns whether there was"""
+        job = self.store.claim(self.owner)
+        if job is None:
+            return False
+        params = json.loads(job["params"])
+        try:
+            with deadlines.within(JOB_DEADLINE):
+                result = HANDLERS[job["kind"]](params)
+        except Exception as e:           # noqa: BLE001
+            log.warning("Job %s (%s) attempt %d failed: %s", job["id"], job["kind"], job["attempts"], e)
+            self.store.fail(job, e)
+        else:
+            self.store.finish(job, result)
+        return True
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.run_one():
+                    continue
+                if time.time() - self._last_purge > PURGE_EVERY:
+                    self._last_purge = time.time()
+                    self.store.purge()
+            except Exception as e:       # noqa: BLE001
+                log.error("Job worker error: %s", e)
+            self._stopped.wait(self.poll)
+
+    def stop(self):
+        self._stopped.set()
+
+
+job_store = JobStore()
+_workers = []
+
+
+def start_workers(count=JOB_WORKERS):
+    """Start the job worker threads once per process"""
+    if not _workers:
+        for n in range(count):
+            worker = JobWorker(job_store, n)
+            worker.start()
+            _workers.append(worker)
+    return _workers
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    workers = [JobWorker(job_store, n) for n in range(max(JOB_WORKERS, 1))]
+    for worker in workers:
+        worker.start()
+    log.info("%d job workers running on %s", len(workers), JOB_STORE_PATH)
+    try:
+        while True:
+            time.sleep(60)
+            log.info("%s", job_store.stats())
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,362 @@
+"""
+Local lexical analysis of article text, in milliseconds and without a
+model call.
+
+- the cleaned extract (reference sections dropped) is split into sentences
+  and tokenized in one compiled-regex pass per sentence; every token is
+  reduced to a lemma and looked up in a bundled word list
+  (data/cefr_words.txt) for its CEFR level, words not listed count as C2
+- readability: Flesch reading ease, Flesch-Kincaid grade, words per
+  sentence, the share of running words at each level (names left out) and
+  the level that covers 95% of them
+- vocabulary(level): candidate words for an ENGLISH_LEVELS entry, from
+  the band just above what such a learner already knows, most frequent in
+  the article first, each with a gap-fill sentence taken from the article
+- verb_gaps() and fact_gaps(): gap-fill sentences for past verb forms and
+  for the dates and numbers in the article
+
+openai_service builds article-specific fallback lessons and exercises
+from it, and hands the model a vocabulary shortlist (PROMPT_VOCABULARY_HINTS).
+"""
+import os
+import re
+import logging
+import functools
+from collections import Counter
+
+from prompt_context import clean_article_text, split_sections, _drop_skipped, SENTENCE_RE
+
+log = logging.getLogger(__name__)
+
+WORDLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cefr_words.txt")
+LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+# Share of running words a reader has to know to follow a text
+COVERAGE = 0.95
+
+# ENGLISH_LEVELS entry -> CEFR levels to teach, in order of preference
+TARGET_LEVELS = {
+    "elementary": ("A2", "B1"),
+    "intermediate": ("B2", "B1", "C1"),
+    "professional": ("C1", "C2", "B2"),
+}
+# Words per gap-fill sentence a learner at that level can handle
+SENTENCE_WORDS = {
+    "elementary": (5, 18),
+    "intermediate": (6, 28),
+    "professional": (6, 40),
+}
+BLANK = "_____"
+
+TOKEN_RE = re.compile(r"[A-Za-z]+(?:['-][A-Za-z]+)*")
+VOWELS_RE = re.compile(r"[aeiouy]+")
+NUMBER_RE = re.compile(r"\b(?:1[0-9]{3}|20[0-9]{2}|\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\b")
+# forms bearing the past-tense / past-participle grammar point
+IRREGULAR_PAST = {
+    "was": "be", "were": "be", "been": "be", "had": "have", "did": "do", "done": "do",
+    "went": "go", "gone": "go", "made": "make", "said": "say", "took": "take", "taken": "take",
+    "came": "come", "saw": "see", "seen": "see", "knew": "know", "known": "know", "got": "get",
+    "gave": "give", "given": "give", "found": "find", "thought": "think", "told": "tell",
+    "became": "become", "left": "leave", "felt": "feel", "brought": "bring", "began": "begin",
+    "begun": "begin", "kept": "keep", "held": "hold", "wrote": "write", "written": "write",
+    "stood": "stand", "heard": "hear", "meant": "mean", "met": "meet", "ran": "run", "paid": "pay",
+    "sat": "sit", "spoke": "speak", "spoken": "speak", "led": "lead", "grew": "grow",
+    "grown": "grow", "lost": "lose", "fell": "fall", "fallen": "fall", "sent": "send",
+    "built": "build", "understood": "understand", "drew": "draw", "drawn": "draw",
+    "broke": "break", "broken": "break", "spent": "spend", "rose": "rise", "risen": "rise",
+    "drove": "drive", "driven": "drive", "bought": "buy", "wore": "wear", "worn": "wear",
+    "chose": "choose", "chosen": "choose", "sought": "seek", "fought": "fight", "threw": "throw",
+    "thrown": "throw", "caught": "catch", "taught": "teach", "sold": "sell", "won": "win",
+    "flew": "fly", "flown": "fly", "shot": "shoot", "struck": "strike", "hung": "hang",
+    "hid": "hide", "hidden": "hide", "forgot": "forget", "forgotten": "forget", "ate": "eat",
+    "eaten": "eat", "swam": "swim", "sang": "sing", "sung": "sing", "drank": "drink",
+    "slept": "sleep", "woke": "wake", "fed": "feed", "fled": "flee", "bore": "bear",
+    "borne": "bear", "dealt": "deal", "sank": "sink", "sunk": "sink", "stole": "steal",
+    "stolen": "steal", "froze": "freeze", "frozen": "freeze", "shook": "shake", "rode": "ride",
+    "ridden": "ride", "withdrew": "withdraw", "withdrawn": "withdraw", "overcame": "overcome",
+    "undertook": "undertake", "undertaken": "undertake", "arose": "arise", "arisen": "arise",
+    "forbade": "forbid", "forbidden": "forbid", "bent": "bend", "lent": "lend",
+    "beaten": "beat", "dug": "dig", "swept": "sweep", "lit": "light", "spun": "spin",
+    "stuck": "stick", "strove": "strive", "laid": "lay",
+}
+IRREGULAR_OTHER = {
+    "is": "be", "are": "be", "am": "be", "being": "be", "has": "have", "does": "do",
+    "men": "man", "women": "woman", "children": "child", "feet": "foot", "teeth": "tooth",
+    "mice": "mouse", "better": "good", "best": "good", "worse": "bad", "worst": "bad",
+    "lives": "life", "wives": "wife", "knives": "knife", "leaves": "leaf", "halves": "half",
+    "data": "data", "media": "media", "criteria": "criterion", "phenomena": "phenomenon",
+}
+# auxiliaries before a past participle: passive or perfect, not past simple
+AUXILIARIES = {"is", "are", "was", "were", "be", "been", "being", "has", "have", "had"}
+
+
+@functools.lru_cache(maxsize=1)
+def wordlist():
+    """{headword: CEFR level}, the first (lowest) level a word is listed at"""
+    levels = {}
+    level = None
+    with open(WORDLIST_PATH, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                level = line[1:-1]
+                continue
+            for word in line.split():
+                levels.setdefault(word, level)
+    log.info("Loaded %d headwords from %s", len(levels), WORDLIST_PATH)
+    return levels
+
+
+def _stems(word):
+    """Candidate base forms of an inflected word, most likely first"""
+    if word.endswith("ies") or word.endswith("ied"):
+        yield word[:-3] + "y"
+    if word.endswith("ier"):
+        yield word[:-3] + "y"
+    if word.endswith("iest") or word.endswith("ily"):
+        yield word[:-4 if word.endswith("iest") else -3] + "y"
+    for suffix in ("ing", "ed", "est", "er"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            stem = word[:-len(suffix)]
+            yield stem
+            yield stem + "e"
+            if len(stem) > 2 and stem[-1] == stem[-2]:
+                yield stem[:-1]          # stopped -> stop
+    if word.endswith("es"):
+        yield word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        yield word[:-1]
+    if word.endswith("ly"):
+        yield word[:-2]
+
+
+@functools.lru_cache(maxsize=65536)
+def lemma(word):
+    """Headword for a lowercase token: the listed base form, or a de-pluralized guess"""
+    if "'" in word:
+        word = word[:-3] if word.endswith("n't") else word.split("'")[0]
+    if "-" in word:
+        return word                      # compounds are not listed
+    known = wordlist()
+    if word in known:
+        return word
+    base = IRREGULAR_PAST.get(word) or IRREGULAR_OTHER.get(word)
+    if base:
+        return base
+    for stem in _stems(word):
+        if stem in known:
+            return stem
+    if len(word) > 4 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-3] + "y" if word.endswith("ies") else word[:-1]
+    return word
+
+
+def level_of(word):
+    """CEFR level of a lowercase token (C2 when not in the word list)"""
+    return wordlist().get(lemma(word), "C2")
+
+
+@functools.lru_cache(maxsize=65536)
+def syllables(word):
+    count = len(VOWELS_RE.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and count > 1:
+        count -= 1                       # silent final e
+    return max(count, 1)
+
+
+def article_sentences(content):
+    """Sentences of an extract, reference sections left out"""
+    sentences = []
+    for _, _, body in _drop_skipped(split_sections(clean_article_text(content))):
+        for line in body.splitlines():
+            sentences.extend(s.strip() for s in SENTENCE_RE.split(line) if s.strip())
+    return sentences
+
+
+class Analysis:
+    """Tokens, lemma counts and readability of one article text"""
+
+    def __init__(self, content):
+        self.sentences = article_sentences(content)
+        self.counts = Counter()
+        surfaces = Counter()             # (lemma, lowercase form)
+        self.first = {}                  # lemma -> index of its first sentence
+        self.sentence_lemmas = []
+        self.lengths = []                # tokens per sentence
+        self.common = set()              # lemmas seen lowercase, i.e. not only as a name
+        syllable_total = 0
+        for index, sentence in enumerate(self.sentences):
+            tokens = TOKEN_RE.findall(sentence)
+            lemmas = set()
+            for token in tokens:
+                lower = token.lower()
+                base = lemma(lower)
+                syllable_total += syllables(lower)
+                self.counts[base] += 1
+                surfaces[base, lower] += 1
+                self.first.setdefault(base, index)
+                if token[0].islower():
+                    self.common.add(base)
+                lemmas.add(base)
+            self.sentence_lemmas.append(lemmas)
+            self.lengths.append(len(tokens))
+        self.forms = {}                  # lemma -> its most used form
+        for (base, lower), _ in surfaces.most_common():
+            self.forms.setdefault(base, lower)
+        self.words = sum(self.lengths)
+        self.readability = self._readability(syllable_total)
+
+    def _readability(self, syllable_total):
+        words = max(self.words, 1)
+        per_sentence = words / max(len(self.sentences), 1)
+        per_word = syllable_total / words
+        known = wordlist()
+        level_counts = Counter()
+        for base, count in self.counts.items():
+            if base in known or base in self.common:     # else a name
+                level_counts[known.get(base, "C2")] += count
+        counted = max(sum(level_counts.values()), 1)
+        profile = {level: level_counts[level] / counted for level in LEVELS}
+        covered, estimate = 0.0, LEVELS[-1]
+        for level in LEVELS:
+            covered += profile[level]
+            if covered >= COVERAGE:
+                estimate = level
+                break
+        return {
+            "words": self.words,
+            "sentences": len(self.sentences),
+            "words_per_sentence": round(per_sentence, 1),
+            "flesch_reading_ease": round(206.835 - 1.015 * per_sentence - 84.6 * per_word, 1),
+            "flesch_kincaid_grade": round(0.39 * per_sentence + 11.8 * per_word - 15.59, 1),
+            "reading_minutes": max(round(self.words / 200), 1),
+            "level_profile": {level: round(share, 3) for level, share in profile.items()},
+            "cefr": estimate,
+        }
+
+    def _sentence_for(self, base, english_level, used):
+        """
+        (sentence index, surface form) of the best unused sentence with
+        `base` that fits the level: one using it as a common word (not in a
+        name) if possible, then the shortest
+        """
+        low, high = SENTENCE_WORDS.get(english_level, SENTENCE_WORDS["intermediate"])
+        best = None
+        for index, lemmas in enumerate(self.sentence_lemmas):
+            if base not in lemmas or index in used or not low <= self.lengths[index] <= high:
+                continue
+            surface = next(t for t in TOKEN_RE.findall(self.sentences[index]) if lemma(t.lower()) == base)
+            rank = (not surface[0].islower(), self.lengths[index])
+            if best is None or rank < best[0]:
+                best = (rank, index, surface)
+        return (best[1], best[2]) if best else (None, None)
+
+    def vocabulary(self, english_level, n=10):
+        """
+        [{word, answer, level, count, sentence, gap}] for a learner at
+        `english_level`: headwords at its target levels that the article
+        uses as common words, preferred level first, then the most frequent;
+        `gap` is an article sentence with the form it uses (`answer`)
+        blanked, None when no sentence fits.
+        """
+        targets = TARGET_LEVELS.get(english_level, TARGET_LEVELS["intermediate"])
+        known = wordlist()
+        ranked = []
+        for base, count in self.counts.items():
+            level = known.get(base, "C2")
+            if level not in targets or base not in self.common or len(base) < 4:
+                continue
+            if level == "C2" and (len(base) < 6 or not base.isalpha()):
+                continue                 # unlisted: keep only likely real words
+            ranked.append((targets.index(level), -count, self.first[base], base, level))
+        ranked.sort()
+        with_gap, without_gap, used = [], [], set()
+        for _, count, _, base, level in ranked:
+            index, surface = self._sentence_for(base, english_level, used)
+            candidate = {"word": base, "answer": self.forms[base], "level": level,
+                         "count": -count, "sentence": None, "gap": None}
+            if index is None:
+                without_gap.append(candidate)
+                continue
+            used.add(index)
+            candidate.update(answer=surface, sentence=self.sentences[index],
+                             gap=_blank(self.sentences[index], surface))
+            with_gap.append(candidate)
+            if len(with_gap) >= n:
+                break
+        # words with an example sentence first, keeping the ranking otherwise
+        return (with_gap + without_gap)[:n]
+
+    def verb_gaps(self, english_level, n=10):
+        """
+        [{gap, base, answer, form}]: one past verb form per sentence blanked,
+        its base form given in brackets; each verb is asked about once, and a
+        participle is preferred over the auxiliary in front of it.
+        """
+        low, high = SENTENCE_WORDS.get(english_level, SENTENCE_WORDS["intermediate"])
+        known = wordlist()
+        gaps, asked = [], set()
+        for sentence, length in zip(self.sentences, self.lengths):
+            if not low <= length <= high:
+                continue
+            tokens = TOKEN_RE.findall(sentence)
+            verbs = []
+            for i, token in enumerate(tokens):
+                lower = token.lower()
+                if lower in IRREGULAR_PAST:
+                    base = IRREGULAR_PAST[lower]
+                elif lower.endswith("ed") and token[0].islower() and lemma(lower) in known:
+                    base = lemma(lower)
+                else:
+                    continue
+                if base != lower and base not in asked:
+                    verbs.append((i, token, base))
+            verbs.sort(key=lambda v: v[2] in ("be", "have"))
+            if not verbs:
+                continue
+            i, token, base = verbs[0]
+            asked.add(base)
+            gaps.append({
+                "gap": _blank(sentence, token, f"{BLANK} ({base})"),
+                "base": base,
+                "answer": token,
+                "form": ("past participle (passive or perfect)"
+                         if i > 0 and tokens[i - 1].lower() in AUXILIARIES else "past simple"),
+            })
+            if len(gaps) >= n:
+                break
+        return gaps
+
+    def fact_gaps(self, english_level, n=5):
+        """[{gap, answer}]: sentences with a year or number, that number blanked"""
+        low, high = SENTENCE_WORDS.get(english_level, SENTENCE_WORDS["intermediate"])
+        gaps = []
+        for sentence, length in zip(self.sentences, self.lengths):
+            match = NUMBER_RE.search(sentence)
+            if match and low <= length <= high:
+                gaps.append({"gap": sentence[:match.start()] + BLANK + sentence[match.end():],
+                             "answer": match.group(0)})
+                if len(gaps) >= n:
+                    break
+        return gaps
+
+    def keywords(self, n=8):
+        """The article's most frequent content words (B1 and up, not names)"""
+        known = wordlist()
+        ranked = [
+            (-count, base) for base, count in self.counts.items()
+            if base in self.common and len(base) > 3 and known.get(base, "C2") in LEVELS[2:]
+        ]
+        return [base for _, base in sorted(ranked)[:n]]
+
+
+def _blank(sentence, token, blank=BLANK):
+    """`sentence` with the first whole-word `token` replaced by `blank`"""
+    return re.sub(rf"\b{re.escape(token)}\b", lambda m: blank, sentence, count=1)
+
+
+@functools.lru_cache(maxsize=32)
+def analyze(content):
+    """Analysis of an article extract (HTML or plain), cached per text"""
+    return Analysis(content or "")
@@ -0,0 +1,322 @@
+"""
+Library of generated content.
+
+Every summary, lesson and exercise we pay OpenAI for is stored with what
+produced it: article title and revision, level, kind, prompt hash (the
+generation cache key), model, token usage and latency. A cache miss is
+looked up here before a new completion is requested, so a restart or an
+evicted cache entry does not cost another generation, and /api/library
+lists and serves stored lessons directly.
+
+DATABASE_URL picks the database: a SQLite file by default, Postgres in
+production. Writes are queued and inserted in batches by a background
+thread (insert_many is the bulk path); generation never waits for the
+database, and a database that is down only costs the lookups.
+
+The models are plain SQLAlchemy (installed with flask-sqlalchemy) rather
+than Flask-SQLAlchemy's db.Model: rows are written from job workers,
+hedge threads and pregenerate.py, none of which run in a Flask app context.
+"""
+import time
+import atexit
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import ForeignKey, Index, String, Text, create_engine, event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
+
+from config import DATABASE_URL, LIBRARY_ENABLED, LIBRARY_BATCH, LIBRARY_FLUSH_INTERVAL
+from model_router import router
+from wikipedia_api import article_cache, normalize_title
+
+log = logging.getLogger(__name__)
+
+# rows kept for a later retry while the database is unavailable
+MAX_PENDING = 10000
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Article(Base):
+    __tablename__ = "articles"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    title: Mapped[str] = mapped_column(String(512), unique=True)
+    revision: Mapped[Optional[int]]
+    url: Mapped[Optional[str]] = mapped_column(String(1024))
+    updated: Mapped[float]
+
+
+class Generation(Base):
+    __tablename__ = "generations"
+    __table_args__ = (
+        Index("generations_lookup", "article_title", "level", "kind", "created"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    prompt_hash: Mapped[str] = mapped_column(String(64), unique=True)
+    article_title: Mapped[str] = mapped_column(String(512), ForeignKey("articles.title"))
+    revision: Mapped[Optional[int]]
+    level: Mapped[str] = mapped_column(String(32))
+    kind: Mapped[str] = mapped_column(String(32))
+    model: Mapped[str] = mapped_column(String(64))
+    prompt_tokens: Mapped[Optional[int]]
+    completion_tokens: Mapped[Optional[int]]
+    latency_ms: Mapped[Optional[int]]
+    html: Mapped[str] = mapped_column(Text)
+    created: Mapped[float]
+
+    def public(self, with_html=True):
+        out = {
+            "id": self.id,
+            "title": self.article_title,
+            "revision": self.revision,
+            "level": self.level,
+            "kind": self.kind,
+            "model": self.model,
+            "prompt_hash": self.prompt_hash,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_ms": self.latency_ms,
+            "created": self.created,
+        }
+        if with_html:
+            out["html"] = self.html
+        return out
+
+
+# INSERT ... ON CONFLICT for the dialects we run on
+INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class Library:
+
+    def __init__(self, url=DATABASE_URL, batch=LIBRARY_BATCH, flush_interval=LIBRARY_FLUSH_INTERVAL):
+        self.batch = batch
+        self.flush_interval = flush_interval
+        options = {"pool_pre_ping": True}
+        if url.startswith("sqlite"):
+            options["connect_args"] = {"check_same_thread": False, "timeout": 10}
+        self.engine = create_engine(url, **options)
+        if self.engine.dialect.name not in INSERTS:
+            raise RuntimeError(f"unsupported library database {self.engine.dialect.name!r}")
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", _sqlite_wal)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(self.engine, expire_on_commit=False)
+        self._insert = INSERTS[self.engine.dialect.name]
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+        self.written = 0
+        self.served = 0
+
+    # -- writing ------------------------------------------------------
+
+    def record(self, prompt_hash, kind, title, level, model, html, seconds=None, usage=None):
+        """Queue one fresh generation for the next batch insert"""
+        key = normalize_title(title)
+        entry = article_cache.get(key) or {}
+        row = {
+            "prompt_hash": prompt_hash,
+            "article_title": key,
+            "revision": entry.get("revision"),
+            "url": (entry.get("article") or {}).get("url"),
+            "level": level,
+            "kind": kind,
+            "model": model,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "latency_ms": int(seconds * 1000) if seconds is not None else None,
+            "html": html,
+            "created": time.time(),
+        }
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch
+        self._start_flusher()
+        if full:
+            self._wake.set()
+
+    def insert_many(self, rows):
+        """
+        Bulk insert generation rows (dicts as built by record) in one
+        transaction, creating or updating their articles first. Rows whose
+        prompt hash is already stored are skipped, unless the primary model
+        made the new row and a fallback or hedge model the stored one.
+        Returns rows inserted or replaced.
+        """
+        if not rows:
+            return 0
+        now = time.time()
+        articles = {}
+        for row in rows:
+            articles[row["article_title"]] = {
+                "title": row["article_title"], "revision": row.get("revision"),
+                "url": row.get("url"), "updated": now,
+            }
+        article_insert = self._insert(Article)
+        article_insert = article_insert.on_conflict_do_update(
+            index_elements=[Article.title],
+            set_={
+                "revision": func.coalesce(article_insert.excluded.revision, Article.revision),
+                "url": func.coalesce(article_insert.excluded.url, Article.url),
+                "updated": article_insert.excluded.updated,
+            },
+        )
+        columns = {c.name for c in Generation.__table__.columns} - {"id"}
+        generations = [{k: v for k, v in row.items() if k in columns} for row in rows]
+        generation_insert = self._insert(Generation)
+        generation_insert = generation_insert.on_conflict_do_update(
+            index_elements=[Generation.prompt_hash],
+            set_={c: generation_insert.excluded[c] for c in columns - {"prompt_hash"}},
+            where=(generation_insert.excluded.model == router.primary) & (Generation.model != router.primary),
+        )
+        with self.engine.begin() as conn:
+            conn.execute(article_insert, list(articles.values()))
+            result = conn.execute(generation_insert, generations)
+        inserted = max(result.rowcount, 0)
+        self.written += inserted
+        return inserted
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        try:
+            return self.insert_many(rows)
+        except Exception as e:           # noqa: BLE001
+            with self._lock:
+                self._pending = (rows + self._pending)[-MAX_PENDING:]
+            log.error("Library write of %d generations failed, will retry: %s", len(rows), e)
+            return 0
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run, name="library-flush", daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    # -- reading ------------------------------------------------------
+
+    def find(self, prompt_hash, model=None):
+        """Stored HTML for a generation cache key (made by `model`, if given), else None"""
+        query = select(Generation.html).where(Generation.prompt_hash == prompt_hash)
+        if model is not None:
+            query = query.where(Generation.model == model)
+        try:
+            with self.Session() as session:
+                html = session.scalar(query)
+        except Exception as e:           # noqa: BLE001
+            log.warning("Library lookup failed: %s", e)
+            return None
+        if html is not None:
+            self.served += 1
+        return html
+
+    def get(self, generation_id):
+        with self.Session() as session:
+            return session.get(Generation, generation_id)
+
+    def latest(self, title, level, kind):
+        """Newest stored generation of `kind` for an article and level"""
+        with self.Session() as session:
+            return session.scalars(
+                select(Generation)
+                .where(Generation.article_title == normalize_title(title),
+                       Generation.level == level, Generation.kind == kind)
+                .order_by(Generation.created.desc())
+                .limit(1)
+            ).first()
+
+    def search(self, title=None, level=None, kind=None, limit=50, offset=0):
+        """Stored generations, newest first, optionally filtered"""
+        query = select(Generation)
+        if title:
+            query = query.where(Generation.article_title == normalize_title(title))
+        if level:
+            query = query.where(Generation.level == level)
+        if kind:
+            query = query.where(Generation.kind == kind)
+        query = query.order_by(Generation.created.desc()).limit(limit).offset(offset)
+        with self.Session() as session:
+            return list(session.scalars(query))
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        try:
+            with self.Session() as session:
+                stored = session.scalar(select(func.count()).select_from(Generation))
+        except Exception as e:           # noqa: BLE001
+            stored = f"unavailable: {e}"
+        return {
+            "backend": self.engine.dialect.name,
+            "stored": stored,
+            "pending": pending,
+            "written": self.written,
+            "served": self.served,
+        }
+
+
+class NullLibrary:
+    """Library disabled or unavailable: nothing is stored or found."""
+
+    def record(self, *args, **kwargs):
+        pass
+
+    def insert_many(self, rows):
+        return 0
+
+    def flush(self):
+        return 0
+
+    def find(self, prompt_hash, model=None):
+        return None
+
+    def get(self, generation_id):
+        return None
+
+    def latest(self, title, level, kind):
+        return None
+
+    def search(self, *args, **kwargs):
+        return []
+
+    def stats(self):
+        return {"backend": "none"}
+
+
+def _sqlite_wal(dbapi_conn, _record):
+    dbapi_conn.execute("PRAGMA journal_mode=WAL")
+
+
+def build_library(enabled=LIBRARY_ENABLED):
+    """The configured library, or a NullLibrary when disabled or unreachable"""
+    if not enabled:
+        return NullLibrary()
+    try:
+        return Library()
+    except Exception as e:               # noqa: BLE001
+        log.error("Could not open the library database (%s), not storing generations", e)
+        return NullLibrary()
+
+
+library = build_library()
@@ -0,0 +1,214 @@
+"""
+Lessons and exercises built from the article text alone (lexicon.py), for
+when no model answers. Same sections as the model is asked for, filled
+with the article's own words and sentences: vocabulary at the learner's
+level, gap-fills, past verb forms, dates and numbers to recall.
+
+Each builder returns unsanitized HTML for rendering.render, or None when
+the text has too little to work with (openai_service then falls back to
+its generic study tips).
+"""
+import html
+import logging
+
+from lexicon import analyze, LEVELS, BLANK
+from config import ENGLISH_LEVELS
+
+log = logging.getLogger(__name__)
+
+# Highest CEFR level an ENGLISH_LEVELS entry covers
+LEVEL_CEILING = {"elementary": "A2", "intermediate": "B2", "professional": "C2"}
+WRITING_WORDS = {"elementary": "50-80", "intermediate": "120-150", "professional": "200-250"}
+MIN_ITEMS = 4
+
+
+def article_analysis(article_text):
+    """lexicon.Analysis of the text, or None without text or when analysis fails"""
+    if not article_text:
+        return None
+    try:
+        return analyze(article_text)
+    except Exception as e:               # noqa: BLE001
+        log.warning(f"Lexical analysis failed: {e}")
+        return None
+
+
+def vocabulary_words(article_text, english_level, n):
+    """Headwords for the learner's level, best first ([] without text)"""
+    analysis = article_analysis(article_text)
+    return [c["word"] for c in analysis.vocabulary(english_level, n)] if analysis else []
+
+
+def _e(text):
+    return html.escape(text, quote=False)
+
+
+def _answer(text):
+    return f"<details><summary>Show answer</summary>{_e(text)}</details>"
+
+
+def _highlight(sentence, word):
+    """The sentence with the first `word` in bold (matched as in lexicon.Analysis.vocabulary)"""
+    return _e(sentence).replace(_e(word), f"<strong>{_e(word)}</strong>", 1)
+
+
+def _text_profile(analysis, english_level):
+    r = analysis.readability
+    ceiling = LEVEL_CEILING.get(english_level, "B2")
+    known = sum(r["level_profile"][level] for level in LEVELS[:LEVELS.index(ceiling) + 1])
+    ease = r["flesch_reading_ease"]
+    difficulty = "easy" if ease >= 70 else "fairly difficult" if ease >= 50 else "difficult"
+    return f"""
+    <ul>
+        <li>Length: {r['words']} words, about {r['reading_minutes']} minutes of reading</li>
+        <li>Average sentence: {r['words_per_sentence']} words</li>
+        <li>Reading ease: {ease} ({difficulty}); grade level {r['flesch_kincaid_grade']}</li>
+        <li>About {known:.0%} of the words are at {ceiling} level or below; readers need about {r['cefr']} to know 95% of them</li>
+    </ul>
+    """
+
+
+def _gap_list(items):
+    return "\n".join(f"<li>{_e(item['gap'])} {_answer(item['answer'])}</li>" for item in items)
+
+
+def lesson(article_title, english_level, article_text):
+    """A full lesson plan (vocabulary, text profile, gap-fill, discussion, writing)"""
+    analysis = article_analysis(article_text)
+    if analysis is None:
+        return None
+    words = analysis.vocabulary(english_level, 10)
+    if len(words) < MIN_ITEMS:
+        return None
+    title = _e(article_title or "this article")
+    level_text = ENGLISH_LEVELS.get(english_level, ENGLISH_LEVELS["intermediate"])
+    rows = "\n".join(
+        f"<tr><td>{_e(w['word'])}</td><td>{w['level']}</td>"
+        f"<td>{_highlight(w['sentence'], w['answer']) if w['sentence'] else ''}</td></tr>"
+        for w in words
+    )
+    gaps = [w for w in words if w["gap"]][:8]
+    bank = "\n".join(f"<li>{_e(w['answer'])}</li>" for w in sorted(gaps, key=lambda w: w["answer"].lower()))
+    answers = "\n".join(f"<li>{_e(w['answer'])}</li>" for w in gaps)
+    keywords = ", ".join(_e(w["word"]) for w in words[:5])
+    return f"""
+    <h1>English Lesson: {title}</h1>
+    <p>{level_text}. This lesson was put together from the article text while the AI lesson generator is unavailable.</p>
+
+    <h2>1. Vocabulary</h2>
+    <table>
+        <thead><tr><th>Word</th><th>Level</th><th>In the article</th></tr></thead>
+        <tbody>
+        {rows}
+        </tbody>
+    </table>
+
+    <h2>2. About the Text</h2>
+    {_text_profile(analysis, english_level)}
+
+    <h2>3. Fill in the Blanks</h2>
+    <p>Complete the sentences from the article with words from the word bank.</p>
+    <ul>
+    {bank}
+    </ul>
+    <ol>
+    {"".join(f"<li>{_e(w['gap'])}</li>" for w in gaps)}
+    </ol>
+    <details><summary>Show answers</summary><ol>{answers}</ol></details>
+
+    <h2>4. Discussion</h2>
+    <ol>
+        <li>What is the main subject of the article about {title}?</li>
+        <li>Which fact in the article surprised you most, and why?</li>
+        <li>How does this topic connect to your interests or daily life?</li>
+    </ol>
+
+    <h2>5. Essay Theme</h2>
+    <p>Write {WRITING_WORDS.get(english_level, "120-150")} words about {title} in your own words. Use at least three of these words: {keywords}.</p>
+    """
+
+
+def grammar_exercise(article_title, english_level, article_text):
+    """Past simple and past participle gap-fills from the article's sentences"""
+    analysis = article_analysis(article_text)
+    gaps = analysis.verb_gaps(english_level, 10) if analysis else []
+    if len(gaps) < MIN_ITEMS:
+        return None
+    items = "\n".join(
+        f"<li>{_e(g['gap'])} {_answer(g['answer'] + ' (' + g['form'] + ')')}</li>" for g in gaps
+    )
+    return f"""
+    <div class="lesson-section">
+      <h2>Grammar Exercises</h2>
+      <p>Sentences from the article about {_e(article_title or "this topic")}: put the verb in brackets into the correct past form.</p>
+      <ol>
+      {items}
+      </ol>
+    </div>
+    """
+
+
+def vocabulary_exercise(article_title, english_level, article_text):
+    """Gap-fill sentences for the article's words at the learner's level"""
+    analysis = article_analysis(article_text)
+    words = [w for w in analysis.vocabulary(english_level, 12) if w["gap"]] if analysis else []
+    if len(words) < MIN_ITEMS:
+        return None
+    rows = "\n".join(
+        f"<tr><td>{_e(w['word'])}</td><td>{w['level']}</td><td>{_e(w['gap'])}</td></tr>" for w in words
+    )
+    answers = "\n".join(f"<li>{i} — {_e(w['answer'])}</li>" for i, w in enumerate(words, 1))
+    return f"""
+    <div class="lesson-section">
+      <h2>Vocabulary Trainer</h2>
+      <table>
+        <thead><tr><th>Word</th><th>Level</th><th>Example (gap-fill)</th></tr></thead>
+        <tbody>
+        {rows}
+        </tbody>
+      </table>
+      <details><summary>Show answers</summary><ol>{answers}</ol></details>
+    </div>
+    """
+
+
+def extra_exercise(article_title, english_level, article_text):
+    """Dates and numbers to recall, words to explain and a short writing task"""
+    analysis = article_analysis(article_text)
+    if analysis is None:
+        return None
+    facts = analysis.fact_gaps(english_level, 5)
+    keywords = analysis.keywords(5)
+    if not facts and len(keywords) < MIN_ITEMS:
+        return None
+    title = _e(article_title or "this topic")
+    discuss = "\n".join(f"<li>What does “{_e(word)}” mean in the article, and why does it matter for {title}?</li>"
+                        for word in keywords)
+    comprehension = f"""
+      <h3>Comprehension Check</h3>
+      <p>Fill in the missing date or number ({BLANK}) from the article.</p>
+      <ol>
+      {_gap_list(facts)}
+      </ol>
+    """ if facts else ""
+    use = f" Use {', '.join(_e(w) for w in keywords[:3])}." if keywords else ""
+    return f"""
+    <div class="lesson-section">
+      <h2>Extra Practice</h2>
+      {comprehension}
+      <h3>Discuss</h3>
+      <ul>
+      {discuss}
+      </ul>
+
+      <h3>Writing Task</h3>
+      <p>Write ≈60 words: <em>what is the most important thing to know about {title}?{use}</em></p>
+    </div>
+    """
+
+
+EXERCISES = {
+    "grammar": grammar_exercise,
+    "vocabulary": vocabulary_exercise,
+    "extra": extra_exercise,
+}
@@ -0,0 +1,318 @@
+"""
+Prometheus-style metrics, served as text by GET /metrics.
+
+Counters and histograms live in the process that records them. With
+METRICS_DIR set, every process saves a snapshot there every
+METRICS_FLUSH_INTERVAL seconds (and on exit), and a scrape adds up the
+snapshots of all of them, so whichever gunicorn worker answers reports the
+whole host. A scrape folds the snapshots of workers that have exited into
+retired.json and deletes them, so counters don't go backwards when
+--max-requests recycles a worker and the directory doesn't keep growing.
+
+Collectors are callables run at snapshot time for numbers that are kept
+elsewhere (cache hit/miss counters); they return
+[(name, help, {label: value}, value)].
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:                      # Windows: exited workers' snapshots are kept as they are
+    fcntl = None
+
+import tracing
+from config import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+log = logging.getLogger(__name__)
+
+PREFIX = "wikilearn_"
+RETIRED = "retired.json"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return {json.dumps(k): v for k, v in self._values.items()}
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            # per-bucket (not cumulative) counts, then sum and count
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[bisect.bisect_left(self.buckets, value)] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            return {json.dumps(k): list(v) for k, v in self._values.items()}
+
+
+# ------------------------------------------------------------------
+# Metrics recorded across the app
+# ------------------------------------------------------------------
+
+http_seconds = Histogram(
+    "http_request_duration_seconds", "Time to response headers, by endpoint",
+    ("endpoint", "method", "status"),
+)
+upstream_seconds = Histogram(
+    "upstream_request_duration_seconds", "Wikipedia and OpenAI call latency",
+    ("upstream", "target", "operation"),
+)
+upstream_requests = Counter(
+    "upstream_requests_total", "Wikipedia and OpenAI calls by outcome",
+    ("upstream", "target", "status"),
+)
+openai_tokens = Counter(
+    "openai_tokens_total", "Tokens of fresh completions",
+    ("kind", "level", "model", "type"),
+)
+generations = Counter(
+    "generations_total", "Generations served, by where they came from (cache, library, openai, fallback)",
+    ("kind", "level", "source"),
+)
+
+REGISTRY = [http_seconds, upstream_seconds, upstream_requests, openai_tokens, generations]
+_collectors = []
+
+
+def register_collector(fn):
+    _collectors.append(fn)
+    return fn
+
+
+def upstream(name, target, operation, seconds, status):
+    """One upstream call: latency, outcome counter and a trace span"""
+    upstream_seconds.observe(seconds, upstream=name, target=target, operation=operation)
+    upstream_requests.inc(upstream=name, target=target, status=status)
+    tracing.add_span(f"{name}:{operation}", seconds, target=target, status=status)
+
+
+# ------------------------------------------------------------------
+# Snapshots and exposition
+# ------------------------------------------------------------------
+
+def snapshot():
+    """This process's metrics as JSON-able data"""
+    out = {}
+    for metric in REGISTRY:
+        entry = {"type": metric.type, "help": metric.help, "labels": metric.labelnames,
+                 "samples": metric.samples()}
+        if metric.type == "histogram":
+            entry["buckets"] = metric.buckets
+        out[metric.name] = entry
+    for collector in _collectors:
+        try:
+            collected = collector()
+        except Exception as e:           # noqa: BLE001
+            log.warning("Metrics collector %s failed: %s", getattr(collector, "__name__", collector), e)
+            continue
+        for name, help, labels, value in collected:
+            entry = out.setdefault(PREFIX + name, {
+                "type": "counter", "help": help, "labels": tuple(labels), "samples": {},
+            })
+            key = json.dumps([str(labels[n]) for n in entry["labels"]])
+            entry["samples"][key] = entry["samples"].get(key, 0) + value
+    return out
+
+
+def _merge(total, snap):
+    for name, entry in snap.items():
+        into = total.setdefault(name, dict(entry, samples={}))
+        for key, value in entry["samples"].items():
+            if entry["type"] == "histogram":
+                current = into["samples"].get(key)
+                into["samples"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                into["samples"][key] = into["samples"].get(key, 0) + value
+    return total
+
+
+class SnapshotWriter(threading.Thread):
+    """Saves this process's snapshot to METRICS_DIR periodically"""
+
+    def __init__(self, directory=METRICS_DIR, interval=METRICS_FLUSH_INTERVAL):
+        super().__init__(name="metrics-writer", daemon=True)
+        self.directory = directory
+        self.interval = interval
+        # pid alone is reused across restarts; a reused file would lose counts
+        self.path = os.path.join(directory, f"{os.getpid()}-{int(time.time() * 1000)}.json")
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp, self.path)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                log.warning("Could not save metrics snapshot: %s", e)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def start_writer():
+    """Start saving snapshots to METRICS_DIR (once per process); returns the writer or None"""
+    global _writer
+    if not METRICS_DIR or _writer is not None:
+        return _writer
+    with _writer_lock:
+        if _writer is None:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            _writer = SnapshotWriter()
+            _writer.start()
+            atexit.register(_writer.write)
+    return _writer
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _exited(names):
+    """Snapshots of processes that are gone: a dead pid, or not a pid's newest file"""
+    newest = {}
+    for name in names:
+        try:
+            pid, stamp = map(int, name[:-len(".json")].split("-"))
+        except ValueError:
+            continue
+        newest.setdefault(pid, []).append((stamp, name))
+    exited = []
+    for pid, files in newest.items():
+        files.sort()
+        exited += [name for _, name in (files if not _alive(pid) else files[:-1])]
+    return exited
+
+
+def _load(directory, name):
+    with open(os.path.join(directory, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _retire(directory, names):
+    """Fold the snapshots of exited processes into RETIRED and delete them"""
+    exited = _exited(names)
+    if not exited:
+        return
+    try:
+        retired = _load(directory, RETIRED)
+    except FileNotFoundError:
+        retired = {}
+    for name in exited:
+        try:
+            _merge(retired, _load(directory, name))
+        except ValueError as e:
+            log.warning("Dropping metrics snapshot %s: %s", name, e)
+    tmp = os.path.join(directory, RETIRED + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(retired, f)
+    os.replace(tmp, os.path.join(directory, RETIRED))
+    for name in exited:
+        os.unlink(os.path.join(directory, name))
+
+
+def collect():
+    """Every process's metrics added up (just this one's without METRICS_DIR)"""
+    writer = start_writer()
+    if writer is None:
+        return snapshot()
+    writer.write()
+    with open(os.path.join(METRICS_DIR, ".lock"), "a") as lock:
+        # one scrape at a time folds and reads, so no snapshot is counted twice
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        names = sorted(n for n in os.listdir(METRICS_DIR) if n.endswith(".json"))
+        if fcntl is not None:
+            try:
+                _retire(METRICS_DIR, [n for n in names if n != RETIRED])
+                names = sorted(n for n in os.listdir(METRICS_DIR) if n.endswith(".json"))
+            except OSError as e:
+                log.warning("Could not retire metrics snapshots: %s", e)
+        total = {}
+        for name in names:
+            try:
+                _merge(total, _load(METRICS_DIR, name))
+            except (OSError, ValueError) as e:
+                log.warning("Skipping metrics snapshot %s: %s", name, e)
+    return total
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render(data=None):
+    """Prometheus text exposition format (version 0.0.4)"""
+    data = collect() if data is None else data
+    lines = []
+    for name in sorted(data):
+        entry = data[name]
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for key in sorted(entry["samples"]):
+            values = json.loads(key)
+            sample = entry["samples"][key]
+            if entry["type"] != "histogram":
+                lines.append(f"{name}{_labels(entry['labels'], values)} {sample}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(entry["buckets"]) + ["+Inf"], sample[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(entry['labels'], values, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(entry['labels'], values)} {sample[-2]}")
+            lines.append(f"{name}_count{_labels(entry['labels'], values)} {sample[-1]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,124 @@
+"""
+Model routing for OpenAI calls: a fallback chain plus latency-driven hedging.
+
+OPENAI_MODELS is tried in order when a model keeps failing. A call that is
+slower than usual is hedged with the next (faster, cheaper) model in the
+chain. "Slower than usual" is the OPENAI_HEDGE_QUANTILE of that model's
+recent latencies for the same kind of call: total time for completions,
+time to first token for streams. Until HEDGE_MIN_SAMPLES have been seen
+there is no hedging, and the last model in the chain is never hedged. A
+fixed number of seconds in OPENAI_HEDGE_AFTER replaces the learned
+threshold, and 0 turns hedging off.
+"""
+import math
+import bisect
+import threading
+from collections import deque
+
+import metrics
+from config import OPENAI_MODELS, OPENAI_HEDGE_AFTER, OPENAI_HEDGE_QUANTILE
+
+# histogram bucket upper bounds (seconds) for /api/cache-stats
+LATENCY_BUCKETS = (0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+# samples kept per histogram for the quantile estimate
+WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+class LatencyHistogram:
+    """Bucketed counts for reporting plus a sliding window for quantiles"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=WINDOW)
+
+    def observe(self, seconds, ok=True):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+            return                       # failures say nothing about how long a success takes
+        self.total += seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self._recent.append(seconds)
+
+    def quantile(self, q):
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def snapshot(self):
+        ok = self.count - self.errors
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_seconds": round(self.total / ok, 3) if ok else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class ModelRouter:
+
+    def __init__(self, models=OPENAI_MODELS, hedge_after=OPENAI_HEDGE_AFTER,
+                 quantile=OPENAI_HEDGE_QUANTILE):
+        self.models = list(models)
+        self.hedge_after = hedge_after
+        self.quantile = quantile
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.models[0]
+
+    def backup_for(self, model):
+        """Model to hedge `model` with: the next one in the chain, None at the end"""
+        i = self.models.index(model) if model in self.models else len(self.models) - 1
+        return self.models[i + 1] if i + 1 < len(self.models) else None
+
+    def _histogram(self, model, metric, max_tokens):
+        # latency scales with the output length, so each max_tokens gets its own
+        key = (model, metric, max_tokens)
+        hist = self._histograms.get(key)
+        if hist is None:
+            hist = self._histograms[key] = LatencyHistogram()
+        return hist
+
+    def observe(self, model, metric, max_tokens, seconds, ok=True, status=None):
+        metrics.upstream("openai", model, metric, seconds, status or ("ok" if ok else "error"))
+        with self._lock:
+            self._histogram(model, metric, max_tokens).observe(seconds, ok)
+
+    def hedge_delay(self, model, metric, max_tokens):
+        """Seconds to wait before hedging a call, or None for no hedge"""
+        if self.backup_for(model) is None:
+            return None
+        if self.hedge_after != "auto":
+            seconds = float(self.hedge_after or 0)
+            return seconds if seconds > 0 else None
+        with self._lock:
+            hist = self._histogram(model, metric, max_tokens)
+            if hist.count - hist.errors < HEDGE_MIN_SAMPLES:
+                return None
+            return hist.quantile(self.quantile)
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for (model, metric, max_tokens), hist in sorted(self._histograms.items()):
+                out.setdefault(model, {})[f"{metric}:{max_tokens}"] = hist.snapshot()
+            return {
+                "models": self.models,
+                "hedge_after": self.hedge_after,
+                "hedge_quantile": self.quantile,
+                "latency": out,
+            }
+
+
+router = ModelRouter()
@@ -1,64 +1,604 @@
+import html
 import openai
 import logging
-import signal
-import functools
-from config import OPENAI_API_KEY
-import openai, logging, functools, platform
+from config import (
+    OPENAI_API_KEY, OPENAI_ASYNC_POOL_SIZE, ARTICLE_CONTEXT_TOKENS, ARTICLE_CONTEXT_STRATEGY,
+    LESSON_BUNDLE_MODE, OPENAI_ATTEMPT_TIMEOUT, OPENAI_CONNECT_TIMEOUT, OPENAI_MAX_ATTEMPTS,
+    GENERATION_FALLBACK_TTL, ENGLISH_LEVELS, PROMPT_VOCABULARY_HINTS
+)
 import time, random, concurrent.futures
+import queue
+import threading
+import contextvars
+import asyncio
+import json
+import httpx
+from deadlines import remaining, DeadlineExceeded
+from generation_cache import generation_cache, make_key
+from singleflight import singleflight
+from governor import governor, batch_priority
+from model_router import router
+from library import library
+import metrics
+import tracing
+from rendering import render
+from prompt_context import prepare_article_context, count_tokens
+import local_lessons
 
 log = logging.getLogger(__name__)
 
 # Initialize OpenAI client with improved timeout settings
-# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-# do not change this unless explicitly requested by the user
 client = openai.OpenAI(
     api_key=OPENAI_API_KEY,
     timeout=120.0,  # Short timeout to prevent server crashes
     max_retries=0  # No retries to avoid hanging
 ) if OPENAI_API_KEY else None
 
+# Async twin for the ASGI entry point; one pooled connection set per process
+async_client = openai.AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=120.0,
+    max_retries=0,
+    http_client=openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_ASYNC_POOL_SIZE,
+            max_keepalive_connections=OPENAI_ASYNC_POOL_SIZE,
+        )
+    ),
+) if OPENAI_API_KEY else None
+
+# The primary model of OPENAI_MODELS names the cache key, whichever model
+# of the chain ends up answering.
+MODEL = router.primary
+
+
+def _estimate(prompt, max_tokens):
+    """Token charge for the governor until the real usage is known"""
+    return count_tokens(prompt) + max_tokens
+
+# ------------------------------------------------------------------
+# Deadline-aware, routed calls: every attempt is bounded by what is left
+# of the request deadline, transient failures are retried while time
+# remains, slow attempts are hedged with the backup model, and a model
+# that keeps failing hands over to the next one in OPENAI_MODELS.
+# ------------------------------------------------------------------
+
+RETRYABLE = (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+# an attempt with less time than this left is not worth sending
+MIN_ATTEMPT = 2.0
+
+_hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+_call_stats = {"retries": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0}
+_call_stats_lock = threading.Lock()
+
+def _count(name):
+    with _call_stats_lock:
+        _call_stats[name] += 1
+
+def _error_status(e):
+    """Metrics status of a failed call: its HTTP status, else the error type"""
+    return getattr(e, "status_code", None) or type(e).__name__
+
+def _metric_labels(label):
+    """(kind, level) of a (kind, title, level) label; unknown values become "other" """
+    kind, level = (label[0], label[2]) if label else ("other", "other")
+    if kind not in GENERATION_KINDS and kind != "bundle":
+        kind = "other"
+    return kind, level if level in ENGLISH_LEVELS else "other"
+
+def _count_generation(label, source):
+    """One generation served from `source`: cache, library, openai or fallback"""
+    kind, level = _metric_labels(label)
+    metrics.generations.inc(kind=kind, level=level, source=source)
+
+def call_stats():
+    with _call_stats_lock:
+        return dict(_call_stats, **router.stats())
+
+def _attempt_timeout():
+    """httpx timeout for an attempt sent now"""
+    left = remaining(OPENAI_ATTEMPT_TIMEOUT)
+    if left < MIN_ATTEMPT:
+        raise DeadlineExceeded(f"only {left:.1f}s left for an OpenAI call")
+    return httpx.Timeout(left, connect=min(OPENAI_CONNECT_TIMEOUT, left))
+
+def _retry_delay(attempt):
+    return 0.5 * 2 ** attempt + random.random() * 0.25
+
+def _can_hedge():
+    try:
+        return remaining(OPENAI_ATTEMPT_TIMEOUT) >= MIN_ATTEMPT
+    except DeadlineExceeded:
+        return False
+
+class _Attempt:
+    """Streams opened by one hedged attempt, closed when it loses the race"""
+
+    def __init__(self):
+        self.streams = []
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def track(self, stream):
+        with self._lock:
+            self.streams.append(stream)
+            cancelled = self.cancelled
+        if cancelled:
+            _close_quietly(stream)
+        return stream
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            streams = list(self.streams)
+        for stream in streams:
+            _close_quietly(stream)
+
+_attempt = contextvars.ContextVar("openai_attempt", default=None)
+
+def _close_quietly(stream):
+    try:
+        stream.close()
+    except Exception:                    # noqa: BLE001
+        pass
+
+def _track(stream):
+    """Register a response stream with the hedged attempt being run, if any"""
+    attempt = _attempt.get()
+    return attempt.track(stream) if attempt is not None else stream
+
+def _cancelled():
+    """The hedged attempt being run has lost the race"""
+    attempt = _attempt.get()
+    return attempt is not None and attempt.cancelled
+
+def _timed(fn, model, max_tokens):
+    """fn(model), recorded in the model's completion latency histogram"""
+    start = time.perf_counter()
+    try:
+        result = fn(model)
+    except Exception as e:
+        if not _cancelled():
+            router.observe(model, "complete", max_tokens, time.perf_counter() - start,
+                           ok=False, status=_error_status(e))
+        raise
+    router.observe(model, "complete", max_tokens, time.perf_counter() - start)
+    return result
+
+def _run_attempt(attempt, fn, model, max_tokens):
+    _attempt.set(attempt)
+    return _timed(fn, model, max_tokens)
 
-def with_retry(fn, attempts=4, base=3):
-    for n in range(attempts):
+def _hedged(fn, model, max_tokens):
+    """
+    fn(model); if it is still running after the model's hedge delay,
+    fn(backup model) races it and the first success wins. fn streams its
+    response (see _track), so the losing attempt is closed, which ends its
+    HTTP request and frees its governor slot and pool thread.
+    """
+    delay = router.hedge_delay(model, "complete", max_tokens)
+    if delay is None:
+        return _timed(fn, model, max_tokens)
+    attempts = {}
+
+    def submit(attempt_model):
+        attempt = _Attempt()
+        future = _hedge_pool.submit(
+            contextvars.copy_context().run, _run_attempt, attempt, fn, attempt_model, max_tokens
+        )
+        attempts[future] = attempt
+        return future
+
+    futures = [submit(model)]
+    try:
+        done, _ = concurrent.futures.wait(futures, timeout=delay)
+        if not done and _can_hedge():
+            _count("hedges")
+            futures.append(submit(router.backup_for(model)))
+        pending, error = set(futures), None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        _count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        for future, attempt in attempts.items():
+            if not future.done():
+                attempt.cancel()
+
+def _with_retries(fn):
+    """fn() with retries of timeouts, connection errors and 5xx while time remains"""
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
         try:
             return fn()
-        except openai.error.Timeout:
-            wait = base * 2**n + random.random()
-            log.warning("Timeout, retrying in %.1fs (%d/%d)", wait, n+1, attempts)
-            time.sleep(wait)
-    raise TimeoutError("Too many timeouts")
-
-def timeout(seconds: int):
-    """Cross-platform timeout decorator (SIGALRM on Unix, ThreadPool on Win)."""
-    def decorator(fn):
-        if platform.system() != 'Windows':
-            import signal
-            def wrapper(*a, **kw):
-                def _handler(signum, frame):
-                    raise TimeoutError(f"{fn.__name__} timed out after {seconds}s")
-                old = signal.signal(signal.SIGALRM, _handler)
-                signal.alarm(seconds)
+        except RETRYABLE as e:
+            if attempt == OPENAI_MAX_ATTEMPTS - 1:
+                raise
+            delay = _retry_delay(attempt)
+            if remaining(OPENAI_ATTEMPT_TIMEOUT) < delay + MIN_ATTEMPT:
+                raise
+            log.warning(f"OpenAI attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            _count("retries")
+            time.sleep(delay)
+
+def _call(fn, max_tokens, hedge=True):
+    """
+    fn(model) along the model chain. fn must take its HTTP timeout from
+    _attempt_timeout() so no attempt outlives the request deadline.
+    """
+    chain = router.models
+    for i, model in enumerate(chain):
+        try:
+            if hedge:
+                return _with_retries(lambda: _hedged(fn, model, max_tokens))
+            return _with_retries(lambda: fn(model))
+        except openai.APIError as e:
+            if i == len(chain) - 1:
+                raise
+            log.warning(f"{model} failed ({e}), falling back to {chain[i + 1]}")
+            _count("fallbacks")
+
+def _delta(chunk):
+    if chunk.choices and chunk.choices[0].delta.content:
+        return chunk.choices[0].delta.content
+    return None
+
+class _Metered:
+    """A response stream that keeps its usage chunk and settles its permit once closed"""
+
+    def __init__(self, stream, permit):
+        self.stream = stream
+        self.permit = permit
+        self.usage = None
+        self._settled = False
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.usage = chunk.usage or self.usage
+            yield chunk
+
+    def close(self):
+        _close_quietly(self.stream)
+        if not self._settled:
+            self._settled = True
+            self.permit.settle(used_tokens=self.usage.total_tokens if self.usage else None)
+
+class _AsyncMetered(_Metered):
+    """Async _Metered"""
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.usage = chunk.usage or self.usage
+            yield chunk
+
+    async def close(self):
+        try:
+            await self.stream.close()
+        except Exception:                # noqa: BLE001
+            pass
+        if not self._settled:
+            self._settled = True
+            await asyncio.to_thread(
+                self.permit.settle, used_tokens=self.usage.total_tokens if self.usage else None
+            )
+
+_STREAM_END = object()
+
+def _pump(tag, stream, model, max_tokens, started, out):
+    """Reader thread of _race_streams: forwards deltas, then _STREAM_END or the error"""
+    first = True
+    try:
+        for chunk in stream:
+            delta = _delta(chunk)
+            if delta:
+                if first:
+                    router.observe(model, "first_token", max_tokens, time.perf_counter() - started)
+                    first = False
+                out.put((tag, delta))
+        out.put((tag, _STREAM_END))
+    except Exception as e:               # noqa: BLE001
+        out.put((tag, e))
+
+def _close_stream(stream, permit):
+    _close_quietly(stream)
+    permit.release()
+
+def _race_streams(open_stream, max_tokens, served):
+    """
+    Yield the deltas of open_stream(model) -> (stream, permit, model). If no
+    token has arrived after the model's first-token hedge delay, a stream
+    on the backup model is opened too; the first to produce a token is kept
+    and the other closed. served["model"] is set to the model kept, and
+    served["usage"] to its usage once it has finished.
+    """
+    opened = []
+    try:
+        started = time.perf_counter()
+        stream, permit, model = _call(open_stream, max_tokens, hedge=False)
+        opened.append((stream, permit))
+        served["model"] = model
+        delay = router.hedge_delay(model, "first_token", max_tokens)
+
+        if delay is None:
+            first = True
+            for chunk in stream:
+                delta = _delta(chunk)
+                if delta:
+                    if first:
+                        router.observe(model, "first_token", max_tokens, time.perf_counter() - started)
+                        first = False
+                    yield delta
+            served["usage"] = stream.usage
+            return
+
+        out = queue.Queue()
+        threading.Thread(target=_pump, args=(0, stream, model, max_tokens, started, out),
+                         daemon=True).start()
+        models, live, winner, hedged = [model], {0}, None, False
+        while True:
+            wait = None if hedged or winner is not None else max(0.0, started + delay - time.perf_counter())
+            try:
+                tag, item = out.get(timeout=wait)
+            except queue.Empty:
+                hedged = True
+                if not _can_hedge():
+                    continue
+                backup = router.backup_for(model)
                 try:
-                    return fn(*a, **kw)
-                finally:
-                    signal.alarm(0)
-                    signal.signal(signal.SIGALRM, old)
-        else:
-            def wrapper(*a, **kw):
-                with concurrent.futures.ThreadPoolExecutor() as ex:
-                    fut = ex.submit(fn, *a, **kw)
-                    try:
-                        return fut.result(timeout=seconds)
-                    except concurrent.futures.TimeoutError:
-                        raise TimeoutError(f"{fn.__name__} timed out after {seconds}s")
-        return functools.wraps(fn)(wrapper)
-    return decorator
-
-def generate_summary(article_title, english_level):
-    """Generate an article summary using OpenAI API"""
+                    b_started = time.perf_counter()
+                    b_stream, b_permit, _ = open_stream(backup)
+                except Exception as e:   # noqa: BLE001
+                    log.warning(f"Hedge stream on {backup} failed to open: {e}")
+                    continue
+                _count("hedges")
+                opened.append((b_stream, b_permit))
+                models.append(backup)
+                live.add(1)
+                threading.Thread(target=_pump, args=(1, b_stream, backup, max_tokens, b_started, out),
+                                 daemon=True).start()
+                continue
+
+            if winner is None:
+                if item is _STREAM_END or isinstance(item, Exception):
+                    live.discard(tag)
+                    if live:
+                        continue
+                    if isinstance(item, Exception):
+                        raise item
+                    return
+                winner = tag
+                served["model"] = models[tag]
+                if tag:
+                    _count("hedge_wins")
+                for other, (s, p) in enumerate(opened):
+                    if other != tag:
+                        _close_stream(s, p)
+                yield item
+            elif tag == winner:
+                if item is _STREAM_END:
+                    served["usage"] = opened[tag][0].usage
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for s, p in opened:
+            _close_stream(s, p)
+
+def _cache_ttl(model):
+    """Full TTL for the primary model's output, a short one for a fallback's"""
+    return None if model == router.primary else GENERATION_FALLBACK_TTL
+
+def _from_library(key):
+    """A generation the primary model made before, put back into the cache"""
+    stored = library.find(key, router.primary)
+    if stored is not None:
+        generation_cache.set(key, stored)
+    return stored
+
+def _lookup(key, label=None):
+    cached = generation_cache.get(key)
+    if cached is not None:
+        _count_generation(label, "cache")
+        return cached
+    stored = _from_library(key)
+    if stored is not None:
+        _count_generation(label, "library")
+    return stored
+
+class RenderedHTML(str):
+    """The finished, rendered HTML that ends a stream (sent with its done event)"""
+
+def _rendered(content, label):
+    """
+    Labelled generations as sanitized, sectioned HTML (each part of a
+    bundle); unlabelled ones (condensed article context) stay text.
+    """
+    if not label:
+        return content
+    if label[0] != "bundle":
+        return render(content)
+    try:
+        parts = json.loads(content)
+    except ValueError:
+        return content                   # rejected by _parse_bundle
+    if not isinstance(parts, dict):
+        return content
+    return json.dumps({k: render(v) if isinstance(v, str) else v for k, v in parts.items()},
+                      ensure_ascii=False)
+
+def _store(key, content, model, label, started, usage=None):
+    """
+    Render, then cache a fresh generation and, when it is labelled (kind,
+    title, level), keep it in the library too. Returns the rendered content.
+    """
+    content = _rendered(content, label)
+    generation_cache.set(key, content, ttl=_cache_ttl(model))
+    seconds = time.perf_counter() - started
+    _count_generation(label, "openai")
+    if usage is not None:
+        kind, level = _metric_labels(label)
+        for type_, tokens in (("prompt", usage.prompt_tokens), ("completion", usage.completion_tokens)):
+            metrics.openai_tokens.inc(tokens or 0, kind=kind, level=level, model=model, type=type_)
+    tracing.add_span("generation", seconds, kind=label[0] if label else None,
+                     title=label[1] if label else None, model=model,
+                     prompt_tokens=getattr(usage, "prompt_tokens", None),
+                     completion_tokens=getattr(usage, "completion_tokens", None))
+    if label:
+        kind, title, level = label
+        library.record(key, kind, title, level, model, content, seconds=seconds, usage=usage)
+    return content
+
+def _complete(prompt, max_tokens, temperature=0.7, response_format=None, label=None):
+    """
+    Run a chat completion, serving repeats from the generation cache or the
+    library. `label` is (kind, title, level) for generations worth storing.
+    """
+    key = make_key(MODEL, prompt, max_tokens=max_tokens, temperature=temperature,
+                   response_format=response_format)
+    cached = _lookup(key, label)
+    if cached is not None:
+        return cached
+
+    extra = {"response_format": response_format} if response_format else {}
+
+    def request(model):
+        # streamed, so a hedge that loses the race can be closed (_hedged)
+        def send(permit):
+            if _cancelled():             # the other attempt won while this one queued
+                raise concurrent.futures.CancelledError()
+            raw = client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=_attempt_timeout(),
+                **extra
+            )
+            stream = _track(raw.parse())
+            parts, usage = [], None
+            with stream:
+                for chunk in stream:
+                    usage = chunk.usage or usage
+                    delta = _delta(chunk)
+                    if delta:
+                        parts.append(delta)
+            permit.settle(raw.headers, usage.total_tokens if usage else None)
+            return "".join(parts), usage, model
+        return governor.run(send, _estimate(prompt, max_tokens))
+
+    def call():
+        started = time.perf_counter()
+        content, usage, model = _call(request, max_tokens)
+        if content:
+            content = _store(key, content, model, label, started, usage)
+        return content
+
+    recheck = (lambda: generation_cache.get(key)) if generation_cache.shared else None
+    return singleflight.do(key, call, recheck=recheck)
+
+
+def _stream(prompt, max_tokens, fallback, temperature=0.7, label=None):
+    """
+    Yield completion text as it arrives, then the rendered HTML as a
+    RenderedHTML. A cached or stored generation (or the fallback) is only
+    the RenderedHTML; a fresh stream is stored once it has finished.
+    """
     if not client:
-        return generate_fallback_summary(article_title, english_level)
-    
+        yield RenderedHTML(fallback())
+        return
+
+    key = make_key(MODEL, prompt, max_tokens=max_tokens, temperature=temperature,
+                   response_format=None)
+    cached = _lookup(key, label)
+    if cached is not None:
+        yield RenderedHTML(cached)
+        return
+
+    def open_stream(model):
+        def send(permit):
+            # the permit's slot stays taken until the stream is consumed;
+            # closing it settles the charge from the usage chunk
+            raw = client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=_attempt_timeout()
+            )
+            permit.settle(raw.headers)
+            return _Metered(raw.parse(), permit.hold()), permit, model
+        return governor.run(send, _estimate(prompt, max_tokens))
+
+    parts = []
+    served = {}
+    started = time.perf_counter()
+    deltas = _race_streams(open_stream, max_tokens, served)
+    try:
+        for delta in deltas:
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        log.error(f"OpenAI streaming error: {e}")
+        # what arrived is shown, but not cached
+        yield RenderedHTML(render("".join(parts)) if parts else fallback())
+        return
+    finally:
+        deltas.close()
+
+    if parts:
+        yield RenderedHTML(_store(key, "".join(parts), served.get("model"), label, started,
+                                  served.get("usage")))
+
+
+def _condense_chunk(chunk, target_tokens):
+    """Map step of map-reduce context preparation (cached like any completion)"""
+    prompt = f"""
+    Condense the following part of a Wikipedia article to at most {int(target_tokens * 0.75)} words.
+    Keep facts, names, dates, numbers and key terms; drop examples and asides.
+    Keep any "## Heading" lines. Return plain text only.
+
+    {chunk}
+    """
+    return _complete(prompt, max_tokens=target_tokens, temperature=0)
+
+def _article_block(article_text):
+    """Prompt section carrying the (budgeted) article text, or '' without one"""
+    if not article_text:
+        return ""
+    summarize = _condense_chunk if client and ARTICLE_CONTEXT_STRATEGY == "map_reduce" else None
+    context = prepare_article_context(article_text, ARTICLE_CONTEXT_TOKENS, summarize)
+    if not context:
+        return ""
+    return f"""
+    Base everything on the article text below (it may be abridged). Do not add facts that are not in it.
+    <article>
+{context}
+    </article>
+    """
+
+def _vocabulary_hint(article_text, english_level, n):
+    """Prompt lines with words picked locally (lexicon.py) for the level, or ''"""
+    if not PROMPT_VOCABULARY_HINTS:
+        return ""
+    words = local_lessons.vocabulary_words(article_text, english_level, n)
+    if not words:
+        return ""
+    return f"""
+    Vocabulary candidates from the article at this level, most useful first: {", ".join(words)}.
+    Take the vocabulary words from this list unless one is clearly unsuitable.
+    """
+
+def build_summary_prompt(article_title, english_level, article_text=None):
+    """Render the summary prompt for a title and English level"""
     # Define complexity based on English level
     complexity = {
         'elementary': 'Use simple vocabulary and grammar suitable for A1-A2 English level. Use short sentences (maximum 8-10 words). Avoid complex words, idioms, and phrasal verbs. Use simple present and past tenses only. Explain any technical terms.',
@@ -78,31 +618,31 @@ def generate_summary(article_title, english_level):
     
     Make the summary engaging, educational, and factually accurate. Maintain all important information while adapting the language to the appropriate level.
     """
+    return prompt + _article_block(article_text)
+
+def generate_summary(article_title, english_level, article_text=None):
+    """Generate an article summary using OpenAI API"""
+    if not client:
+        return generate_fallback_summary(article_title, english_level)
     
+    prompt = build_summary_prompt(article_title, english_level, article_text)
     try:
-        def make_openai_call():
-            return client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=3000,
-                temperature=0.7
-            )
-        
-        response = make_openai_call()
-        return response.choices[0].message.content
+        return _complete(prompt, max_tokens=3000, label=("summary", article_title, english_level))
     except Exception as e:
         log.error(f"OpenAI error: {e}")
         return generate_fallback_summary(article_title, english_level)
 
 def generate_fallback_summary(article_title, english_level):
     """Generate a fallback summary when OpenAI is unavailable"""
+    _count_generation(("summary", article_title, english_level), "fallback")
+    article_title = html.escape(article_title or "")
     level_text = {
         'elementary': 'Elementary (A1-A2)',
         'intermediate': 'Intermediate (B1-B2)', 
         'professional': 'Professional (C1-C2)'
     }.get(english_level, 'Intermediate (B1-B2)')
     
-    return f"""
+    return render(f"""
     <h1>Summary: {article_title}</h1>
     <h2>{level_text} English Summary</h2>
     <p>This is an educational summary about {article_title}. The AI summary service is currently unavailable, but you can still read the full Wikipedia article above to learn more about this topic.</p>
@@ -114,15 +654,10 @@ def generate_fallback_summary(article_title, english_level):
         <li>Try to summarize each paragraph in your own words</li>
         <li>Look for the main ideas and supporting details</li>
     </ul>
-    """
+    """)
 
-def generate_lesson(article_title: str, english_level: str) -> str:
-    if not article_title:
-        raise ValueError("article_title is required")
-    """Generate a comprehensive lesson using OpenAI API"""
-    if not client:
-        return generate_fallback_lesson(article_title, english_level)
-    
+def build_lesson_prompt(article_title: str, english_level: str, article_text: str = None) -> str:
+    """Render the lesson-plan prompt for a title and English level"""
     level_description = {
         'elementary': 'A1-A2 level (elementary) - Use simple vocabulary and grammar. Focus on basic sentence structures, common everyday words, and simple present and past tenses.',
         'intermediate': 'B1-B2 level (intermediate) - Use a moderate range of vocabulary and grammar structures. Include some idioms and phrasal verbs with explanations. Use various tenses and conditional forms.',
@@ -176,32 +711,35 @@ def generate_lesson(article_title: str, english_level: str) -> str:
     Article title:
     {article_title}
     """
+    return prompt + _vocabulary_hint(article_text, english_level, 15) + _article_block(article_text)
+
+def generate_lesson(article_title: str, english_level: str, article_text: str = None) -> str:
+    if not article_title:
+        raise ValueError("article_title is required")
+    """Generate a comprehensive lesson using OpenAI API"""
+    if not client:
+        return generate_fallback_lesson(article_title, english_level, article_text)
     
+    prompt = build_lesson_prompt(article_title, english_level, article_text)
     try:
-        def make_openai_call():
-            return client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=3000,
-                temperature=0.7
-            )
-        
-        response = make_openai_call()
-        return response.choices[0].message.content
+        return _complete(prompt, max_tokens=3000, label=("lesson", article_title, english_level))
     except Exception as e:
         log.error(f"OpenAI error: {e}")
-        return generate_fallback_lesson(article_title, english_level)
+        return generate_fallback_lesson(article_title, english_level, article_text)
 
-def generate_fallback_lesson(article_content, english_level):
-    """Generate a fallback lesson when OpenAI is unavailable"""
-    article_title = "Learning Topic"
+def generate_fallback_lesson(article_title, english_level, article_text=None):
+    """Generate a fallback lesson when OpenAI is unavailable (from the article text when there is one)"""
+    _count_generation(("lesson", article_title, english_level), "fallback")
+    local = local_lessons.lesson(article_title, english_level, article_text)
+    if local:
+        return render(local)
     level_text = {
         'elementary': 'Elementary (A1-A2)',
         'intermediate': 'Intermediate (B1-B2)', 
         'professional': 'Professional (C1-C2)'
     }.get(english_level, 'Intermediate (B1-B2)')
     
-    return f"""
+    return render(f"""
     <h1>English Lesson</h1>
     <h2>{level_text} Level</h2>
     <p>The AI lesson generator is currently unavailable. However, you can still practice your English with this article using these learning activities:</p>
@@ -231,13 +769,10 @@ def generate_fallback_lesson(article_content, english_level):
     
     <h2>4. Writing Exercise</h2>
     <p>Try to write a short summary of the article in your own words. This will help you practice expressing ideas clearly in English.</p>
-    """
+    """)
 
-def generate_exercise(article_title, english_level, exercise_type):
-    """Generate specific exercises using OpenAI API"""
-    if not client:
-        return generate_fallback_exercise(article_title, english_level, exercise_type)
-    
+def build_exercise_prompt(article_title, english_level, exercise_type, article_text=None):
+    """Render the prompt for one exercise type ('grammar', 'vocabulary', 'extra')"""
     prompts = {
         "grammar": f"""
 You are an experienced ESL content writer.
@@ -331,25 +866,29 @@ Output **pure HTML** exactly like this:
 """
 }
     
-    prompt = prompts.get(exercise_type, prompts['extra'])
+    hint = _vocabulary_hint(article_text, english_level, 18) if exercise_type == "vocabulary" else ""
+    return prompts.get(exercise_type, prompts['extra']) + hint + _article_block(article_text)
+
+def generate_exercise(article_title, english_level, exercise_type, article_text=None):
+    """Generate specific exercises using OpenAI API"""
+    if not client:
+        return generate_fallback_exercise(article_title, english_level, exercise_type, article_text)
     
+    prompt = build_exercise_prompt(article_title, english_level, exercise_type, article_text)
     try:
-        def make_openai_call():
-            return client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000,
-                temperature=0.7
-            )
-        
-        response = make_openai_call()
-        return response.choices[0].message.content
+        return _complete(prompt, max_tokens=2000, label=(exercise_type, article_title, english_level))
     except Exception as e:
         log.error(f"OpenAI error: {e}")
-        return generate_fallback_exercise(article_title, english_level, exercise_type)
+        return generate_fallback_exercise(article_title, english_level, exercise_type, article_text)
 
-def generate_fallback_exercise(article_title, english_level, exercise_type):
-    """Generate fallback exercises when OpenAI is unavailable"""
+def generate_fallback_exercise(article_title, english_level, exercise_type, article_text=None):
+    """Generate fallback exercises when OpenAI is unavailable (from the article text when there is one)"""
+    _count_generation((exercise_type, article_title, english_level), "fallback")
+    build = local_lessons.EXERCISES.get(exercise_type, local_lessons.extra_exercise)
+    local = build(article_title, english_level, article_text)
+    if local:
+        return render(local)
+    article_title = html.escape(article_title or "")
     level_text = {
         'elementary': 'Elementary (A1-A2)',
         'intermediate': 'Intermediate (B1-B2)', 
@@ -357,7 +896,7 @@ def generate_fallback_exercise(article_title, english_level, exercise_type):
     }.get(english_level, 'Intermediate (B1-B2)')
     
     if exercise_type == 'grammar':
-        return f"""
+        return render(f"""
         <h1>Grammar Exercise - {level_text}</h1>
         <p>The AI exercise generator is currently unavailable. Practice grammar with these activities related to {article_title}:</p>
         
@@ -369,9 +908,9 @@ def generate_fallback_exercise(article_title, english_level, exercise_type):
             <li><strong>Passive Voice:</strong> Find sentences written in passive voice and rewrite them in active voice.</li>
             <li><strong>Conditional Sentences:</strong> Look for any conditional statements and identify their type.</li>
         </ol>
-        """
+        """)
     elif exercise_type == 'vocabulary':
-        return f"""
+        return render(f"""
         <h1>Vocabulary Exercise - {level_text}</h1>
         <p>The AI exercise generator is currently unavailable. Practice vocabulary with these activities related to {article_title}:</p>
         
@@ -383,9 +922,9 @@ def generate_fallback_exercise(article_title, english_level, exercise_type):
             <li><strong>Synonyms and Antonyms:</strong> For 15 key words from the article, find synonyms and antonyms.</li>
             <li><strong>Usage Practice:</strong> Write original sentences using 10 new vocabulary words from the article.</li>
         </ol>
-        """
+        """)
     else:
-        return f"""
+        return render(f"""
         <h1>Extra Practice Exercise - {level_text}</h1>
         <p>The AI exercise generator is currently unavailable. Practice English with these activities related to {article_title}:</p>
         
@@ -397,4 +936,521 @@ def generate_fallback_exercise(article_title, english_level, exercise_type):
             <li><strong>Presentation Prep:</strong> Prepare a 5-minute presentation about the topic for classmates.</li>
             <li><strong>Research Extension:</strong> Find one additional source about this topic and compare the information.</li>
         </ol>
-        """
+        """)
+
+# ------------------------------------------------------------------
+# Lesson bundle: the lesson plan and all three exercise blocks at once
+# ------------------------------------------------------------------
+
+EXERCISE_TYPES = ("grammar", "vocabulary", "extra")
+BUNDLE_PARTS = ("lesson",) + EXERCISE_TYPES
+
+BUNDLE_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "lesson_bundle",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {part: {"type": "string"} for part in BUNDLE_PARTS},
+            "required": list(BUNDLE_PARTS),
+            "additionalProperties": False,
+        },
+    },
+}
+
+_bundle_pool = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="bundle")
+
+def build_bundle_prompt(article_title, english_level, article_text=None):
+    """One prompt asking for every bundle part as a field of a JSON object"""
+    parts = {"lesson": build_lesson_prompt(article_title, english_level)}
+    for exercise_type in EXERCISE_TYPES:
+        parts[exercise_type] = build_exercise_prompt(article_title, english_level, exercise_type)
+    instructions = "\n".join(
+        f"=== Field \"{part}\" ===\n{prompt.strip()}\n" for part, prompt in parts.items()
+    )
+    return f"""
+    You are preparing a complete English lesson about "{article_title}" for {english_level} learners.
+    Return a JSON object with the fields {", ".join(BUNDLE_PARTS)}. Each field is an HTML
+    string written according to its own instructions below. Do not repeat content across fields.
+
+{instructions}
+    """ + _vocabulary_hint(article_text, english_level, 20) + _article_block(article_text)
+
+def _parse_bundle(content):
+    bundle = json.loads(content)
+    missing = [part for part in BUNDLE_PARTS if not bundle.get(part)]
+    if missing:
+        raise ValueError(f"bundle is missing {missing}")
+    return {part: bundle[part] for part in BUNDLE_PARTS}
+
+def generate_lesson_bundle(article_title, english_level, article_text=None, mode=LESSON_BUNDLE_MODE,
+                           strict=False):
+    """
+    {"lesson", "grammar", "vocabulary", "extra"} HTML for one article and level.
+
+    "parallel" runs the four usual generations side by side, so the
+    wall-clock time is the slowest one and each part is cached and
+    coalesced on its own. "combined" asks for all of them in a single
+    structured completion, paying for the article context once; it falls
+    back to "parallel" if that response cannot be used.
+
+    With `strict` (background jobs) a part that cannot be generated raises,
+    as in generate_part, instead of being filled with fallback content.
+    """
+    if not article_title:
+        raise ValueError("article_title is required")
+    if strict and not client:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+
+    if mode == "combined" and client:
+        try:
+            prompt = build_bundle_prompt(article_title, english_level, article_text)
+            return _parse_bundle(_complete(prompt, max_tokens=9000, response_format=BUNDLE_SCHEMA,
+                                           label=("bundle", article_title, english_level)))
+        except Exception as e:
+            log.error(f"Combined bundle failed, generating parts separately: {e}")
+
+    # copy_context: the parts run under the caller's deadline
+    if strict:
+        futures = {part: _bundle_pool.submit(
+            contextvars.copy_context().run, generate_part, part, article_title, english_level, article_text
+        ) for part in BUNDLE_PARTS}
+        return {part: future.result() for part, future in futures.items()}
+    futures = {"lesson": _bundle_pool.submit(
+        contextvars.copy_context().run, generate_lesson, article_title, english_level, article_text
+    )}
+    for exercise_type in EXERCISE_TYPES:
+        futures[exercise_type] = _bundle_pool.submit(
+            contextvars.copy_context().run,
+            generate_exercise, article_title, english_level, exercise_type, article_text
+        )
+    return {part: future.result() for part, future in futures.items()}
+
+# ------------------------------------------------------------------
+# Single generations that raise (background jobs, pregenerate.py)
+# ------------------------------------------------------------------
+
+GENERATION_KINDS = ("summary",) + BUNDLE_PARTS
+
+def generate_part(kind, article_title, english_level, article_text=None):
+    """
+    One generation ("summary", "lesson" or an exercise type) exactly as the
+    live route makes it, so it shares the route's cache entry. Raises
+    instead of returning a fallback; fallbacks are never cached.
+    """
+    if not client:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    label = (kind, article_title, english_level)
+    if kind == "summary":
+        prompt = build_summary_prompt(article_title, english_level, article_text)
+        return _complete(prompt, max_tokens=3000, label=label)
+    if kind == "lesson":
+        prompt = build_lesson_prompt(article_title, english_level, article_text)
+        return _complete(prompt, max_tokens=3000, label=label)
+    if kind in EXERCISE_TYPES:
+        prompt = build_exercise_prompt(article_title, english_level, kind, article_text)
+        return _complete(prompt, max_tokens=2000, label=label)
+    raise ValueError(f"unknown generation kind {kind!r}")
+
+def warm_generation(kind, article_title, english_level, article_text=None):
+    """generate_part at batch priority, for pregenerate.py"""
+    with batch_priority():
+        return generate_part(kind, article_title, english_level, article_text)
+
+# ------------------------------------------------------------------
+# Streaming variants (text chunks, consumed by the SSE routes)
+# ------------------------------------------------------------------
+
+def stream_summary(article_title, english_level, article_text=None):
+    """Stream an article summary chunk by chunk"""
+    return _stream(
+        build_summary_prompt(article_title, english_level, article_text), 3000,
+        lambda: generate_fallback_summary(article_title, english_level),
+        label=("summary", article_title, english_level),
+    )
+
+def stream_lesson(article_title, english_level, article_text=None):
+    """Stream a lesson plan chunk by chunk"""
+    if not article_title:
+        raise ValueError("article_title is required")
+    return _stream(
+        build_lesson_prompt(article_title, english_level, article_text), 3000,
+        lambda: generate_fallback_lesson(article_title, english_level, article_text),
+        label=("lesson", article_title, english_level),
+    )
+
+def stream_exercise(article_title, english_level, exercise_type, article_text=None):
+    """Stream one exercise block chunk by chunk"""
+    return _stream(
+        build_exercise_prompt(article_title, english_level, exercise_type, article_text), 2000,
+        lambda: generate_fallback_exercise(article_title, english_level, exercise_type, article_text),
+        label=(exercise_type, article_title, english_level),
+    )
+
+# ------------------------------------------------------------------
+# Async variants (ASGI mode). Same prompts, cache and fallbacks as the
+# sync functions; identical in-flight calls within the event loop are
+# shared through a task map instead of the thread-based single-flight.
+# ------------------------------------------------------------------
+
+_async_inflight = {}
+
+async def _atimed(fn, model, max_tokens):
+    """Async _timed"""
+    start = time.perf_counter()
+    try:
+        result = await fn(model)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        router.observe(model, "complete", max_tokens, time.perf_counter() - start,
+                       ok=False, status=_error_status(e))
+        raise
+    router.observe(model, "complete", max_tokens, time.perf_counter() - start)
+    return result
+
+async def _ahedged(fn, model, max_tokens):
+    """Async _hedged; the losing attempt is cancelled, which aborts its HTTP request"""
+    delay = router.hedge_delay(model, "complete", max_tokens)
+    if delay is None:
+        return await _atimed(fn, model, max_tokens)
+    tasks = [asyncio.ensure_future(_atimed(fn, model, max_tokens))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and _can_hedge():
+            _count("hedges")
+            tasks.append(asyncio.ensure_future(_atimed(fn, router.backup_for(model), max_tokens)))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        _count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _awith_retries(fn):
+    """Async _with_retries; fn returns an awaitable"""
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        try:
+            return await fn()
+        except RETRYABLE as e:
+            if attempt == OPENAI_MAX_ATTEMPTS - 1:
+                raise
+            delay = _retry_delay(attempt)
+            if remaining(OPENAI_ATTEMPT_TIMEOUT) < delay + MIN_ATTEMPT:
+                raise
+            log.warning(f"OpenAI attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            _count("retries")
+            await asyncio.sleep(delay)
+
+async def _acall(fn, max_tokens, hedge=True):
+    """Async _call; fn(model) returns an awaitable"""
+    chain = router.models
+    for i, model in enumerate(chain):
+        try:
+            if hedge:
+                return await _awith_retries(lambda: _ahedged(fn, model, max_tokens))
+            return await _awith_retries(lambda: fn(model))
+        except openai.APIError as e:
+            if i == len(chain) - 1:
+                raise
+            log.warning(f"{model} failed ({e}), falling back to {chain[i + 1]}")
+            _count("fallbacks")
+
+async def _apump(tag, stream, model, max_tokens, started, out):
+    """Async _pump"""
+    first = True
+    try:
+        async for chunk in stream:
+            delta = _delta(chunk)
+            if delta:
+                if first:
+                    router.observe(model, "first_token", max_tokens, time.perf_counter() - started)
+                    first = False
+                out.put_nowait((tag, delta))
+        out.put_nowait((tag, _STREAM_END))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:               # noqa: BLE001
+        out.put_nowait((tag, e))
+
+async def _aclose_stream(stream, permit):
+    try:
+        await stream.close()
+    except Exception:                    # noqa: BLE001
+        pass
+    permit.release()
+
+async def _arace_streams(open_stream, max_tokens, served):
+    """Async _race_streams; the losing stream's reader is cancelled and its response closed"""
+    opened, pumps = [], []
+    try:
+        started = time.perf_counter()
+        stream, permit, model = await _acall(open_stream, max_tokens, hedge=False)
+        opened.append((stream, permit))
+        served["model"] = model
+        delay = router.hedge_delay(model, "first_token", max_tokens)
+
+        if delay is None:
+            first = True
+            async for chunk in stream:
+                delta = _delta(chunk)
+                if delta:
+                    if first:
+                        router.observe(model, "first_token", max_tokens, time.perf_counter() - started)
+                        first = False
+                    yield delta
+            served["usage"] = stream.usage
+            return
+
+        out = asyncio.Queue()
+        pumps.append(asyncio.ensure_future(_apump(0, stream, model, max_tokens, started, out)))
+        models, live, winner, hedged = [model], {0}, None, False
+        while True:
+            wait = None if hedged or winner is not None else max(0.0, started + delay - time.perf_counter())
+            try:
+                tag, item = await asyncio.wait_for(out.get(), wait)
+            except asyncio.TimeoutError:
+                hedged = True
+                if not _can_hedge():
+                    continue
+                backup = router.backup_for(model)
+                try:
+                    b_started = time.perf_counter()
+                    b_stream, b_permit, _ = await open_stream(backup)
+                except Exception as e:   # noqa: BLE001
+                    log.warning(f"Hedge stream on {backup} failed to open: {e}")
+                    continue
+                _count("hedges")
+                opened.append((b_stream, b_permit))
+                models.append(backup)
+                live.add(1)
+                pumps.append(asyncio.ensure_future(
+                    _apump(1, b_stream, backup, max_tokens, b_started, out)))
+                continue
+
+            if winner is None:
+                if item is _STREAM_END or isinstance(item, Exception):
+                    live.discard(tag)
+                    if live:
+                        continue
+                    if isinstance(item, Exception):
+                        raise item
+                    return
+                winner = tag
+                served["model"] = models[tag]
+                if tag:
+                    _count("hedge_wins")
+                for other, (s, p) in enumerate(opened):
+                    if other != tag:
+                        pumps[other].cancel()
+                        await _aclose_stream(s, p)
+                yield item
+            elif tag == winner:
+                if item is _STREAM_END:
+                    served["usage"] = opened[tag][0].usage
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for task in pumps:
+            task.cancel()
+        for s, p in opened:
+            await _aclose_stream(s, p)
+
+async def _alookup(key, label=None):
+    """Async _lookup; the library is read in a worker thread"""
+    cached = generation_cache.get(key)
+    if cached is not None:
+        _count_generation(label, "cache")
+        return cached
+    stored = await asyncio.to_thread(_from_library, key)
+    if stored is not None:
+        _count_generation(label, "library")
+    return stored
+
+async def _acomplete(prompt, max_tokens, temperature=0.7, response_format=None, label=None):
+    """Async _complete"""
+    key = make_key(MODEL, prompt, max_tokens=max_tokens, temperature=temperature,
+                   response_format=response_format)
+    cached = await _alookup(key, label)
+    if cached is not None:
+        return cached
+
+    extra = {"response_format": response_format} if response_format else {}
+
+    def request(model):
+        async def send(permit):
+            raw = await async_client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=_attempt_timeout(),
+                **extra
+            )
+            response = raw.parse()
+            await asyncio.to_thread(
+                permit.settle, raw.headers, response.usage.total_tokens if response.usage else None
+            )
+            return response, model
+        return governor.arun(send, _estimate(prompt, max_tokens))
+
+    async def call():
+        started = time.perf_counter()
+        response, model = await _acall(request, max_tokens)
+        content = response.choices[0].message.content
+        if content:
+            content = _store(key, content, model, label, started, response.usage)
+        return content
+
+    task = _async_inflight.get(key)
+    if task is None:
+        task = _async_inflight[key] = asyncio.ensure_future(call())
+        task.add_done_callback(lambda _: _async_inflight.pop(key, None))
+    # shield: one impatient client disconnecting must not cancel the others
+    return await asyncio.shield(task)
+
+async def _astream(build_prompt, max_tokens, fallback, temperature=0.7, label=None):
+    """Async _stream; build_prompt runs in a worker thread"""
+    if not async_client:
+        yield RenderedHTML(fallback())
+        return
+
+    prompt = await asyncio.to_thread(build_prompt)
+    key = make_key(MODEL, prompt, max_tokens=max_tokens, temperature=temperature,
+                   response_format=None)
+    cached = await _alookup(key, label)
+    if cached is not None:
+        yield RenderedHTML(cached)
+        return
+
+    def open_stream(model):
+        async def send(permit):
+            raw = await async_client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=_attempt_timeout()
+            )
+            await asyncio.to_thread(permit.settle, raw.headers)
+            return _AsyncMetered(raw.parse(), permit.hold()), permit, model
+        return governor.arun(send, _estimate(prompt, max_tokens))
+
+    parts = []
+    served = {}
+    started = time.perf_counter()
+    deltas = _arace_streams(open_stream, max_tokens, served)
+    try:
+        async for delta in deltas:
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        log.error(f"OpenAI streaming error: {e}")
+        # what arrived is shown, but not cached
+        yield RenderedHTML(render("".join(parts)) if parts else fallback())
+        return
+    finally:
+        await deltas.aclose()
+
+    if parts:
+        yield RenderedHTML(_store(key, "".join(parts), served.get("model"), label, started,
+                                  served.get("usage")))
+
+async def agenerate_summary(article_title, english_level, article_text=None):
+    """Async generate_summary"""
+    if not async_client:
+        return generate_fallback_summary(article_title, english_level)
+    try:
+        prompt = await asyncio.to_thread(build_summary_prompt, article_title, english_level, article_text)
+        return await _acomplete(prompt, max_tokens=3000, label=("summary", article_title, english_level))
+    except Exception as e:
+        log.error(f"OpenAI error: {e}")
+        return generate_fallback_summary(article_title, english_level)
+
+async def agenerate_lesson(article_title, english_level, article_text=None):
+    """Async generate_lesson"""
+    if not article_title:
+        raise ValueError("article_title is required")
+    if not async_client:
+        return generate_fallback_lesson(article_title, english_level, article_text)
+    try:
+        prompt = await asyncio.to_thread(build_lesson_prompt, article_title, english_level, article_text)
+        return await _acomplete(prompt, max_tokens=3000, label=("lesson", article_title, english_level))
+    except Exception as e:
+        log.error(f"OpenAI error: {e}")
+        return generate_fallback_lesson(article_title, english_level, article_text)
+
+async def agenerate_exercise(article_title, english_level, exercise_type, article_text=None):
+    """Async generate_exercise"""
+    if not async_client:
+        return generate_fallback_exercise(article_title, english_level, exercise_type, article_text)
+    try:
+        prompt = await asyncio.to_thread(
+            build_exercise_prompt, article_title, english_level, exercise_type, article_text
+        )
+        return await _acomplete(prompt, max_tokens=2000, label=(exercise_type, article_title, english_level))
+    except Exception as e:
+        log.error(f"OpenAI error: {e}")
+        return generate_fallback_exercise(article_title, english_level, exercise_type, article_text)
+
+def astream_summary(article_title, english_level, article_text=None):
+    """Async stream_summary"""
+    return _astream(
+        lambda: build_summary_prompt(article_title, english_level, article_text), 3000,
+        lambda: generate_fallback_summary(article_title, english_level),
+        label=("summary", article_title, english_level),
+    )
+
+def astream_lesson(article_title, english_level, article_text=None):
+    """Async stream_lesson"""
+    if not article_title:
+        raise ValueError("article_title is required")
+    return _astream(
+        lambda: build_lesson_prompt(article_title, english_level, article_text), 3000,
+        lambda: generate_fallback_lesson(article_title, english_level, article_text),
+        label=("lesson", article_title, english_level),
+    )
+
+def astream_exercise(article_title, english_level, exercise_type, article_text=None):
+    """Async stream_exercise"""
+    return _astream(
+        lambda: build_exercise_prompt(article_title, english_level, exercise_type, article_text), 2000,
+        lambda: generate_fallback_exercise(article_title, english_level, exercise_type, article_text),
+        label=(exercise_type, article_title, english_level),
+    )
+
+async def agenerate_lesson_bundle(article_title, english_level, article_text=None,
+                                  mode=LESSON_BUNDLE_MODE):
+    """Async generate_lesson_bundle"""
+    if not article_title:
+        raise ValueError("article_title is required")
+
+    if mode == "combined" and async_client:
+        try:
+            prompt = await asyncio.to_thread(
+                build_bundle_prompt, article_title, english_level, article_text
+            )
+            content = await _acomplete(prompt, max_tokens=9000, response_format=BUNDLE_SCHEMA,
+                                       label=("bundle", article_title, english_level))
+            return _parse_bundle(content)
+        except Exception as e:
+            log.error(f"Combined bundle failed, generating parts separately: {e}")
+
+    results = await asyncio.gather(
+        agenerate_lesson(article_title, english_level, article_text),
+        *(agenerate_exercise(article_title, english_level, exercise_type, article_text)
+          for exercise_type in EXERCISE_TYPES),
+    )
+    return dict(zip(BUNDLE_PARTS, results))
@@ -0,0 +1,202 @@
+"""
+Warm the generation cache for the articles people actually read.
+
+Runs the summary, the lesson and all three exercise types for every
+(title, level) through a bounded worker pool, at most --rate upstream
+generations per minute, and writes them into the configured generation
+cache under the same keys the live routes use. Serving a warmed article
+then costs no LLM latency.
+
+    python pregenerate.py "Solar System" "Ada Lovelace"
+    python pregenerate.py --access-log access.log --top 300
+    python pregenerate.py --titles-file hot.txt --levels intermediate --kinds summary,lesson
+
+Every finished job is appended to a JSONL checkpoint; rerunning the same
+command skips those and retries whatever failed. The cache must be shared
+(GENERATION_CACHE_BACKEND=sqlite or redis) for the web workers to see it.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote
+
+from config import ENGLISH_LEVELS, GENERATION_CACHE_BACKEND
+from openai_service import GENERATION_KINDS, warm_generation
+from wikipedia_api import get_full_article
+
+log = logging.getLogger(__name__)
+
+# "GET /lesson/Solar_System?level=elementary HTTP/1.1" in a gunicorn/nginx combined log
+ACCESS_LOG_RE = re.compile(r'"GET /(?:article|summary|lesson)/([^?\s"]+)(?:\?([^\s"]*))? HTTP')
+
+
+class RateLimiter:
+    """Spaces calls at least 60/per_minute seconds apart across threads"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Checkpoint:
+    """Append-only JSONL of finished jobs; the last record per job wins"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            status = {}
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue             # torn last line after a crash
+                    status[(rec["title"], rec["level"], rec["kind"])] = rec["status"]
+            self.done = {job for job, s in status.items() if s == "ok"}
+
+    def record(self, job, status, **extra):
+        title, level, kind = job
+        line = json.dumps(dict(title=title, level=level, kind=kind, status=status,
+                               at=time.time(), **extra), ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+        if status == "ok":
+            self.done.add(job)
+
+
+def top_titles(log_path, top):
+    """Most requested article titles in an access log"""
+    counts = Counter()
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = ACCESS_LOG_RE.search(line)
+            if m:
+                counts[unquote(m.group(1)).replace("_", " ")] += 1
+    return [title for title, _ in counts.most_common(top)]
+
+
+def _article(title, articles, lock):
+    """(canonical title, extract) fetched once per title"""
+    with lock:
+        pending = articles.get(title)
+        if pending is None:
+            pending = articles[title] = {"event": threading.Event()}
+            owner = True
+        else:
+            owner = False
+    if owner:
+        try:
+            art = get_full_article(title)
+            pending["value"] = (art["title"], art.get("content"))
+        except Exception as e:           # noqa: BLE001
+            pending["error"] = e
+        pending["event"].set()
+    pending["event"].wait()
+    if "error" in pending:
+        raise pending["error"]
+    return pending["value"]
+
+
+def run(titles, levels, kinds, workers, rate, checkpoint_path, retries=2):
+    checkpoint = Checkpoint(checkpoint_path)
+    jobs = [(t, l, k) for t in titles for l in levels for k in kinds]
+    todo = [job for job in jobs if job not in checkpoint.done]
+    log.info("%d jobs, %d already done, %d to run", len(jobs), len(jobs) - len(todo), len(todo))
+
+    limiter = RateLimiter(rate)
+    articles, articles_lock = {}, threading.Lock()
+
+    def work(job):
+        title, level, kind = job
+        canonical, text = _article(title, articles, articles_lock)
+        for attempt in range(retries + 1):
+            limiter.wait()
+            start = time.perf_counter()
+            try:
+                warm_generation(kind, canonical, level, text)
+                return time.perf_counter() - start
+            except Exception as e:       # noqa: BLE001
+                if attempt == retries:
+                    raise
+                log.warning("%s/%s/%s failed (%s), retrying", title, level, kind, e)
+                time.sleep(2 ** attempt)
+
+    ok = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pregen") as pool:
+        futures = {pool.submit(work, job): job for job in todo}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                seconds = future.result()
+                checkpoint.record(job, "ok", seconds=round(seconds, 2))
+                ok += 1
+            except Exception as e:       # noqa: BLE001
+                checkpoint.record(job, "failed", error=str(e))
+                log.error("%s/%s/%s gave up: %s", *job, e)
+                failed += 1
+            if (ok + failed) % 25 == 0:
+                log.info("%d/%d done, %d failed", ok + failed, len(todo), failed)
+
+    log.info("finished: %d generated, %d failed", ok, failed)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("titles", nargs="*", help="article titles")
+    parser.add_argument("--titles-file", help="file with one title per line")
+    parser.add_argument("--access-log", help="take the most requested titles from this access log")
+    parser.add_argument("--top", type=int, default=300, help="how many titles to take from --access-log")
+    parser.add_argument("--levels", default=",".join(ENGLISH_LEVELS))
+    parser.add_argument("--kinds", default=",".join(GENERATION_KINDS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=60, help="max generations per minute (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--checkpoint", default="pregenerate.checkpoint.jsonl")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    titles = list(args.titles)
+    if args.titles_file:
+        with open(args.titles_file, encoding="utf-8") as f:
+            titles += [line.strip() for line in f if line.strip()]
+    if args.access_log:
+        titles += top_titles(args.access_log, args.top)
+    titles = list(dict.fromkeys(titles))
+    if not titles:
+        parser.error("no titles: pass titles, --titles-file or --access-log")
+
+    levels = args.levels.split(",")
+    kinds = args.kinds.split(",")
+    unknown = [l for l in levels if l not in ENGLISH_LEVELS] + [k for k in kinds if k not in GENERATION_KINDS]
+    if unknown:
+        parser.error(f"unknown level/kind: {', '.join(unknown)}")
+    if GENERATION_CACHE_BACKEND in ("none", "memory"):
+        log.warning("GENERATION_CACHE_BACKEND=%s is not shared; the web workers will not see "
+                    "these generations", GENERATION_CACHE_BACKEND)
+
+    return 1 if run(titles, levels, kinds, args.workers, args.rate, args.checkpoint, args.retries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
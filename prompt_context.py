@@ -0,0 +1,183 @@
+"""
+Turn a fetched Wikipedia extract into prompt context that fits a token
+budget.
+
+The extract is cleaned (markup, reference sections), split on its section
+headings, and then either passed whole, truncated section by section
+(lead first, every section keeps its opening sentences), or for very long
+pages condensed chunk by chunk with a caller-supplied summarizer before
+truncation (map-reduce).
+"""
+import re
+import html
+import logging
+import functools
+
+log = logging.getLogger(__name__)
+
+# Sections that carry no teachable content
+SKIP_SECTIONS = {
+    "references", "see also", "external links", "notes", "further reading",
+    "bibliography", "sources", "citations", "footnotes", "gallery",
+}
+# Share of the budget the lead section may take
+LEAD_SHARE = 0.4
+# Use the summarizer once the text is this many times over budget
+MAP_REDUCE_FACTOR = 3
+
+HEADING_RE = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.M)
+HTML_HEADING_RE = re.compile(r"<h([2-6])[^>]*>(.*?)</h\1>", re.S | re.I)
+BLOCK_END_RE = re.compile(r"</p>|</li>|</tr>|<br\s*/?>", re.I)
+TAG_RE = re.compile(r"<[^>]+>")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@functools.lru_cache(maxsize=1)
+def _encoder():
+    """tiktoken encoder if the optional package is available"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:               # noqa: BLE001
+        log.info("tiktoken unavailable (%s); estimating tokens from length", e)
+        return None
+
+
+def count_tokens(text):
+    enc = _encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # ~4 characters per token for English prose
+    return (len(text) + 3) // 4
+
+
+def clean_article_text(content):
+    """Plain text with '== Heading ==' markers, from a plain or HTML extract"""
+    if not content:
+        return ""
+    text = content
+    if "<" in text:
+        text = HTML_HEADING_RE.sub(
+            lambda m: "\n{0} {1} {0}\n".format("=" * int(m.group(1)), TAG_RE.sub("", m.group(2))),
+            text,
+        )
+        text = BLOCK_END_RE.sub("\n", text)
+        text = TAG_RE.sub("", text)
+    text = html.unescape(text)
+    text = "\n".join(" ".join(line.split()) for line in text.splitlines())
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def split_sections(text):
+    """[(heading, level, body)]; the lead comes first with heading ''"""
+    sections = []
+    heading, level, pos = "", 1, 0
+    for m in HEADING_RE.finditer(text):
+        sections.append((heading, level, text[pos:m.start()].strip()))
+        heading, level, pos = m.group(2).strip(), len(m.group(1)), m.end()
+    sections.append((heading, level, text[pos:].strip()))
+    return sections
+
+
+def _drop_skipped(sections):
+    kept, skip_level = [], None
+    for heading, level, body in sections:
+        if skip_level is not None and level > skip_level:
+            continue                     # subsection of a skipped section
+        skip_level = level if heading.lower() in SKIP_SECTIONS else None
+        if skip_level is None:
+            kept.append((heading, level, body))
+    return kept
+
+
+def truncate_to_tokens(text, budget):
+    """Longest prefix of whole sentences within budget"""
+    if budget <= 0:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    out, used = [], 0
+    for sentence in SENTENCE_RE.split(text):
+        cost = count_tokens(sentence) + 1
+        if used + cost > budget:
+            break
+        out.append(sentence)
+        used += cost
+    if not out:
+        # one huge sentence: hard cut
+        return text[:budget * 4].rsplit(" ", 1)[0] + " …"
+    return " ".join(out)
+
+
+def _render(heading, level, body):
+    return f"{'#' * level} {heading}\n{body}" if heading else body
+
+
+def fit_sections(sections, budget):
+    """
+    Section-aware truncation: the lead gets up to LEAD_SHARE of the budget,
+    the rest is shared evenly by the remaining sections in order, with any
+    unused share rolling over to the sections after it.
+    """
+    if not sections:
+        return ""
+    (_, _, lead), rest = sections[0], sections[1:]
+    lead_budget = budget if not rest else int(budget * LEAD_SHARE)
+    parts = [truncate_to_tokens(lead, lead_budget)] if lead else []
+    remaining = budget - sum(count_tokens(p) for p in parts)
+
+    for i, (heading, level, body) in enumerate(rest):
+        share = remaining // (len(rest) - i)
+        title = _render(heading, level, "")
+        body = truncate_to_tokens(body, share - count_tokens(title))
+        if not body:
+            continue
+        chunk = _render(heading, level, body)
+        parts.append(chunk)
+        remaining -= count_tokens(chunk)
+    return "\n\n".join(parts)
+
+
+def _chunk_sections(sections, chunk_tokens):
+    """Group rendered sections into chunks of about chunk_tokens"""
+    chunks, current, used = [], [], 0
+    for heading, level, body in sections:
+        piece = _render(heading, level, body)
+        cost = count_tokens(piece)
+        if current and used + cost > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += cost
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def prepare_article_context(content, budget, summarize=None):
+    """
+    Cleaned article text within `budget` tokens.
+
+    `summarize(chunk, target_tokens)` enables map-reduce for pages more
+    than MAP_REDUCE_FACTOR times over budget; without it long pages are
+    truncated section by section.
+    """
+    text = clean_article_text(content)
+    if not text or count_tokens(text) <= budget:
+        return text
+
+    sections = _drop_skipped(split_sections(text))
+    total = sum(count_tokens(_render(*s)) for s in sections)
+    if total <= budget:
+        return "\n\n".join(_render(*s) for s in sections)
+
+    if summarize is not None and total > budget * MAP_REDUCE_FACTOR:
+        chunks = _chunk_sections(sections, budget)
+        target = max(budget // len(chunks), 50)
+        try:
+            condensed = "\n\n".join(summarize(chunk, target) for chunk in chunks)
+            sections = split_sections(condensed)
+        except Exception as e:           # noqa: BLE001
+            log.warning("Map-reduce condensing failed, truncating instead: %s", e)
+
+    return fit_sections(sections, budget)
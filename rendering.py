@@ -0,0 +1,166 @@
+"""
+Server-side rendering of model output.
+
+Generations come back as HTML, markdown or a mix of both, sometimes inside
+a code fence. render() turns them into sanitized HTML split into sections,
+once per generation, before they are cached and stored in the library;
+clients insert the result as is (puter_enhanced.js no longer formats it).
+
+- fences are stripped; markdown-only text goes through `markdown`, HTML
+  gets the old client-side fixes (stray # headings, **bold**, bare
+  paragraphs wrapped in <p>)
+- sanitizing keeps an allowlist of tags and attributes: scripts, styles,
+  embeds and comments are dropped with their content, event handlers and
+  inline styles are removed, links must be http(s), mailto or fragments
+- every top-level <h2> starts a new <section class="ai-section">, so a
+  page can address, collapse or lazily show parts of a lesson
+"""
+import re
+import html
+from html.parser import HTMLParser
+
+import markdown
+
+ALLOWED_TAGS = {
+    "h1", "h2", "h3", "h4", "h5", "h6", "p", "br", "hr", "div", "span", "section",
+    "strong", "b", "em", "i", "u", "s", "mark", "small", "sub", "sup", "abbr", "code", "pre",
+    "blockquote", "ul", "ol", "li", "dl", "dt", "dd", "details", "summary",
+    "table", "caption", "thead", "tbody", "tfoot", "tr", "th", "td", "a",
+}
+VOID_TAGS = {"br", "hr"}
+# dropped together with everything inside them
+DROP_CONTENT = {
+    "script", "style", "iframe", "object", "embed", "template", "noscript", "svg", "math",
+    "head", "title", "form", "select", "textarea", "button",
+}
+ALLOWED_ATTRIBUTES = {"class", "title", "lang", "dir"}
+TAG_ATTRIBUTES = {
+    "a": {"href"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan", "scope"},
+    "ol": {"start", "type"},
+    "details": {"open"},
+}
+# opening tag -> (open elements it implicitly ends, elements that stop the search), as browsers parse it
+BLOCK_TAGS = {
+    "h1", "h2", "h3", "h4", "h5", "h6", "p", "div", "section", "pre", "blockquote", "hr",
+    "ul", "ol", "dl", "details", "table",
+}
+_P_END = ({"p"}, {"li", "dd", "dt", "td", "th", "div", "section", "details", "blockquote"})
+IMPLIED_END = dict.fromkeys(BLOCK_TAGS, _P_END)
+IMPLIED_END.update({
+    "li": ({"li", "p"}, {"ul", "ol"}),
+    "dt": ({"dt", "dd", "p"}, {"dl"}),
+    "dd": ({"dt", "dd", "p"}, {"dl"}),
+    "tr": ({"tr", "td", "th"}, {"table", "thead", "tbody", "tfoot"}),
+    "td": ({"td", "th"}, {"tr"}),
+    "th": ({"td", "th"}, {"tr"}),
+    "thead": ({"thead", "tbody", "tr", "td", "th"}, {"table"}),
+    "tbody": ({"thead", "tbody", "tr", "td", "th"}, {"table"}),
+})
+SAFE_URL = re.compile(r"^(?:https?:|mailto:|#|/(?!/))", re.IGNORECASE)
+
+SECTION_CLASS = "ai-section"
+_FENCE = re.compile(r"^\s*```[\w-]*[ \t]*\n?|\n?```\s*$")
+_HTML_BLOCK = re.compile(r"<(?:h[1-6]|p|div|ul|ol|table|section|details|blockquote)\b", re.IGNORECASE)
+_MD_HEADING = re.compile(r"^(#{1,3}) (.*)$", re.MULTILINE)
+_MD_BOLD = re.compile(r"\*\*(.+?)\*\*")
+
+
+def to_html(text):
+    """Model output (HTML, markdown or a mix, maybe fenced) as HTML"""
+    text = _FENCE.sub("", text.strip())
+    if not _HTML_BLOCK.search(text):
+        return markdown.markdown(text, extensions=["extra", "sane_lists"])
+    text = _MD_HEADING.sub(lambda m: f"<h{len(m.group(1))}>{m.group(2)}</h{len(m.group(1))}>", text)
+    text = _MD_BOLD.sub(r"<strong>\1</strong>", text)
+    blocks = [b.strip() for b in re.split(r"\n{2,}", text) if b.strip()]
+    return "\n".join(b if b.startswith("<") else f"<p>{b}</p>" for b in blocks)
+
+
+class _Sanitizer(HTMLParser):
+    """Allowlist re-serializer; notes where top-level <h2> sections start"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open = []
+        self.dropping = 0
+        self.breaks = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping or tag in DROP_CONTENT:
+            if tag not in VOID_TAGS:
+                self.dropping += tag in DROP_CONTENT
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        self._end_implied(tag)
+        if tag == "h2" and not self.open:
+            self.breaks.append(len(self.out))
+        allowed = ALLOWED_ATTRIBUTES | TAG_ATTRIBUTES.get(tag, set())
+        kept = []
+        for name, value in attrs:
+            if name not in allowed:
+                continue
+            if name == "href" and not SAFE_URL.match((value or "").strip()):
+                continue
+            kept.append(f' {name}="{html.escape(value or "", quote=True)}"' if value is not None else f" {name}")
+        if tag == "a" and any(k.startswith(" href") for k in kept):
+            kept.append(' rel="nofollow noopener" target="_blank"')
+        self.out.append(f"<{tag}{''.join(kept)}>")
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.dropping:
+            self.dropping -= tag in DROP_CONTENT
+            return
+        if tag in self.open:             # else stray or disallowed
+            self._close_to(len(self.open) - 1 - self.open[::-1].index(tag))
+
+    def _end_implied(self, tag):
+        ends, stops = IMPLIED_END.get(tag, (set(), set()))
+        outermost = None
+        for i in range(len(self.open) - 1, -1, -1):
+            if self.open[i] in stops:
+                break
+            if self.open[i] in ends:
+                outermost = i
+        if outermost is not None:
+            self._close_to(outermost)
+
+    def _close_to(self, index):
+        """Close open elements down to and including self.open[index]"""
+        while len(self.open) > index:
+            self.out.append(f"</{self.open.pop()}>")
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(html.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.out.append(f"</{self.open.pop()}>")
+
+
+def render(text):
+    """Sanitized, section-split HTML for a generation's raw text"""
+    parser = _Sanitizer()
+    parser.feed(to_html(text))
+    parser.close()
+    bounds = [0] + [b for b in parser.breaks if b] + [len(parser.out)]
+    sections = []
+    for start, end in zip(bounds, bounds[1:]):
+        body = "".join(parser.out[start:end]).strip()
+        if body:
+            sections.append(
+                f'<section class="{SECTION_CLASS}" id="section-{len(sections) + 1}">{body}</section>'
+            )
+    return "\n".join(sections)
@@ -1,30 +1,130 @@
 import os
+import json
+import time
 import logging
+import mimetypes
 from flask import (
-    render_template, jsonify, request, redirect, abort
+    render_template, jsonify, request, redirect, abort,
+    Response, stream_with_context, g, make_response, send_from_directory
 )
 
+import deadlines
+import metrics
+import tracing
 from app import app
-from wikipedia_api import get_category_articles, get_full_article
-from openai_service import generate_summary, generate_lesson, generate_exercise
+from wikipedia_api import (
+    get_category_articles, get_full_article, get_articles, wiki, article_cache
+)
+from openai_service import (
+    generate_summary, generate_lesson, generate_exercise, generate_lesson_bundle,
+    stream_summary, stream_lesson, stream_exercise, call_stats, RenderedHTML
+)
+from generation_cache import generation_cache
+from singleflight import singleflight
+from governor import governor
+from feed_index import feed_index, start_refresher
+from jobs import job_store, job_params, start_workers
+from library import library
+from search_index import search, title_index, stats as search_stats
+from article_sections import sections_of, part_end, part_html, page_layout, toc
+from http_cache import cached_page, apply_policy, fragments, stats as http_cache_stats
+from compression import compress_response
+import assets
 from config import (
-    CATEGORIES, SUBCATEGORIES, ENGLISH_LEVELS
+    CATEGORIES, SUBCATEGORIES, ENGLISH_LEVELS, FEED_INDEX_ENABLED, LESSON_BUNDLE_MODE,
+    JOB_WORKERS, JOB_POLL_INTERVAL, SEARCH_LIMIT, ARTICLE_INLINE_WORDS
 )
 
 log = logging.getLogger(__name__)
 
+MAX_BATCH_TITLES = 500
+
+if FEED_INDEX_ENABLED:
+    start_refresher()
+if JOB_WORKERS:
+    start_workers()
+metrics.start_writer()
+
+@app.before_request
+def _start_deadline():
+    """Everything upstream of this request shares one deadline"""
+    g.deadline_token = deadlines.start(deadlines.budget(request.headers.get("X-Request-Timeout")))
+
+@app.teardown_request
+def _end_deadline(exc):
+    token = g.pop("deadline_token", None)
+    if token is not None:
+        deadlines.reset(token)
+
+@app.before_request
+def _start_timing():
+    g.started = time.perf_counter()
+    g.trace_token = tracing.start(request.endpoint or request.path)
+
+@app.after_request
+def _observe_request(response):
+    """Latency by endpoint; registered first so it runs last, after compression"""
+    started = g.pop("started", None)
+    if started is not None:
+        metrics.http_seconds.observe(
+            time.perf_counter() - started, endpoint=request.endpoint or "unmatched",
+            method=request.method, status=response.status_code,
+        )
+    tracing.finish(g.pop("trace_token", None), response.status_code)
+    return response
+
+@metrics.register_collector
+def _cache_metrics():
+    """Hit and miss counters of this worker's caches, for hit ratios"""
+    caches = {
+        "generation": generation_cache.stats(),
+        "article_memory": article_cache.memory.stats(),
+        "page_fragments": fragments.stats(),
+        "search_upstream": search_stats()["upstream_cache"],
+    }
+    if article_cache.disk is not None:
+        caches["article_disk"] = article_cache.disk.stats()
+    return [
+        ("cache_requests_total", "Cache lookups by cache and result", {"cache": name, "result": result},
+         stats[counter])
+        for name, stats in caches.items() for result, counter in (("hit", "hits"), ("miss", "misses"))
+    ]
+
+@app.after_request
+def _response_headers(response):
+    """Cache-Control, ETag and 304s for GET routes (see http_cache), then compression"""
+    return compress_response(apply_policy(response), request.headers.get("Accept-Encoding"))
+
+@app.url_defaults
+def _hashed_static(endpoint, values):
+    """url_for('static', ...) points at the built, content-hashed copy when there is one"""
+    if endpoint == "static" and values.get("filename") in assets.manifest:
+        values["filename"] = f"{assets.DIST}/{assets.manifest[values['filename']]}"
+
+@app.route(f"/static/{assets.DIST}/<path:filename>")
+def hashed_static(filename):
+    """Built assets: precompressed variant when accepted, cached for good"""
+    path, encoding = assets.variant(filename, request.headers.get("Accept-Encoding"))
+    response = send_from_directory(assets.DIST_DIR, path, mimetype=mimetypes.guess_type(filename)[0])
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = assets.IMMUTABLE
+    return response
+
 # ------------------------------------------------------------------
 # Wikipedia routes
 # ------------------------------------------------------------------
 @app.route("/")
 def index():
-    return render_template("index.html", categories=CATEGORIES)
+    return cached_page("page", "index.html", categories=CATEGORIES)
 
 
 @app.route("/subcategories/<category>")
 def subcategories(category):
     subs = SUBCATEGORIES.get(category, ["General"])
-    return render_template(
+    return cached_page(
+        "page",
         "subcategories.html",
         category=category,
         subcategories=subs,
@@ -33,8 +133,8 @@ def subcategories(category):
 
 @app.route("/articles/<category>/<subcategory>")
 def articles(category, subcategory):
-    return render_template(
-        "articles.html", category=category, subcategory=subcategory
+    return cached_page(
+        "page", "articles.html", category=category, subcategory=subcategory
     )
 
 
@@ -44,33 +144,124 @@ def api_articles(category, subcategory):
     continue_from = request.args.get("continue")
 
     try:
-        data, token = get_category_articles(
+        page = feed_index.read(
             category, subcategory, images_only, continue_from
-        )
+        ) if FEED_INDEX_ENABLED else None
+        if page is None:
+            page = get_category_articles(
+                category, subcategory, images_only, continue_from
+            )
+        data, token = page
         return jsonify({"articles": data, "continue": token})
+    except ValueError as e:              # malformed continue token
+        return jsonify({"error": str(e), "articles": []}), 400
     except Exception as e:               # noqa: BLE001
         log.exception(e)
         return jsonify({"error": str(e), "articles": []}), 500
 
 
+@app.route("/api/articles/batch", methods=["POST"])
+def api_articles_batch():
+    """
+    Fetch several full articles at once: {"titles": [...]}. Titles not
+    fetched within the request deadline come back in "continue".
+    """
+    data = request.get_json(silent=True) or {}
+    titles = data.get("titles")
+    if not isinstance(titles, list) or not all(isinstance(t, str) for t in titles):
+        return jsonify({"error": "titles must be a list of strings"}), 400
+    if len(titles) > MAX_BATCH_TITLES:
+        return jsonify({"error": f"at most {MAX_BATCH_TITLES} titles per request"}), 400
+
+    try:
+        articles, pending = get_articles(titles)
+        # titles left when the request deadline came near: post them again
+        return jsonify({"articles": articles, "continue": pending or None})
+    except Exception as e:               # noqa: BLE001
+        log.exception(e)
+        return jsonify({"error": str(e), "articles": {}}), 500
+
+
+@app.route("/api/search")
+def api_search():
+    """Title suggestions for a typed prefix: ?q=...&limit=..."""
+    try:
+        limit = int(request.args.get("limit", SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer", "results": []}), 400
+    result = search(request.args.get("q", ""), limit)
+    # who answered goes in a header so the body (and its ETag) stays the same
+    source = result.pop("source")
+    response = jsonify(result)
+    response.headers["X-Search-Source"] = source
+    return response
+
+
+def _article_version(art, *extra):
+    """Page ETag input: the revision id stands in for the article body"""
+    if not art.get("revision"):
+        return None                      # no revision: hash the whole context
+    return [art["title"], art["revision"], *extra]
+
+
 @app.route("/article/<path:title>")
 def article(title):
     try:
         art = get_full_article(title)
-        return render_template(
-            "article.html", article=art, english_levels=ENGLISH_LEVELS
+        title_index.add(art["title"], url=art.get("url", ""))
+        return cached_page(
+            "article", "article.html", version=_article_version(art, ARTICLE_INLINE_WORDS),
+            article=art, layout=page_layout(art, ARTICLE_INLINE_WORDS), english_levels=ENGLISH_LEVELS
         )
     except Exception as e:               # noqa: BLE001
         log.exception(e)
-        return render_template("article.html", error=str(e))
+        response = make_response(render_template("article.html", error=str(e)))
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+
+@app.route("/api/article/<path:title>/sections")
+def api_article_sections(title):
+    """Table of contents: every heading with its level, anchor, word count and part"""
+    try:
+        art = get_full_article(title)
+    except Exception as e:               # noqa: BLE001
+        log.error(f"Error fetching sections of {title!r}: {e}")
+        return jsonify({"error": str(e), "sections": []}), 500
+    sections = sections_of(art)
+    return jsonify({
+        "title": art["title"], "revision": art.get("revision"),
+        "lead_words": sections[0]["words"], "sections": toc(sections),
+    })
+
+
+@app.route("/api/article/<path:title>/sections/<int:index>")
+def api_article_section(title, index):
+    """HTML of one part: section `index` (0 = the lead) and its subsections, without its own heading"""
+    try:
+        art = get_full_article(title)
+    except Exception as e:               # noqa: BLE001
+        log.error(f"Error fetching section {index} of {title!r}: {e}")
+        return jsonify({"error": str(e)}), 500
+    sections = sections_of(art)
+    if index >= len(sections):
+        return jsonify({"error": f"{art['title']} has {len(sections)} sections"}), 404
+    section = sections[index]
+    return jsonify({
+        "index": index, "heading": section["heading"], "level": section["level"],
+        "anchor": section["anchor"], "end": part_end(sections, index),
+        "html": part_html(art.get("content") or "", sections, index),
+    })
 
 
 @app.route("/summary/<path:title>")
 def summary(title):
     level = request.args.get("level", "intermediate")
     art   = get_full_article(title)
-    return render_template(
+    return cached_page(
+        "article",
         "summary.html",
+        version=_article_version(art, level),
         article=art,
         english_level=level,
         english_levels=ENGLISH_LEVELS,
@@ -81,8 +272,10 @@ def summary(title):
 def lesson(title):
     level = request.args.get("level", "intermediate")
     art   = get_full_article(title)
-    return render_template(
+    return cached_page(
+        "article",
         "lesson.html",
+        version=_article_version(art, level),
         article=art,
         english_level=level,
         english_levels=ENGLISH_LEVELS,
@@ -92,15 +285,31 @@ def lesson(title):
 # OpenAI API routes
 # ------------------------------------------------------------------
 
+def _article_text(title):
+    """Article extract to ground the prompt (usually an article-cache hit)"""
+    if not title:
+        return None
+    try:
+        return get_full_article(title).get("content")
+    except Exception as e:               # noqa: BLE001
+        log.warning(f"No article text for {title!r}, generating from title only: {e}")
+        return None
+
+def _wants_job(data):
+    """Client asked for a background job instead of waiting for the result"""
+    return "respond-async" in request.headers.get("Prefer", "") or bool(data.get("async"))
+
 @app.route("/api/generate-summary", methods=["POST"])
 def api_generate_summary():
     """Generate article summary using OpenAI"""
     data = request.get_json()
+    if _wants_job(data):
+        return _enqueue_job("summary", data)
     article_title = data.get("article_title")
     english_level = data.get("english_level", "intermediate")
     
     try:
-        summary = generate_summary(article_title, english_level)
+        summary = generate_summary(article_title, english_level, _article_text(article_title))
         return jsonify({"success": True, "summary": summary})
     except Exception as e:
         log.error(f"Summary generation failed: {e}")
@@ -110,12 +319,14 @@ def api_generate_summary():
 def api_generate_lesson():
     """Generate lesson plan using OpenAI"""
     data = request.get_json()
+    if _wants_job(data):
+        return _enqueue_job("lesson", data)
     article_title = data.get("article_title")  
     english_level = data.get("english_level", "intermediate")
 
     
     try:
-        lesson = generate_lesson(article_title, english_level)
+        lesson = generate_lesson(article_title, english_level, _article_text(article_title))
         return jsonify({"success": True, "lesson": lesson})
     except Exception as e:
         log.error(f"Lesson generation failed: {e}")
@@ -125,13 +336,238 @@ def api_generate_lesson():
 def api_generate_exercise():
     """Generate specific exercises using OpenAI"""
     data = request.get_json()
+    if _wants_job(data):
+        return _enqueue_job("exercise", data)
     article_title = data.get("article_title")
     english_level = data.get("english_level", "intermediate")
     exercise_type = data.get("exercise_type", "extra")
     
     try:
-        exercise = generate_exercise(article_title, english_level, exercise_type)
+        exercise = generate_exercise(
+            article_title, english_level, exercise_type, _article_text(article_title)
+        )
         return jsonify({"success": True, "exercise": exercise})
     except Exception as e:
         log.error(f"Exercise generation failed: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route("/api/generate-lesson-bundle", methods=["POST"])
+def api_generate_lesson_bundle():
+    """Lesson plan plus grammar, vocabulary and extra exercises in one response"""
+    data = request.get_json()
+    if _wants_job(data):
+        return _enqueue_job("lesson_bundle", data)
+    article_title = data.get("article_title")
+    english_level = data.get("english_level", "intermediate")
+    mode = data.get("mode", LESSON_BUNDLE_MODE)
+
+    try:
+        bundle = generate_lesson_bundle(
+            article_title, english_level, _article_text(article_title), mode=mode
+        )
+        return jsonify({"success": True, "bundle": bundle})
+    except Exception as e:
+        log.error(f"Lesson bundle generation failed: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# ------------------------------------------------------------------
+# Background jobs: enqueue, then poll or follow the job
+# ------------------------------------------------------------------
+
+def _enqueue_job(kind, data):
+    try:
+        job = job_store.enqueue(kind, job_params(kind, data))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    response = jsonify({"success": True, "job": job_store.public(job)})
+    response.status_code = 202
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return response
+
+@app.route("/api/jobs", methods=["POST"])
+def api_create_job():
+    """{"kind": "summary" | "lesson" | "exercise" | "lesson_bundle", "article_title": ..., ...}"""
+    data = request.get_json(silent=True) or {}
+    return _enqueue_job(data.get("kind"), data)
+
+@app.route("/api/jobs/<job_id>")
+def api_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "unknown or expired job"}), 404
+    return jsonify({"success": True, "job": job_store.public(job)})
+
+@app.route("/api/jobs/<job_id>/events")
+def api_job_events(job_id):
+    """SSE: a `status` event on every change, then `done` or `failed` with the job"""
+    def events():
+        yield ": stream open\n\n"
+        last = None
+        while True:
+            job = job_store.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'unknown or expired job'})}\n\n"
+                return
+            public = job_store.public(job)
+            if job["status"] in ("done", "failed"):
+                yield f"event: {job['status']}\ndata: {json.dumps(public)}\n\n"
+                return
+            if (job["status"], job["attempts"]) != last:
+                last = (job["status"], job["attempts"])
+                yield f"event: status\ndata: {json.dumps(public)}\n\n"
+            try:
+                deadlines.remaining()
+            except deadlines.DeadlineExceeded:
+                # the job carries on; the client re-subscribes or polls
+                yield f"event: timeout\ndata: {json.dumps(public)}\n\n"
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ------------------------------------------------------------------
+# Streaming (Server-Sent Events) variants of the generation routes
+# ------------------------------------------------------------------
+
+def _sse_response(chunks):
+    """
+    Forward text chunks as `data: {"delta": ...}` events, then `done`
+    carrying the rendered HTML (`{"html": ...}`) to replace them with.
+    """
+    def events():
+        # flush headers straight away so the client sees the first byte
+        yield ": stream open\n\n"
+        done = {}
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, RenderedHTML):
+                    done["html"] = chunk
+                else:
+                    yield f"data: {json.dumps({'delta': chunk})}\n\n"
+        except Exception as e:           # noqa: BLE001
+            log.error(f"Streaming generation failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _generation_params():
+    """JSON body for POST, query string for EventSource GETs"""
+    return request.get_json(silent=True) or request.args
+
+
+@app.route("/api/generate-summary/stream", methods=["GET", "POST"])
+def api_stream_summary():
+    data = _generation_params()
+    title = data.get("article_title")
+    return _sse_response(stream_summary(
+        title, data.get("english_level", "intermediate"), _article_text(title)
+    ))
+
+
+@app.route("/api/generate-lesson/stream", methods=["GET", "POST"])
+def api_stream_lesson():
+    data = _generation_params()
+    title = data.get("article_title")
+    try:
+        chunks = stream_lesson(
+            title, data.get("english_level", "intermediate"), _article_text(title)
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return _sse_response(chunks)
+
+
+@app.route("/api/generate-exercise/stream", methods=["GET", "POST"])
+def api_stream_exercise():
+    data = _generation_params()
+    title = data.get("article_title")
+    return _sse_response(stream_exercise(
+        title,
+        data.get("english_level", "intermediate"),
+        data.get("exercise_type", "extra"),
+        _article_text(title),
+    ))
+
+
+# ------------------------------------------------------------------
+# Library of stored generations
+# ------------------------------------------------------------------
+MAX_LIBRARY_PAGE = 200
+
+@app.route("/api/library")
+def api_library():
+    """Stored generations, newest first: ?title=&level=&kind=&limit=&offset= (no HTML)"""
+    try:
+        limit = min(int(request.args.get("limit", 50)), MAX_LIBRARY_PAGE)
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"success": False, "error": "limit and offset must be integers"}), 400
+    try:
+        rows = library.search(
+            request.args.get("title"), request.args.get("level"), request.args.get("kind"),
+            limit=limit, offset=offset,
+        )
+    except Exception as e:               # noqa: BLE001
+        log.error(f"Library query failed: {e}")
+        return jsonify({"success": False, "error": str(e)}), 503
+    return jsonify({"success": True, "generations": [row.public(with_html=False) for row in rows]})
+
+
+@app.route("/api/library/<int:generation_id>")
+def api_library_item(generation_id):
+    row = library.get(generation_id)
+    if row is None:
+        return jsonify({"success": False, "error": "not in the library"}), 404
+    return jsonify({"success": True, "generation": row.public()})
+
+
+@app.route("/api/library/<kind>/<path:title>")
+def api_library_latest(kind, title):
+    """The newest stored `kind` (summary, lesson, an exercise type) for ?level="""
+    row = library.latest(title, request.args.get("level", "intermediate"), kind)
+    if row is None:
+        return jsonify({"success": False, "error": "not in the library"}), 404
+    return jsonify({"success": True, "generation": row.public()})
+
+
+@app.route("/api/cache-stats")
+def api_cache_stats():
+    """Hit/miss, coalescing and admission counters of the generation layer (per worker)"""
+    stats = generation_cache.stats()
+    stats["singleflight"] = singleflight.stats()
+    stats["governor"] = governor.stats()
+    stats["openai_calls"] = call_stats()
+    stats["jobs"] = job_store.stats()
+    stats["library"] = library.stats()
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of every worker's metrics"""
+    response = make_response(metrics.render())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
+@app.route("/api/wikipedia-stats")
+def api_wikipedia_stats():
+    """Wikipedia client latency/status counters and article cache stats (per worker)"""
+    return jsonify({
+        "endpoints": wiki.stats(),
+        "article_cache": article_cache.stats(),
+        "search": search_stats(),
+        "http_cache": http_cache_stats(),
+    })
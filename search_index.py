@@ -0,0 +1,159 @@
+"""
+Title suggestions for /api/search.
+
+Every title the app has seen (feed cards, opened articles, earlier
+suggestions) goes into an in-process index: a sorted array of case-folded
+titles searched with bisect, so a prefix lookup is a binary search plus a
+short scan. Queries the index cannot fill go to Wikipedia's opensearch;
+those answers are cached per query and their titles join the index. When
+opensearch returns fewer titles than asked for, it has listed every title
+with that prefix, so longer queries starting with it are answered locally.
+"""
+import time
+import bisect
+import logging
+import threading
+
+from config import (
+    SEARCH_LIMIT, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_INDEX_RELOAD,
+    SEARCH_UPSTREAM_TIMEOUT
+)
+from feed_index import feed_index
+from generation_cache import MemoryCache
+from wikipedia_api import opensearch, normalize_title
+
+log = logging.getLogger(__name__)
+
+
+def fold(text):
+    """Index key: normalized title, case-folded"""
+    return normalize_title(text).casefold()
+
+
+class TitleIndex:
+
+    def __init__(self, reload_every=SEARCH_INDEX_RELOAD, max_complete=SEARCH_CACHE_SIZE):
+        self.reload_every = reload_every
+        self.max_complete = max_complete
+        self._keys = []                  # sorted folded titles
+        self._entries = {}               # folded title -> {title, description, url}
+        self._complete = set()           # folded prefixes whose every title is indexed
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, title, description="", url=""):
+        if not title:
+            return
+        key = fold(title)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                bisect.insort(self._keys, key)
+                self._entries[key] = {"title": title, "description": description or "", "url": url or ""}
+            else:
+                entry["description"] = entry["description"] or description or ""
+                entry["url"] = entry["url"] or url or ""
+
+    def mark_complete(self, prefix):
+        with self._lock:
+            if len(self._complete) >= self.max_complete:
+                self._complete.clear()
+            self._complete.add(fold(prefix))
+
+    def is_complete(self, prefix):
+        key = fold(prefix)
+        with self._lock:
+            return any(key[:n] in self._complete for n in range(1, len(key) + 1))
+
+    def prefix(self, query, limit=SEARCH_LIMIT):
+        """Up to `limit` entries whose title starts with `query`, in title order"""
+        self._reload()
+        key = fold(query)
+        out = []
+        with self._lock:
+            i = bisect.bisect_left(self._keys, key)
+            while i < len(self._keys) and len(out) < limit and self._keys[i].startswith(key):
+                out.append(dict(self._entries[self._keys[i]]))
+                i += 1
+        return out
+
+    def _reload(self):
+        """Pick up the cards the feed refresher has indexed since the last look"""
+        if time.monotonic() - self._loaded < self.reload_every:
+            return
+        self._loaded = time.monotonic()
+        try:
+            for card in feed_index.cards():
+                self.add(card["title"], card.get("extract", ""), card.get("url", ""))
+        except Exception as e:           # noqa: BLE001
+            log.warning("Could not load feed titles into the search index: %s", e)
+
+    def stats(self):
+        with self._lock:
+            return {"titles": len(self._keys), "complete_prefixes": len(self._complete)}
+
+
+title_index = TitleIndex()
+_upstream_cache = MemoryCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+_stats = {"from_index": 0, "from_cache": 0, "from_upstream": 0, "upstream_errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(source):
+    with _stats_lock:
+        _stats[source] += 1
+
+
+def _merge(first, second, limit):
+    seen, out = set(), []
+    for entry in first + second:
+        key = fold(entry["title"])
+        if key not in seen:
+            seen.add(key)
+            out.append(entry)
+    return out[:limit]
+
+
+def search(query, limit=SEARCH_LIMIT):
+    """
+    Suggestions for a typed prefix as {"query", "results", "source"}, where
+    source says who answered: "index", "cache" or "upstream".
+    """
+    query = " ".join(query.replace("_", " ").split())
+    limit = max(1, min(limit, SEARCH_LIMIT))
+    if not query:
+        return {"query": query, "results": [], "source": "index"}
+
+    local = title_index.prefix(query, limit)
+    if len(local) >= limit or title_index.is_complete(query):
+        _count("from_index")
+        return {"query": query, "results": local, "source": "index"}
+
+    cache_key = f"{limit}:{fold(query)}"
+    upstream = _upstream_cache.get(cache_key)
+    source = "cache"
+    if upstream is None:
+        try:
+            upstream = opensearch(query, limit, timeout=SEARCH_UPSTREAM_TIMEOUT)
+        except Exception as e:           # noqa: BLE001
+            log.warning("opensearch for %r failed, answering from the index: %s", query, e)
+            _count("upstream_errors")
+            return {"query": query, "results": local, "source": "index"}
+        source = "upstream"
+        _upstream_cache.set(cache_key, upstream)
+        for entry in upstream:
+            title_index.add(entry["title"], entry["description"], entry["url"])
+        # a short answer lists every title with this prefix, unless it
+        # resolved redirects to titles that do not start with it
+        if len(upstream) < limit and all(fold(e["title"]).startswith(fold(query)) for e in upstream):
+            title_index.mark_complete(query)
+    _count(f"from_{source}")
+    return {"query": query, "results": _merge(upstream, local, limit), "source": source}
+
+
+def stats():
+    with _stats_lock:
+        out = dict(_stats)
+    out["index"] = title_index.stats()
+    out["upstream_cache"] = _upstream_cache.stats()
+    return out
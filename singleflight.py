@@ -0,0 +1,146 @@
+import os
+import time
+import logging
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:                      # Windows: coalesce within the process only
+    fcntl = None
+
+from config import SINGLEFLIGHT_LOCK_DIR, SINGLEFLIGHT_TIMEOUT
+from deadlines import remaining
+
+log = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one execution.
+
+    Threads of one worker wait on the leader's in-flight call. Across
+    gunicorn workers the leader holds an flock on the key's lock file; a
+    worker that had to wait for it re-checks the shared store before doing
+    the work itself, so only one of them hits the upstream.
+    """
+
+    def __init__(self, lock_dir=SINGLEFLIGHT_LOCK_DIR, timeout=SINGLEFLIGHT_TIMEOUT):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.coalesced_cross_process = 0
+        if fcntl is not None and lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, fn, recheck=None):
+        """
+        Return fn() for `key`, sharing the result with concurrent callers.
+        `recheck` is consulted after waiting on another worker's lease and
+        should return the stored result or None; without it (no store the
+        workers share) calls are only coalesced within this process.
+
+        A caller whose leader failed runs the call again rather than
+        inheriting the error (the leader may only have run out of its own
+        request's deadline); a second failure is shared.
+        """
+        retried = False
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                else:
+                    self.coalesced += 1
+            if leader:
+                break
+            if not call.done.wait(remaining(self.timeout)):
+                raise TimeoutError(f"single-flight wait for {key[:12]} timed out")
+            if call.error is None:
+                return call.result
+            if retried:
+                raise call.error
+            retried = True
+
+        try:
+            with self._lease(key, recheck is not None) as waited:
+                result = recheck() if waited and recheck else None
+                if result is not None:
+                    with self._lock:
+                        self.coalesced_cross_process += 1
+                else:
+                    with self._lock:
+                        self.executed += 1
+                    result = fn()
+            call.result = result
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    @contextlib.contextmanager
+    def _lease(self, key, shared=True):
+        """
+        Cross-process lock on the key's own lock file; yields True if
+        another worker held it first.
+        """
+        if fcntl is None or not self.lock_dir or not shared:
+            yield False
+            return
+        path = os.path.join(self.lock_dir, f"{key}.lock")
+        waited = False
+        deadline = time.monotonic() + remaining(self.timeout)
+        while True:
+            fh = open(path, "a")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fh.close()
+                waited = True
+                remaining()              # give up once the request's own deadline passed
+                if time.monotonic() > deadline:
+                    log.warning("Lease for %s not released in %ss, running anyway",
+                                key[:12], self.timeout)
+                    yield waited
+                    return
+                time.sleep(0.05)
+                continue
+            try:
+                # the previous holder may have unlinked the file we opened
+                if os.fstat(fh.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            fh.close()
+        try:
+            yield waited
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            fh.close()                   # releases the flock
+
+    def stats(self):
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "coalesced_cross_process": self.coalesced_cross_process,
+            "in_flight": len(self._calls),
+        }
+
+
+singleflight = SingleFlight()
@@ -0,0 +1,84 @@
+/**
+ * WikiLearn - Lazy article sections
+ * The article page ships the lead and the first sections; every later part
+ * is a placeholder (its heading) whose body is fetched from
+ * /api/article/<title>/sections/<n> when it comes close to the viewport,
+ * or when its table of contents entry is clicked.
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    const body = document.querySelector('.article-body[data-title]');
+    const placeholders = body ? body.querySelectorAll('.article-section[data-index]') : [];
+    if (!placeholders.length) return;
+
+    const title = body.dataset.title;
+    const pending = new Map();
+
+    function loadPart(section) {
+        const index = section.dataset.index;
+        if (!pending.has(index)) {
+            pending.set(index, fetchPart(section, index));
+        }
+        return pending.get(index);
+    }
+
+    async function fetchPart(section, index) {
+        const target = section.querySelector('.section-body');
+        try {
+            const response = await fetch(`/api/article/${encodeURIComponent(title)}/sections/${index}`);
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || response.statusText);
+            target.innerHTML = data.html;
+        } catch (error) {
+            console.error(`Error loading section ${index}:`, error);
+            pending.delete(index);       // let the next scroll or click try again
+            target.innerHTML = '<p class="error-message">This section could not be loaded. ' +
+                '<a href="#" class="retry-section">Try again</a></p>';
+            target.querySelector('.retry-section').addEventListener('click', function(event) {
+                event.preventDefault();
+                loadPart(section);
+            });
+            return;
+        }
+        target.removeAttribute('aria-busy');
+        section.style.minHeight = '';
+    }
+
+    if ('IntersectionObserver' in window) {
+        const observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    loadPart(entry.target);
+                }
+            });
+        }, { root: null, rootMargin: '600px 0px' });
+        placeholders.forEach(section => observer.observe(section));
+    } else {
+        placeholders.forEach(loadPart);
+    }
+
+    // A subsection's anchor only exists once its part has loaded
+    const byIndex = new Map(Array.from(placeholders, section => [section.dataset.index, section]));
+    document.querySelectorAll('.article-toc a[data-part]').forEach(link => {
+        const section = byIndex.get(link.dataset.part);
+        if (!section) return;            // rendered inline
+        link.addEventListener('click', async function(event) {
+            event.preventDefault();
+            const anchor = decodeURIComponent(link.hash.slice(1));
+            await loadPart(section);
+            (document.getElementById(anchor) || section).scrollIntoView();
+            history.replaceState(null, '', link.hash);
+        });
+    });
+
+    // Opened with a #fragment: load the part that holds it
+    if (location.hash) {
+        const anchor = decodeURIComponent(location.hash.slice(1));
+        const link = document.querySelector(`.article-toc a[href="#${CSS.escape(anchor)}"]`);
+        const section = link && byIndex.get(link.dataset.part);
+        if (section) {
+            loadPart(section).then(() => (document.getElementById(anchor) || section).scrollIntoView());
+        }
+    }
+});
@@ -3,6 +3,84 @@
  * Uses latest Puter.js features and models for improved AI-based learning
  */
 
+/**
+ * Stream a generation from one of the /api/generate-.../stream endpoints.
+ * Shows the text as a plain preview while Server-Sent Events arrive, then
+ * the sanitized HTML the server sends with the `done` event, and resolves
+ * with that HTML. Rejects if none was received, so callers can fall back
+ * to the plain JSON endpoint.
+ */
+function streamGeneration(url, payload, outputElement) {
+    return fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(payload)
+    }).then(response => {
+        if (!response.ok || !response.body) {
+            throw new Error(`Streaming failed: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let html = '';
+        let renderPending = false;
+
+        // перерисовываем не чаще одного раза за кадр
+        const render = () => {
+            if (renderPending) return;
+            renderPending = true;
+            requestAnimationFrame(() => {
+                renderPending = false;
+                if (!html) outputElement.textContent = text.replace(/<[^>]*>/g, ' ');
+            });
+        };
+
+        const handleEvent = (raw) => {
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (event === 'error') {
+                throw new Error(JSON.parse(data || '{}').error || 'Generation failed');
+            }
+            if (event === 'message' && data) {
+                text += JSON.parse(data).delta || '';
+                render();
+            }
+            if (event === 'done') {
+                html = JSON.parse(data || '{}').html || '';
+            }
+            return event === 'done';
+        };
+
+        const pump = () => reader.read().then(({ done, value }) => {
+            if (!done) {
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    if (handleEvent(raw)) done = true;
+                }
+            }
+            if (done) {
+                if (!html) throw new Error('Empty stream');
+                outputElement.innerHTML = html;
+                return html;
+            }
+            return pump();
+        });
+
+        return pump();
+    });
+}
+
 // Function to generate a summary using OpenAI API
 function generateSummaryWithOpenAI(articleTitle, englishLevel) {
     // Get the loading element
@@ -12,7 +90,21 @@ function generateSummaryWithOpenAI(articleTitle, englishLevel) {
     // Show loading state
     summaryContent.innerHTML = '<div class="loading"><div class="loading-spinner"></div>Generating summary...</div>';
     
-    // Call OpenAI API endpoint
+    streamGeneration('/api/generate-summary/stream', {
+        article_title: articleTitle,
+        english_level: englishLevel
+    }, summaryContent)
+    .then(html => {
+        sessionStorage.setItem(`summary_${articleTitle}_${englishLevel}`, html);
+    })
+    .catch(error => {
+        console.warn('Summary stream failed, falling back:', error);
+        fetchSummaryWithOpenAI(articleTitle, englishLevel, summaryContent);
+    });
+}
+
+// Non-streaming summary request
+function fetchSummaryWithOpenAI(articleTitle, englishLevel, summaryContent) {
     fetch('/api/generate-summary', {
         method: 'POST',
         headers: {
@@ -26,9 +118,9 @@ function generateSummaryWithOpenAI(articleTitle, englishLevel) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            const formatted = formatAIResponse(data.summary);
-            summaryContent.innerHTML = formatted;
-            sessionStorage.setItem(`summary_${articleTitle}_${englishLevel}`, formatted);
+            // already sanitized HTML, rendered by the server
+            summaryContent.innerHTML = data.summary;
+            sessionStorage.setItem(`summary_${articleTitle}_${englishLevel}`, data.summary);
         } else {
             summaryContent.innerHTML = `<div class="error-message">Failed to generate summary: ${data.error}</div>`;
         }
@@ -150,7 +242,22 @@ function generateLessonWithOpenAI(articleTitle, englishLevel) {
     // Show loading state
     lessonContainer.innerHTML = '<div class="loading"><div class="loading-spinner"></div>Generating lesson plan...</div>';
     
-    // Call OpenAI API endpoint
+    streamGeneration('/api/generate-lesson/stream', {
+        article_title: articleTitle,
+        english_level: englishLevel
+    }, lessonContainer)
+    .then(html => {
+        const articleTitle = document.getElementById('article-title').value;
+        sessionStorage.setItem(`lesson_${articleTitle}_${englishLevel}`, html);
+    })
+    .catch(error => {
+        console.warn('Lesson stream failed, falling back:', error);
+        fetchLessonWithOpenAI(articleTitle, englishLevel, lessonContainer);
+    });
+}
+
+// Non-streaming lesson request
+function fetchLessonWithOpenAI(articleTitle, englishLevel, lessonContainer) {
     fetch('/api/generate-lesson', {
         method: 'POST',
         headers: {
@@ -164,12 +271,11 @@ function generateLessonWithOpenAI(articleTitle, englishLevel) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            const formatted = formatAIResponse(data.lesson);
-            lessonContainer.innerHTML = formatted;
+            lessonContainer.innerHTML = data.lesson;
             
             // Store in session storage
             const articleTitle = document.getElementById('article-title').value;
-            sessionStorage.setItem(`lesson_${articleTitle}_${englishLevel}`, formatted);
+            sessionStorage.setItem(`lesson_${articleTitle}_${englishLevel}`, data.lesson);
         } else {
             lessonContainer.innerHTML = `<div class="error-message">Failed to generate lesson: ${data.error}</div>`;
         }
@@ -255,6 +361,19 @@ function generateBasicLesson(articleContent, englishLevel, lessonContainer) {
 function generateGrammarExercises(articleTitle, englishLevel, outputElement) {
     outputElement.innerHTML = '<div class="loading"><div class="loading-spinner"></div>Generating grammar exercises...</div>';
     
+    streamGeneration('/api/generate-exercise/stream', {
+        article_title: articleTitle,
+        english_level: englishLevel,
+        exercise_type: 'grammar'
+    }, outputElement)
+    .catch(error => {
+        console.warn('Grammar exercise stream failed, falling back:', error);
+        fetchGrammarExercises(articleTitle, englishLevel, outputElement);
+    });
+}
+
+// Non-streaming grammar exercise request
+function fetchGrammarExercises(articleTitle, englishLevel, outputElement) {
     fetch('/api/generate-exercise', {
         method: 'POST',
         headers: {
@@ -269,7 +388,7 @@ function generateGrammarExercises(articleTitle, englishLevel, outputElement) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            outputElement.innerHTML = formatAIResponse(data.exercise);
+            outputElement.innerHTML = data.exercise;
         } else {
             outputElement.innerHTML = `<div class="error-message">Failed to generate grammar exercises: ${data.error}</div>`;
         }
@@ -284,6 +403,19 @@ function generateGrammarExercises(articleTitle, englishLevel, outputElement) {
 function generateVocabularyExercises(articleTitle, englishLevel, outputElement) {
     outputElement.innerHTML = '<div class="loading"><div class="loading-spinner"></div>Generating vocabulary exercises...</div>';
     
+    streamGeneration('/api/generate-exercise/stream', {
+        article_title: articleTitle,
+        english_level: englishLevel,
+        exercise_type: 'vocabulary'
+    }, outputElement)
+    .catch(error => {
+        console.warn('Vocabulary exercise stream failed, falling back:', error);
+        fetchVocabularyExercises(articleTitle, englishLevel, outputElement);
+    });
+}
+
+// Non-streaming vocabulary exercise request
+function fetchVocabularyExercises(articleTitle, englishLevel, outputElement) {
     fetch('/api/generate-exercise', {
         method: 'POST',
         headers: {
@@ -298,7 +430,7 @@ function generateVocabularyExercises(articleTitle, englishLevel, outputElement)
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            outputElement.innerHTML = formatAIResponse(data.exercise);
+            outputElement.innerHTML = data.exercise;
         } else {
             outputElement.innerHTML = `<div class="error-message">Failed to generate vocabulary exercises: ${data.error}</div>`;
         }
@@ -313,6 +445,19 @@ function generateVocabularyExercises(articleTitle, englishLevel, outputElement)
 function generateExtraExercises(articleTitle, englishLevel, outputElement) {
     outputElement.innerHTML = '<div class="loading"><div class="loading-spinner"></div>Generating extra exercises...</div>';
     
+    streamGeneration('/api/generate-exercise/stream', {
+        article_title: articleTitle,
+        english_level: englishLevel,
+        exercise_type: 'extra'
+    }, outputElement)
+    .catch(error => {
+        console.warn('Extra exercise stream failed, falling back:', error);
+        fetchExtraExercises(articleTitle, englishLevel, outputElement);
+    });
+}
+
+// Non-streaming extra exercise request
+function fetchExtraExercises(articleTitle, englishLevel, outputElement) {
     fetch('/api/generate-exercise', {
         method: 'POST',
         headers: {
@@ -327,7 +472,7 @@ function generateExtraExercises(articleTitle, englishLevel, outputElement) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            outputElement.innerHTML = formatAIResponse(data.exercise);
+            outputElement.innerHTML = data.exercise;
         } else {
             outputElement.innerHTML = `<div class="error-message">Failed to generate extra exercises: ${data.error}</div>`;
         }
@@ -370,7 +515,7 @@ document.addEventListener('DOMContentLoaded', function() {
             if (cachedLesson) {
                 lessonContainer.innerHTML = cachedLesson;
             } else {
-                generateLessonWithOpenAI(articleContent, englishLevel);
+                generateLessonWithOpenAI(articleTitle, englishLevel);
             }
         }
     }
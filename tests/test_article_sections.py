@@ -0,0 +1,68 @@
+from article_sections import index_sections, page_layout, part_html, toc
+
+# Shaped like a TextExtracts plain-text extract (explaintext): "== Heading ==" lines
+PLAIN_EXTRACT = (
+    "World War II was a global conflict that lasted from 1939 to 1945.\n"
+    "The vast majority of the world's countries fought as part of two opposing military alliances.\n"
+    "\n\n== Start and end dates ==\n"
+    "It is generally considered that in Europe World War II started on 1 September 1939.\n"
+    "\n\n== History ==\n"
+    "\n\n=== Background ===\n"
+    "In the wake of the First World War, the victorious Allies imposed the Treaty of Versailles.\n"
+    "\n\n=== Pre-war events ===\n"
+    "Italy invaded Ethiopia in October 1935 & Germany reoccupied the Rhineland in 1936.\n"
+    "\n\n== Aftermath ==\n"
+    "The Allies established occupation administrations in Austria and Germany.\n"
+)
+
+# Shaped like the same extract requested as HTML
+HTML_EXTRACT = (
+    "<p>World War II was a global conflict that lasted from 1939 to 1945.</p>\n"
+    '<h2><span id="History">History</span></h2>\n'
+    '<h3><span id="Background">Background</span></h3>\n'
+    "<p>In the wake of the First World War, the Allies imposed the Treaty of Versailles.</p>\n"
+    '<h2><span id="Aftermath">Aftermath</span></h2>\n'
+    "<p>The Allies established occupation administrations.</p>\n"
+)
+
+
+def test_plain_text_headings_are_indexed():
+    sections = index_sections(PLAIN_EXTRACT)
+    assert [(s["heading"], s["level"], s["anchor"]) for s in sections] == [
+        ("", 1, "lead"),
+        ("Start and end dates", 2, "Start_and_end_dates"),
+        ("History", 2, "History"),
+        ("Background", 3, "Background"),
+        ("Pre-war events", 3, "Pre-war_events"),
+        ("Aftermath", 2, "Aftermath"),
+    ]
+    assert sections[0]["words"] == 28
+    assert sections[-1]["end"] == len(PLAIN_EXTRACT)
+
+
+def test_plain_text_part_is_rendered_as_html():
+    sections = index_sections(PLAIN_EXTRACT)
+    html = part_html(PLAIN_EXTRACT, sections, 2, with_heading=True)
+    assert html.startswith('<h2 id="History">History</h2>')
+    assert '<h3 id="Pre-war_events">Pre-war events</h3>' in html
+    assert "<p>Italy invaded Ethiopia in October 1935 &amp; Germany" in html
+    assert "==" not in html
+    assert "Aftermath" not in html
+
+
+def test_plain_text_layout_defers_later_sections():
+    layout = page_layout({"content": PLAIN_EXTRACT}, inline_words=50)
+    assert [p["heading"] for p in layout["placeholders"]] == ["History", "Aftermath"]
+    assert "Start and end dates" in layout["html"]
+    assert [(e["heading"], e["part"]) for e in toc(index_sections(PLAIN_EXTRACT))][2:4] == [
+        ("Background", 2), ("Pre-war events", 2),
+    ]
+
+
+def test_html_headings_keep_their_ids():
+    sections = index_sections(HTML_EXTRACT)
+    assert [(s["heading"], s["level"], s["anchor"]) for s in sections][1:] == [
+        ("History", 2, "History"), ("Background", 3, "Background"), ("Aftermath", 2, "Aftermath"),
+    ]
+    html = part_html(HTML_EXTRACT, sections, 1)
+    assert html.startswith('<h3 id="Background"><span>Background</span></h3>')
@@ -0,0 +1,70 @@
+import pytest
+
+import wikipedia_api
+from feed_index import FeedIndex, CURSOR_PREFIX
+from wikipedia_api import get_category_articles
+
+HITS = 200
+
+
+def fake_search(queries):
+    """wiki.query for generator=search: HITS ranked pages per search term"""
+    def query(params, endpoint='query', **kwargs):
+        term = params['gsrsearch']
+        queries.append((term, params['gsrsort']))
+        offset = int(params.get('gsroffset', 0))
+        end = min(offset + params['gsrlimit'], HITS)
+        pages = {
+            f"{term}/{i}": {
+                'index': i - offset + 1,
+                'title': f"{term} #{i}",
+                'extract': "An article.",
+                'original': {'source': f"https://img/{i}.jpg"},
+                'fullurl': f"https://en.wikipedia.org/wiki/{i}",
+            }
+            for i in range(offset, end)
+        }
+        data = {'query': {'pages': pages}}
+        if end < HITS:
+            data['continue'] = {'gsroffset': end}
+        return data
+    return query
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    sent = []
+    monkeypatch.setattr(wikipedia_api.wiki, 'query', fake_search(sent))
+    return sent
+
+
+def test_paging_across_the_handover_stays_on_the_indexed_query(tmp_path, queries):
+    index = FeedIndex(path=str(tmp_path / "feeds.sqlite3"), target=120, batch=20, page_size=50)
+    for _ in range(index.target // index.batch):
+        index.step("Science", "Physics")
+    built = set(queries)
+
+    titles, token = [], None
+    while token is None or str(token).startswith(CURSOR_PREFIX):
+        page, token = index.read("Science", "Physics", continue_from=token)
+        titles += [a['title'] for a in page]
+    assert len(titles) == 120
+
+    # past offset 100 the live search would switch to the "related" query
+    for _ in range(2):
+        page, token = get_category_articles("Science", "Physics", continue_from=token)
+        titles += [a['title'] for a in page]
+
+    assert titles == [f"Science Physics #{i}" for i in range(140)]
+    assert set(queries) == built == {("Science Physics", "relevance")}
+    assert token == "base:140"
+
+
+def test_plain_tokens_still_switch_to_related_topics(queries):
+    get_category_articles("Science", "Physics", continue_from="120")
+    assert queries == [("Science Physics related", "relevance")]
+
+
+def test_malformed_base_token_is_rejected(queries):
+    with pytest.raises(ValueError):
+        get_category_articles("Science", "Physics", continue_from="base:x")
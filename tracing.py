@@ -0,0 +1,80 @@
+"""
+Per-request trace spans, carried in a context variable.
+
+With TRACE_REQUESTS on, the web entry points start a trace for every
+request, upstream calls and generations add spans to it (metrics.upstream
+does this for every Wikipedia and OpenAI call), and a request that took at
+least TRACE_SLOW_MS is logged as one JSON line: route, status, total time
+and each span's offset, duration and attributes. Like deadlines, work
+handed to a thread pool keeps the trace when submitted with
+contextvars.copy_context().run; spans are appended under a lock since
+hedged attempts and bundle parts finish on other threads.
+"""
+import json
+import time
+import logging
+import threading
+import contextvars
+
+from config import TRACE_REQUESTS, TRACE_SLOW_MS
+
+log = logging.getLogger(__name__)
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.monotonic()
+        self.spans = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, attributes):
+        offset = time.monotonic() - seconds - self.started
+        span = {"name": name, "at_ms": round(max(offset, 0) * 1000, 1), "ms": round(seconds * 1000, 1)}
+        span.update({k: v for k, v in attributes.items() if v is not None})
+        with self._lock:
+            self.spans.append(span)
+
+
+def start(name):
+    """Begin a trace for the current request; returns a token for finish(), or None when tracing is off"""
+    if not TRACE_REQUESTS:
+        return None
+    return _trace.set(Trace(name))
+
+
+def finish(token, status=None):
+    """End the trace started with `token`, logging it when it was slow enough"""
+    if token is None:
+        return
+    trace = _trace.get()
+    _trace.reset(token)
+    if trace is None:
+        return
+    total_ms = (time.monotonic() - trace.started) * 1000
+    if total_ms < TRACE_SLOW_MS:
+        return
+    with trace._lock:
+        spans = sorted(trace.spans, key=lambda s: s["at_ms"])
+    log.info("trace %s", json.dumps({
+        "route": trace.name, "status": status, "ms": round(total_ms, 1),
+        **trace.attributes, "spans": spans,
+    }, ensure_ascii=False, default=str))
+
+
+def add_span(name, seconds, **attributes):
+    """Record a finished operation of `seconds` in the current trace, if any"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, seconds, attributes)
+
+
+def annotate(**attributes):
+    """Attach request-level attributes (e.g. the article title) to the current trace"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
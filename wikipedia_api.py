@@ -1,7 +1,263 @@
 import requests
+import httpx
 import json
+import time
+import random
+import asyncio
 import logging
-from config import WIKIPEDIA_API_ENDPOINT
+import threading
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    WIKIPEDIA_API_ENDPOINT, WIKIPEDIA_USER_AGENT, WIKIPEDIA_CONNECT_TIMEOUT,
+    WIKIPEDIA_READ_TIMEOUT, WIKIPEDIA_ASYNC_POOL_SIZE, WIKIPEDIA_POOL_SIZE,
+    WIKIPEDIA_MAX_RETRIES, WIKIPEDIA_BACKOFF, ARTICLE_CACHE_SIZE, ARTICLE_CACHE_FRESH,
+    ARTICLE_CACHE_TTL, ARTICLE_CACHE_PATH, FEED_PAGE_SIZE, FILL_PARALLELISM, FILL_DEADLINE
+)
+from generation_cache import MemoryCache, SQLiteCache
+from article_sections import index_sections
+from deadlines import remaining, DeadlineExceeded
+import metrics
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 30.0
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# images_only page filling: search hits per window (the feed's gsrlimit),
+# page size, and a pool shared by all request threads for parallel windows
+FILL_WINDOW = 10
+FILL_PAGE_SIZE = FEED_PAGE_SIZE
+_fill_pool = ThreadPoolExecutor(max_workers=FILL_PARALLELISM * 4, thread_name_prefix='wiki-fill')
+
+
+class WikipediaError(Exception):
+    """Wikipedia API request failed after all retries"""
+
+
+class WikipediaClient:
+    """
+    Shared, pooled access to the MediaWiki action API.
+
+    One keep-alive requests.Session (and one httpx.AsyncClient for ASGI
+    mode) per process, connect/read timeouts, gzip, exponential backoff on
+    429/5xx that honours Retry-After, and per-endpoint latency counters.
+    """
+
+    def __init__(self, endpoint=WIKIPEDIA_API_ENDPOINT, pool_size=WIKIPEDIA_POOL_SIZE,
+                 async_pool_size=WIKIPEDIA_ASYNC_POOL_SIZE,
+                 connect_timeout=WIKIPEDIA_CONNECT_TIMEOUT, read_timeout=WIKIPEDIA_READ_TIMEOUT,
+                 max_retries=WIKIPEDIA_MAX_RETRIES, backoff=WIKIPEDIA_BACKOFF,
+                 user_agent=WIKIPEDIA_USER_AGENT):
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.headers = {'User-Agent': user_agent, 'Accept-Encoding': 'gzip'}
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.async_pool_size = async_pool_size
+        self._async_http = None
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    # -- sync --------------------------------------------------------
+
+    def query(self, params, endpoint='query', timeout=None, max_retries=None):
+        """GET the API with retries; returns decoded JSON"""
+        timeout = timeout or self.timeout
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.get(self.endpoint, params=params, timeout=timeout)
+            except requests.RequestException as e:
+                self._record(endpoint, time.perf_counter() - start, 'error')
+                if attempt == max_retries:
+                    raise WikipediaError(f"{endpoint}: {e}") from e
+                time.sleep(self._retry_delay(endpoint, attempt))
+                continue
+
+            self._record(endpoint, time.perf_counter() - start, response.status_code)
+            if response.status_code in RETRY_STATUSES and attempt < max_retries:
+                delay = self._retry_delay(endpoint, attempt, response.headers.get('Retry-After'))
+                log.warning("Wikipedia %s returned %s, retrying in %.1fs",
+                            endpoint, response.status_code, delay)
+                time.sleep(delay)
+                continue
+            if response.status_code >= 400:
+                raise WikipediaError(f"{endpoint}: HTTP {response.status_code}")
+            return response.json()
+
+    # -- async (ASGI mode) -------------------------------------------
+
+    def _get_async_http(self):
+        if self._async_http is None:
+            self._async_http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(
+                    max_connections=self.async_pool_size,
+                    max_keepalive_connections=self.async_pool_size,
+                ),
+                headers=self.headers,
+            )
+        return self._async_http
+
+    async def aquery(self, params, endpoint='query'):
+        """Async query"""
+        http = self._get_async_http()
+        params = _encode_params(params)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = await http.get(self.endpoint, params=params)
+            except httpx.HTTPError as e:
+                self._record(endpoint, time.perf_counter() - start, 'error')
+                if attempt == self.max_retries:
+                    raise WikipediaError(f"{endpoint}: {e}") from e
+                await asyncio.sleep(self._retry_delay(endpoint, attempt))
+                continue
+
+            self._record(endpoint, time.perf_counter() - start, response.status_code)
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                await asyncio.sleep(self._retry_delay(endpoint, attempt, response.headers.get('Retry-After')))
+                continue
+            if response.status_code >= 400:
+                raise WikipediaError(f"{endpoint}: HTTP {response.status_code}")
+            return response.json()
+
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+    # -- helpers -----------------------------------------------------
+
+    def _delay(self, attempt, retry_after=None):
+        """Retry-After (seconds or HTTP date) if given, else jittered exponential backoff"""
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_RETRY_AFTER)
+            except ValueError:
+                try:
+                    wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(wait, 0.0), MAX_RETRY_AFTER)
+                except (TypeError, ValueError):
+                    pass
+        return self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+
+    def _retry_delay(self, endpoint, attempt, retry_after=None):
+        """_delay, unless waiting that long would outlast the request deadline"""
+        delay = self._delay(attempt, retry_after)
+        left = remaining()
+        if left is not None and delay >= left:
+            raise WikipediaError(f"{endpoint}: retry in {delay:.1f}s would pass the request deadline")
+        return delay
+
+    def _record(self, endpoint, seconds, status):
+        metrics.upstream('wikipedia', endpoint, 'query', seconds, status)
+        with self._stats_lock:
+            st = self._stats.setdefault(endpoint, {
+                'count': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'status': {},
+            })
+            st['count'] += 1
+            st['total_seconds'] += seconds
+            st['max_seconds'] = max(st['max_seconds'], seconds)
+            if status == 'error' or status >= 400:
+                st['errors'] += 1
+            st['status'][str(status)] = st['status'].get(str(status), 0) + 1
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    st['buckets'][i] += 1
+                    break
+            else:
+                st['buckets'][-1] += 1
+
+    def stats(self):
+        """Per-endpoint request counts, status codes and latency histogram"""
+        with self._stats_lock:
+            out = {}
+            for endpoint, st in self._stats.items():
+                out[endpoint] = dict(
+                    st,
+                    status=dict(st['status']),
+                    buckets=dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], st['buckets'])),
+                    avg_seconds=round(st['total_seconds'] / st['count'], 4) if st['count'] else 0.0,
+                )
+            return out
+
+
+wiki = WikipediaClient()
+
+
+def normalize_title(title):
+    """MediaWiki canonical form: spaces for underscores, single spaces, upper-case first letter"""
+    title = " ".join(title.replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+class ArticleCache:
+    """
+    Full-article cache keyed by normalized title.
+
+    Bounded in-process LRU with an optional SQLite tier shared by workers.
+    Within `fresh_for` seconds an entry is served as is; after that a cheap
+    prop=info query compares `lastrevid` and the body is only downloaded
+    again when the page has actually been edited.
+    """
+
+    def __init__(self, size=ARTICLE_CACHE_SIZE, fresh_for=ARTICLE_CACHE_FRESH,
+                 ttl=ARTICLE_CACHE_TTL, path=ARTICLE_CACHE_PATH):
+        self.fresh_for = fresh_for
+        self.memory = MemoryCache(maxsize=size, ttl=ttl)
+        self.disk = SQLiteCache(path=path, ttl=ttl, table="article_cache") if path else None
+        self.revalidated = 0
+        self.refetched = 0
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['checked'] < self.fresh_for
+
+    def put(self, key, article):
+        if not article.get('revision'):
+            return                       # missing/invalid page: nothing to revalidate against
+        self._store(key, {'article': article, 'revision': article['revision'], 'checked': time.time()})
+
+    def touch(self, key, entry):
+        """Revision unchanged upstream: restart the freshness window"""
+        self.revalidated += 1
+        self._store(key, dict(entry, checked=time.time()))
+
+    def _store(self, key, entry):
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry)
+
+    def stats(self):
+        return {
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats() if self.disk is not None else None,
+            'revalidated': self.revalidated,
+            'refetched': self.refetched,
+        }
+
+
+article_cache = ArticleCache()
 
 def get_subcategories(category):
     """
@@ -16,8 +272,7 @@ def get_subcategories(category):
         'cmlimit': 20
     }
     
-    response = requests.get(WIKIPEDIA_API_ENDPOINT, params=params)
-    data = response.json()
+    data = wiki.query(params, endpoint='subcategories')
     
     subcategories = []
     if 'query' in data and 'categorymembers' in data['query']:
@@ -27,17 +282,42 @@ def get_subcategories(category):
     
     return subcategories
 
-def get_category_articles(category, subcategory, images_only=False, continue_from=None):
-    """
-    Get articles from a specific category and subcategory
-    Optionally filter to only include articles with images
-    Support continuation for infinite scrolling
-    Results are ordered randomly for variety
-    """
+# A feed continue token is the gsroffset of the next hit. Prefixed with
+# BASE_QUERY, the feed stays on the plain search past offset 100 (the feed
+# index is built on it and hands over to the live search with such a token).
+BASE_QUERY = 'base:'
+
+def _on_base_query(continue_from):
+    return str(continue_from or '').startswith(BASE_QUERY)
+
+def _continue_token(offset, base):
+    """The token continuing at offset on the same query (None stays None)"""
+    if offset is None or not base:
+        return offset
+    return f"{BASE_QUERY}{offset}"
+
+def _offset(continue_from):
+    """gsroffset of a feed continue token (0 for none); ValueError if malformed"""
+    if continue_from is None or continue_from == '':
+        return 0
+    token = str(continue_from)
+    if _on_base_query(token):
+        token = token[len(BASE_QUERY):]
+    if not token.isdigit():
+        raise ValueError(f"invalid continue token {continue_from!r}")
+    return int(token)
+
+def _shuffled(articles):
+    """A first feed page in random order for variety; the search order stays fixed"""
+    random.shuffle(articles)
+    return articles
+
+def _category_params(category, subcategory, continue_from=None):
+    """Build the generator=search query for a category feed page"""
     search_term = f"{category} {subcategory}" if subcategory != "General" else category
+    offset = _offset(continue_from)
     
-    # Use both search and random order to get more interesting results
-    if continue_from and int(continue_from) > 100:
+    if offset > 100 and not _on_base_query(continue_from):
         # After a certain number of articles, expand the search to related topics
         # for a more engaging infinite scrolling experience
         search_term = f"{search_term} related"
@@ -55,39 +335,47 @@ def get_category_articles(category, subcategory, images_only=False, continue_fro
         'format': 'json',
         # Add random sort parameter for variety
         'gsrinfo': 'totalhits',
-        'gsrsort': 'random' if not continue_from else 'relevance'  # First page random, then relevance for continuity
+        # every page in one order, so a gsroffset token resumes exactly
+        'gsrsort': 'relevance'
     }
     
-    if continue_from:
-        params['gsroffset'] = continue_from
+    if offset:
+        params['gsroffset'] = offset
     
-    response = requests.get(WIKIPEDIA_API_ENDPOINT, params=params)
-    data = response.json()
+    return params
+
+def _ranked_pages(data):
+    """Generator pages in search-rank order (the API keys them by page id)"""
+    pages = data.get('query', {}).get('pages', {})
+    return sorted(pages.items(), key=lambda item: item[1].get('index', 0))
+
+def _page_to_card(page_id, page_data):
+    # Get image information
+    image_url = None
+    if 'original' in page_data:
+        image_url = page_data['original'].get('source')
+    elif 'thumbnail' in page_data:
+        image_url = page_data['thumbnail'].get('source')
     
+    return {
+        'id': page_id,
+        'title': page_data.get('title', 'Untitled'),
+        'extract': page_data.get('extract', 'No description available').split('.')[0] + '.',
+        'image': image_url,
+        'url': page_data.get('fullurl', '')
+    }
+
+def _parse_category_response(data, images_only=False):
+    """Turn a generator=search response into article cards + continuation token"""
     articles = []
     continue_token = None
     
-    if 'query' in data and 'pages' in data['query']:
-        for page_id, page_data in data['query']['pages'].items():
-            # Get image information
-            image_url = None
-            if 'original' in page_data:
-                image_url = page_data['original'].get('source')
-            elif 'thumbnail' in page_data:
-                image_url = page_data['thumbnail'].get('source')
-            
-            # If images_only is True, skip articles without images
-            if images_only and not image_url:
-                continue
-                
-            article = {
-                'id': page_id,
-                'title': page_data.get('title', 'Untitled'),
-                'extract': page_data.get('extract', 'No description available').split('.')[0] + '.',
-                'image': image_url,
-                'url': page_data.get('fullurl', '')
-            }
-            articles.append(article)
+    for page_id, page_data in _ranked_pages(data):
+        article = _page_to_card(page_id, page_data)
+        # If images_only is True, skip articles without images
+        if images_only and not article['image']:
+            continue
+        articles.append(article)
     
     # Get continuation token for infinite scrolling
     if 'continue' in data and 'gsroffset' in data['continue']:
@@ -95,33 +383,339 @@ def get_category_articles(category, subcategory, images_only=False, continue_fro
     
     return articles, continue_token
 
-def get_full_article(title):
+def _fill_page(windows, articles, page_size):
     """
-    Get the full content of a Wikipedia article by title
+    Append image-bearing cards from consecutive search windows, given as
+    [(offset, response)] in offset order, until the page is full.
+
+    Returns (token, finished). The token is the exact gsroffset of the
+    first hit not consumed, so a page that fills half-way through a window
+    resumes on the next hit rather than the next window.
     """
-    params = {
+    token = None
+    for offset, data in windows:
+        ranked = _ranked_pages(data)
+        for rank, (page_id, page_data) in enumerate(ranked, 1):
+            card = _page_to_card(page_id, page_data)
+            if card['image']:
+                articles.append(card)
+            if len(articles) >= page_size:
+                more = rank < len(ranked) or 'continue' in data
+                return (offset + rank if more else None), True
+        token = data.get('continue', {}).get('gsroffset')
+        if token is None:
+            return None, True
+    return token, False
+
+def _fill_offsets(token):
+    return [int(token) + i * FILL_WINDOW for i in range(FILL_PARALLELISM)]
+
+def get_category_articles(category, subcategory, images_only=False, continue_from=None):
+    """
+    Get articles from a specific category and subcategory
+    Optionally filter to only include articles with images
+    Support continuation for infinite scrolling
+    The first page is shuffled for variety; a malformed continue token
+    raises ValueError
+
+    With images_only the server keeps pulling further search windows,
+    FILL_PARALLELISM at a time, until it has a full page of articles with
+    images or FILL_DEADLINE runs out.
+    """
+    offset = _offset(continue_from)
+    base = _on_base_query(continue_from)
+    params = _category_params(category, subcategory, continue_from)
+    data = wiki.query(params, endpoint='category_articles')
+    if not images_only:
+        articles, token = _parse_category_response(data)
+        return (_shuffled(articles) if not offset else articles), _continue_token(token, base)
+
+    deadline = time.monotonic() + FILL_DEADLINE
+    articles = []
+    token, finished = _fill_page([(offset, data)], articles, FILL_PAGE_SIZE)
+    while not finished and time.monotonic() < deadline:
+        offsets = _fill_offsets(token)
+        futures = [
+            _fill_pool.submit(
+                wiki.query, _category_params(category, subcategory, _continue_token(offset, base)),
+                'category_articles'
+            )
+            for offset in offsets
+        ]
+        windows = []
+        for offset, future in zip(offsets, futures):
+            try:
+                windows.append((offset, future.result(timeout=max(deadline - time.monotonic(), 0.01))))
+            except Exception as e:       # noqa: BLE001
+                log.warning("Fill window at %s failed: %s", offset, e)
+                break                    # keep windows contiguous so the token stays exact
+        if not windows:
+            break
+        token, finished = _fill_page(windows, articles, FILL_PAGE_SIZE)
+    return (_shuffled(articles) if not offset else articles), _continue_token(token, base)
+
+def _article_params(title):
+    """Build the full-extract query for one title"""
+    return {
         'action': 'query',
         'titles': title,
         'prop': 'extracts|pageimages|info',
-        'exsectionformat': 'wiki',
-        'explaintext': False,
+        # no explaintext: any value of it (even "False") asks for plain text
         'piprop': 'original',
         'inprop': 'url',
         'format': 'json'
     }
-    
-    response = requests.get(WIKIPEDIA_API_ENDPOINT, params=params)
-    data = response.json()
-    
+
+def _page_to_article(page_id, page_data):
+    content = page_data.get('extract', 'No content available')
+    return {
+        'id': page_id,
+        'title': page_data.get('title', 'Untitled'),
+        'content': content,
+        'sections': index_sections(content),
+        'image': page_data.get('original', {}).get('source') if 'original' in page_data else None,
+        'url': page_data.get('fullurl', ''),
+        'revision': page_data.get('lastrevid'),
+        'touched': page_data.get('touched')
+    }
+
+def _parse_article_response(data):
+    """Pick the single page out of a full-extract response"""
     if 'query' in data and 'pages' in data['query']:
         for page_id, page_data in data['query']['pages'].items():
-            article = {
-                'id': page_id,
-                'title': page_data.get('title', 'Untitled'),
-                'content': page_data.get('extract', 'No content available'),
-                'image': page_data.get('original', {}).get('source') if 'original' in page_data else None,
-                'url': page_data.get('fullurl', '')
-            }
-            return article
+            return _page_to_article(page_id, page_data)
     
     raise Exception("Article not found")
+
+def _revision_params(title):
+    """Cheap query returning only page info (lastrevid, touched)"""
+    return {
+        'action': 'query',
+        'titles': title,
+        'prop': 'info',
+        'format': 'json'
+    }
+
+def _parse_revision(data):
+    for page_data in data.get('query', {}).get('pages', {}).values():
+        return page_data.get('lastrevid')
+    return None
+
+def get_full_article(title):
+    """
+    Get the full content of a Wikipedia article by title
+    Served from the article cache when the revision is unchanged
+    """
+    key = normalize_title(title)
+    entry = article_cache.get(key)
+    if entry is not None:
+        if article_cache.is_fresh(entry):
+            return dict(entry['article'])
+        try:
+            revision = _parse_revision(wiki.query(_revision_params(title), endpoint='revision'))
+        except WikipediaError as e:
+            log.warning("Revalidation of %r failed, serving cached copy: %s", key, e)
+            return dict(entry['article'])
+        if revision == entry['revision']:
+            article_cache.touch(key, entry)
+            return dict(entry['article'])
+        article_cache.refetched += 1
+
+    article = _parse_article_response(wiki.query(_article_params(title), endpoint='article'))
+    article_cache.put(key, article)
+    return article
+
+def opensearch(query, limit=10, timeout=None):
+    """
+    Title suggestions for a prefix from action=opensearch, as
+    [{title, description, url}] in Wikipedia's ranking. No retries: a
+    suggestion that arrives late is useless.
+    """
+    data = wiki.query({
+        'action': 'opensearch',
+        'search': query,
+        'limit': limit,
+        'namespace': 0,
+        'format': 'json'
+    }, endpoint='opensearch', timeout=timeout, max_retries=0)
+    # [query, [titles], [descriptions], [urls]]
+    titles = data[1] if len(data) > 1 else []
+    descriptions = data[2] if len(data) > 2 else []
+    urls = data[3] if len(data) > 3 else []
+    return [
+        {
+            'title': title,
+            'description': descriptions[i] if i < len(descriptions) else '',
+            'url': urls[i] if i < len(urls) else ''
+        }
+        for i, title in enumerate(titles)
+    ]
+
+# ------------------------------------------------------------------
+# Batched fetch: up to 50 titles per action=query
+# ------------------------------------------------------------------
+
+MAX_TITLES_PER_QUERY = 50
+MAX_CONTINUATIONS = 100
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _time_for_query():
+    """Whether the request deadline leaves room for one more (slow) query"""
+    try:
+        left = remaining()
+    except DeadlineExceeded:
+        return False
+    return left is None or left > WIKIPEDIA_READ_TIMEOUT
+
+def _fetch_article_chunk(titles, first=False):
+    """
+    One action=query for up to 50 titles. TextExtracts returns full
+    extracts one page per response, so follow `continue` until every page
+    has its extract, or until the request deadline leaves no room for
+    another query (the first query of a batch, `first`, is always sent).
+    Returns (pages by id, title -> resolved title map, complete).
+    """
+    params = dict(_article_params('|'.join(titles)), redirects=1)
+    pages = {}
+    resolved = {}
+    for i in range(MAX_CONTINUATIONS):
+        if not (first and i == 0) and not _time_for_query():
+            return pages, resolved, False
+        data = wiki.query(params, endpoint='articles_batch')
+        query = data.get('query', {})
+        for mapping in query.get('normalized', []) + query.get('redirects', []):
+            resolved[mapping['from']] = mapping['to']
+        for page_id, page_data in query.get('pages', {}).items():
+            pages.setdefault(page_id, {}).update(page_data)
+        if 'continue' not in data:
+            break
+        params = dict(params, **data['continue'])
+    else:
+        log.warning("Gave up following continuation for %d titles", len(titles))
+    return pages, resolved, True
+
+def get_articles(titles):
+    """
+    Fetch many articles with as few round trips as possible.
+    Returns ({input title: article or None}, titles not fetched yet): the
+    batch stops before the request deadline, keyed exactly as passed in,
+    and the client sends the leftover titles again.
+    """
+    result = {}
+    missing = []
+    for title in dict.fromkeys(titles):
+        entry = article_cache.get(normalize_title(title))
+        if entry is not None and article_cache.is_fresh(entry):
+            result[title] = dict(entry['article'])
+        else:
+            missing.append(title)
+
+    pending = []
+    for n, chunk in enumerate(_chunks(missing, MAX_TITLES_PER_QUERY)):
+        if pending:
+            pending.extend(chunk)
+            continue
+        pages, resolved, complete = _fetch_article_chunk(chunk, first=n == 0)
+        by_title = {
+            page_data.get('title'): (page_id, page_data)
+            for page_id, page_data in pages.items()
+            if 'missing' not in page_data and 'invalid' not in page_data
+        }
+        for title in chunk:
+            final = title
+            # normalized -> redirect target; bounded in case of redirect loops
+            for _ in range(3):
+                if final not in resolved:
+                    break
+                final = resolved[final]
+            found = by_title.get(final)
+            if found is None and not complete:
+                pending.append(title)
+                continue
+            if found is None:
+                result[title] = None
+                continue
+            if not complete and 'extract' not in found[1]:
+                pending.append(title)    # its extract was still to come
+                continue
+            article = _page_to_article(*found)
+            article_cache.put(normalize_title(title), article)
+            result[title] = article
+
+    return result, pending
+
+# ------------------------------------------------------------------
+# Async variants for the ASGI entry point (asgi.py), on the client's
+# shared httpx.AsyncClient pool
+# ------------------------------------------------------------------
+
+async def close_async_http():
+    """Release the shared async pool (ASGI lifespan shutdown)"""
+    await wiki.aclose()
+
+def _encode_params(params):
+    # send booleans exactly as requests does so both paths issue identical queries
+    return {k: str(v) if isinstance(v, bool) else v for k, v in params.items()}
+
+async def get_category_articles_async(category, subcategory, images_only=False, continue_from=None):
+    """Async get_category_articles (same page filling)"""
+    start = _offset(continue_from)
+    base = _on_base_query(continue_from)
+    data = await wiki.aquery(
+        _category_params(category, subcategory, continue_from), endpoint='category_articles'
+    )
+    if not images_only:
+        articles, token = _parse_category_response(data)
+        return (_shuffled(articles) if not start else articles), _continue_token(token, base)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + FILL_DEADLINE
+    articles = []
+    token, finished = _fill_page([(start, data)], articles, FILL_PAGE_SIZE)
+    while not finished and loop.time() < deadline:
+        offsets = _fill_offsets(token)
+        try:
+            responses = await asyncio.wait_for(
+                asyncio.gather(*(
+                    wiki.aquery(_category_params(category, subcategory, _continue_token(offset, base)),
+                                endpoint='category_articles')
+                    for offset in offsets
+                ), return_exceptions=True),
+                timeout=max(deadline - loop.time(), 0.01),
+            )
+        except asyncio.TimeoutError:
+            break
+        windows = []
+        for offset, response in zip(offsets, responses):
+            if isinstance(response, Exception):
+                log.warning("Fill window at %s failed: %s", offset, response)
+                break
+            windows.append((offset, response))
+        if not windows:
+            break
+        token, finished = _fill_page(windows, articles, FILL_PAGE_SIZE)
+    return (_shuffled(articles) if not start else articles), _continue_token(token, base)
+
+async def get_full_article_async(title):
+    """Async get_full_article (shares the article cache)"""
+    key = normalize_title(title)
+    entry = article_cache.get(key)
+    if entry is not None:
+        if article_cache.is_fresh(entry):
+            return dict(entry['article'])
+        try:
+            revision = _parse_revision(await wiki.aquery(_revision_params(title), endpoint='revision'))
+        except WikipediaError as e:
+            log.warning("Revalidation of %r failed, serving cached copy: %s", key, e)
+            return dict(entry['article'])
+        if revision == entry['revision']:
+            article_cache.touch(key, entry)
+            return dict(entry['article'])
+        article_cache.refetched += 1
+
+    article = _parse_article_response(await wiki.aquery(_article_params(title), endpoint='article'))
+    article_cache.put(key, article)
+    return article